@@ -9,13 +9,13 @@ Instrumental pecks advance the trial.
 60 trials per session.
 """
 
-from csv import writer, QUOTE_MINIMAL
 from datetime import datetime, date
 from sys import setrecursionlimit, path as sys_path
 from tkinter import Toplevel, Canvas, Tk, Label, Button, StringVar, OptionMenu, IntVar, Radiobutton
 from time import sleep
 from os import path as os_path
 import os, random
+from p035.session_writer import SessionWriter
 
 # --- Box or test version ---
 if os_path.expanduser('~').split("/")[2] == "blaisdelllab":
@@ -170,6 +170,12 @@ class MainScreen(object):
         self.session_data_frame = [["SessionTime", "Subject", "Trial_Num", "Event",
                             "Xcord", "Ycord", "TrialSubStage",
                             "PeckCount", "VR_Requirement", "Date"]]
+        # The rows are appended to the .csv by a background thread (flushed
+        # at least every second or 50 rows, and made durable at the end of
+        # each trial), rather than the whole file being rewritten each peck
+        self.session_writer = SessionWriter(self.session_data_frame,
+                                            max_latency=1.0, max_rows=50,
+                                            durable=True)
         self.place_birds_in_box()
 
     def VR_schedule(self, mean=5):
@@ -185,10 +191,12 @@ class MainScreen(object):
     def first_ITI(self, event):
         print("Session started")
         self.write_data(None, "SessionStarts")   
+        self.write_comp_data(False) # Creates the data file
         self.root.after(1000, self.ITI)
 
     def ITI(self):
         self.mastercanvas.delete("all")
+        self.write_comp_data(False) # End of the last trial: its data go to the disk
         if self.trial_counter >= self.max_trials:
             self.exit_program()
             return
@@ -405,8 +413,8 @@ class MainScreen(object):
         # --- Terminal printout ---
         print(f"{outcome:>30} | x: {x:^3} y: {y:^3} | {stage:^5} | {str(datetime.now() - self.start_time)}")
 
-        # --- Save to CSV ---
-        self.session_data_frame.append([
+        # --- Save to CSV (in the background; see write_comp_data) ---
+        self.session_writer.write_row([
             str(datetime.now() - self.start_time),  # SessionTime
             self.subject_ID,                        # Subject
             self.trial_counter,                     # Trial_Num
@@ -418,9 +426,6 @@ class MainScreen(object):
             self.requirement,                       # VR_Requirement
             self.date                               # Date
         ])
-
-        # Save continuously
-        self.write_comp_data(False)
     
     def write_comp_data(self, SessionEnded):
         if SessionEnded:
@@ -428,10 +433,12 @@ class MainScreen(object):
 
         if self.record_data:
             myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_autoshaping.csv"
-            with open(myFile_loc, 'w', newline='') as myFile:
-                w = writer(myFile, quoting=QUOTE_MINIMAL)
-                w.writerows(self.session_data_frame)
+            # The first call starts the writer thread, which appends new
+            # rows to the .csv as they come in; afterwards this just has it
+            # push them to the disk
+            self.session_writer.flush(myFile_loc)
             if SessionEnded:
+                self.session_writer.close() # Wait for the file to be fully written
                 print(f"\n- Data file written to {myFile_loc}")
 
 
@@ -41,97 +41,24 @@ in spatial data (e.g., x & y coordinates) after this time.
 # or sublibraries (setrecursionlimit) that are downloaded to every computer
 # along with python, or other files within this folder (like control_panel or 
 # maestro).
-from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
-    StringVar, OptionMenu, IntVar, Radiobutton, Entry, Checkbutton, Variable
+from tkinter import Toplevel, Tk, Label, Button, StringVar, OptionMenu, \
+     IntVar, Radiobutton, Entry, Checkbutton, Variable
 from datetime import datetime, timedelta, date
-from time import time, sleep
-from csv import writer, DictReader, DictWriter, QUOTE_MINIMAL
-from os import getcwd, popen, mkdir, listdir, path as os_path
+from os import getcwd, mkdir, listdir, path as os_path
 from random import choice, randint, shuffle
-from PIL import ImageTk, Image  
-from sys import setrecursionlimit, path as sys_path
+from p035.engine import operant_box_version, TaskScreen, run_program, \
+     hopper_up, hopper_down, house_light_on
+from p035.stimulus_manifest import load_manifest
+from p035.console import console
+from p035.schedule import NoRepeatPool, StimulusIndex
+from p035.fm_foils import FMFoilRegistry, append_fm_log_entry
+from p035.session_database import database_enabled, add_to_database, ingest_fm_log
+from p035.stimulus_prefetch import StimulusPrefetcher
 
-# The first variable declared is whether the program is the operant box version
-# for pigeons, or the test version for humans to view. The variable below is 
-# a T/F boolean that will be referenced many times throughout the program 
-# when the two options differ (for example, when the Hopper is accessed or
-# for onscreen text, etc.). It is changed automatically based on whether
-# the program is running in operant boxes (True) or not (False). It is
-# automatically set to True if the user is "blaisdelllab" (e.g., running
-# on a rapberry pi) or False if not. The output of os_path.expanduser('~')
-# should be "/home/blaisdelllab" on the RPis
-
-if os_path.expanduser('~').split("/")[2] =="blaisdelllab":
-    operant_box_version = True
-    print("*** Running operant box version *** \n")
-else:
-    operant_box_version = False
-    print("*** Running test version (no hardware) *** \n")
-
-# Import hopper/other specific libraries from files on operant box computers
-try:
-    if operant_box_version:
-        # Import additional libraries...
-        import pigpio # import pi, OUTPUT
-        import csv
-        #...including art scripts
-        sys_path.insert(0, str(os_path.expanduser('~')+"/Desktop/Experiments/P033/"))
-        import graph
-        import polygon_fill
-        
-        # Setup GPIO numbers (NOT PINS; gpio only compatible with GPIO num)
-        servo_GPIO_num = 2
-        hopper_light_GPIO_num = 13
-        house_light_GPIO_num = 21
-        
-        # Setup use of pi()
-        rpi_board = pigpio.pi()
-        
-        # Then set each pin to output 
-        rpi_board.set_mode(servo_GPIO_num,
-                           pigpio.OUTPUT) # Servo motor...
-        rpi_board.set_mode(hopper_light_GPIO_num,
-                           pigpio.OUTPUT) # Hopper light LED...
-        rpi_board.set_mode(house_light_GPIO_num,
-                           pigpio.OUTPUT) # House light LED...
-        
-        # Setup the servo motor 
-        rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                    50) # Default frequency is 50 MhZ
-        
-        # Next grab the up/down 
-        hopper_vals_csv_path = str(os_path.expanduser('~')+"/Desktop/Box_Info/Hopper_vals.csv")
-        
-        # Store the proper UP/DOWN values for the hopper from csv file
-        up_down_table = list(csv.reader(open(hopper_vals_csv_path)))
-        hopper_up_val = up_down_table[1][0]
-        hopper_down_val = up_down_table[1][1]
-        
-        # Lastly, run the shell script that maps the touchscreen to operant box monitor
-        popen("sh /home/blaisdelllab/Desktop/Hardware_Code/map_touchscreen.sh")
-                             
-        
-except ModuleNotFoundError:
-    input("ERROR: Cannot find hopper hardware! Check desktop.")
-
-# Below  is just a safety measure to prevent too many recursive loops). It
-# doesn't need to be changed.
-setrecursionlimit(5000)
-
-"""
-The code below jumpstarts the loop by first building the hopper object and 
-making sure everything is turned off, then passes that object to the
-control_panel. The program is largely recursive and self-contained within each
-object, and a macro-level overview is:
-    
-    ControlPanel -----------> MainScreen ------------> PaintProgram
-         |                        |                         |
-    Collects main           Runs the actual         Gets passed subject
-    variables, passes      experiment, saves        name, but operates
-    to Mainscreen          data when exited          independently
-    
-
-"""
+# Whether this is running in an operant box (operant_box_version), the box's
+# hardware, and everything else that the P035 programs have in common are in
+# the shared engine (p035/engine.py). FOAM has its own control panel (below),
+# since it is set up with more than a subject and a phase.
 
 # The first of two objects we declare is the ExperimentalControlPanel (CP). It
 # exists "behind the scenes" throughout the entire session, and if it is exited,
@@ -439,10 +366,23 @@ class ForcedChoiceOptionWindow (object):
 
 
 # Next, setup the MainScreen object
-class MainScreen(object):
+class MainScreen(TaskScreen):
     # We need to declare several functions that are 
     # called within the initial __init__() function that is 
     # run when the object is first built:
+    # What sets this task apart (everything else is in p035.engine.TaskScreen)
+    task_code = "P035"
+    # The keys that show a stimulus on each trial
+    stimulus_keys = ["sample_key", "left_comparison_key", "right_comparison_key"]
+    # The later phases use hundreds of different stimuli per session, so
+    # only the next few trials' stimuli are loaded ahead of time, and at
+    # most this many images are kept at once (see p035.stimulus_prefetch)
+    look_ahead_trials = 10
+    max_stimulus_images = 60
+    # Each event's console line also shows the trial type
+    event_format = "{:>25} | x: {: ^3} y: {:^3} | {:^5} | {} | {}"
+    # What build_session_stimuli() sets (see schedule_phase())
+    schedule_attributes = ["stimulus_order_dict", "FM_log_update"]
     
     def __init__(self, subject_ID, record_data, data_folder_directory,
                  training_phase, training_phase_name_list, training_subphase,
@@ -470,7 +410,7 @@ class MainScreen(object):
             try:
                 self.manual_FR = int(manual_FR) # Number of times the oberving key should be pressed for the target to appear 
             except ValueError:
-                print("\nERROR: Incorrect Manual FR Input")
+                console.warning("\nERROR: Incorrect Manual FR Input")
         else:
             self.manual_FR = manual_FR
         # Including forced choice variables
@@ -479,38 +419,25 @@ class MainScreen(object):
         self.all_new_simuli_var = all_new_simuli_var
         self.new_old_var = new_old_var
         
-        ## Set up the visual Canvas
-        self.root = Toplevel()
-        self.root.title("P035: FOAM - " + self.training_phase_name_list[self.training_phase][3:]) # this is the title of the windows
-        self.mainscreen_height = 768 # height of the experimental canvas screen
-        self.mainscreen_width = 1024 # width of the experimental canvas screen
-        self.root.bind("<Escape>", self.exit_program) # bind exit program to the "esc" key
-        
-        # If the version is the one running in the boxes...
-        if operant_box_version: 
-            # Keybind relevant keys
-            self.cursor_visible = True # Cursor starts on...
-            self.change_cursor_state() # turn off cursor UNCOMMENT
-            self.root.bind("<c>",
-                           lambda event: self.change_cursor_state()) # bind cursor on/off state to "c" key
-            # Then fullscreen (on a 768x1024p screen). Note that this assumes 
-            # both monitors have identical sizes & the operant box is to the
-            # "left" of the control panel.
-            self.root.geometry(f"{self.mainscreen_width}x{self.mainscreen_height}+1920+0")
-            self.root.attributes('-fullscreen',
-                                 True)
-            self.mastercanvas = Canvas(self.root,
-                                   bg="black")
-            self.mastercanvas.pack(fill = BOTH,
-                                   expand = True)
-        # If we want to run a "human-friendly" version
-        else: 
-            # No keybinds and  800x600p fixed window
-            self.mastercanvas = Canvas(self.root,
-                                   bg="black",
-                                   height=self.mainscreen_height,
-                                   width = self.mainscreen_width)
-            self.mastercanvas.pack()
+        ## Set up the visual Canvas (and the session clock and scheduler)
+        self.build_screen("P035: FOAM - " + self.training_phase_name_list[self.training_phase][3:])
+
+        # The three keys are built once here and then reused (shown,
+        # hidden, or given new images) for every trial. Each key's center is
+        # given below; they are ~192 p in diameter.
+        self.key_center_dict = {"sample_key": (512, 448), # [416, 352, 608, 544]
+                                "left_comparison_key": (224, 544), # [128, 448, 320, 640]
+                                "right_comparison_key": (800, 544) # [704, 448, 896, 640]
+                                }
+        for key_string in self.key_center_dict:
+            self.scene.add_key(key_string,
+                               radius = 96,
+                               fill = "",
+                               outline = "",
+                               image_above_oval = False,
+                               callback = lambda event,
+                               key_string = key_string: self.key_press(event,
+                                                                       key_string))
         
         # Timing variables
         self.auto_reinforcer_timer = 10 * 1000 # Time (ms) before reinforcement for AS
@@ -541,14 +468,13 @@ class MainScreen(object):
         self.probe_trials_per_session = 4
         
         # Here are variables for data structuring 
-        self.session_data_frame = [] #This where trial-by-trial data is stored
         header_list = ["SessionTime", "Xcord","Ycord", "Event",
                        "SampleStimulus", "LComp", "RComp", "CorrectKey", "PairNum",
                        "TrialSubStage", "TrialTime", "TrialNum", "ReinTrialNum",
                        "SampleFR", "FI", "TrialType", "Subject", "TrainingPhase",
                        "TrainingSubPhase", "ForcedChoiceSession", "AllNewStimuli",
                        "NewOldStimuliSession", "Date"] # Column headers
-        self.session_data_frame.append(header_list) # First row of matrix is the column headers
+        self.start_data(header_list) # First row of the data is the column headers
         self.date = date.today().strftime("%y-%m-%d") # Today's date
 
         ## Finally, start the recursive loop that runs the program:
@@ -559,27 +485,24 @@ class MainScreen(object):
         # box and the space bar is pressed. It then proceedes to the ITI. It only
         # runs in the operant box version. After the space bar is pressed, the
         # "first_ITI" function is called for the only time prior to the first trial
-        
-        def first_ITI(event):
-            # Is initial delay before first trial starts. It first deletes all the
-            # objects off the mnainscreen (making it blank), unbinds the spacebar to 
-            # the first_ITI link, followed by a 30s pause before the first trial to 
-            # let birds settle in and acclimate.
-            print("Spacebar pressed -- SESSION STARTED") 
-            self.mastercanvas.delete("all")
-            self.root.unbind("<space>")
-            self.start_time = datetime.now() # Set start time
-            self.current_key_stimulus_dict = {"left_comparison_key": "black",
-                                           "right_comparison_key": "black",
-                                           "sample_key": "black"}
-            
+
+        # The folder with all the stimuli
+        stimuli_folder_path = "stimuli/"
+
+        def build_session_stimuli():
+            # This builds the order of stimuli for every trial in the session.
+            # It is run as soon as the session is set up in the control panel
+            # (i.e., before the bird is placed in the box), so that the images
+            # can be loaded in the background while the bird is placed in the
+            # box and during the first ITI.
+
             # Set up the stimulus dictionary first and foremost. This will
-            # be a long process, starting by setting the directory to the 
-            # folder with all the stimuli
-            stimuli_folder_path = "stimuli/"
+            # be a long process.
             
-            # This is a list of each picture file's directory
-            stimuli_files_list = listdir(stimuli_folder_path)
+            # The folder's manifest has every file in it and each image's
+            # type, pair number, and phase (parsed from its name once, when
+            # the folder last changed; see p035.stimulus_manifest)
+            stimuli_manifest = load_manifest(stimuli_folder_path)
 
             # Next, let's set up a list of any probe trial stimuli that will be needed!
             probe_stim_list = []
@@ -587,14 +510,8 @@ class MainScreen(object):
             # Our first for list will pick out all the probe trial stimuli for
             # any training subphases (e.g., CBE and FM)
             if self.training_subphase > 0:
-                for i in stimuli_files_list:
-                    # First, make sure file is an image (.bmp file)
-                    if i.split(".")[1] == "bmp":
-                        # Next, add the file to the list if it is within the
-                        # following phase (may be removed later)
-                         img_phase_integer = int(i.split(".")[0][-1])
-                         if (self.training_phase + 1 == img_phase_integer):
-                             probe_stim_list.append(i)
+                # Every image within the following phase (may be removed later)
+                probe_stim_list = stimuli_manifest.names(phase = self.training_phase + 1)
                         
             # Once we have all the potential stimuli for probe trials picked out,
             # we need to only pick either the first set of three pairs (S1, C1, 
@@ -603,7 +520,7 @@ class MainScreen(object):
             # by sorting the list by the stimulus number.
             # Ex. From 'S10_Phase3.bmp' we extract '10'
             probe_stim_list = (sorted(probe_stim_list,
-                                      key = lambda x: int(x.split("_")[0][1:])))
+                                      key = lambda x: stimuli_manifest[x]["pair_num"]))
             if self.training_subphase in [1,2]:
                 probe_stim_list = probe_stim_list[:2]
             elif self.training_subphase in [3,4]:
@@ -615,157 +532,105 @@ class MainScreen(object):
             # need to select the fast-mapping FOIL stimulus for the FM phases 
             # 2, 4, and 6. These stimuli will be unique to each FM session and
             # never reused across FM phases. Therefore, we need a .csv doc to 
-            # track which stimuli have been used before.
+            # track which stimuli have been used before (see p035.fm_foils).
             FM_probe_FOIL_stimulus = "NA"
+            self.FM_log_update = None # (log directory, new log entry) for FM sessions
             if self.training_subphase in [2,4,6]:
-                # Set up the directory for the csv.
-                FM_stimuli_log_directory = "FM_stimuli_logs/"
-                # Finalize the directory:
-                FM_stimuli_log_directory += f"{self.subject_ID}_P035_Used_FM_Stimuli_Log.csv"
-                
-                # Next, check if the csv file already exists (e.g., the subject
-                # has been run under a FM test before). We do this by setting 
-                # up a list of previous entries and then seeing if the file 
-                # exists. If it does, we add entries to it (e.g., rows of the
-                # .csv file). If it doesn't exist, it remains empty.
-                FM_log_list = []
-                if os_path.isfile(FM_stimuli_log_directory):
-                    # Read the content of the csv as a dictionary
-                    with open(FM_stimuli_log_directory, 'r', encoding='utf-8-sig') as data:
-                        for line in DictReader(data):
-                            FM_log_list.append(line)
-                # If the log doesn't exist, we can assume the subject has never 
-                # run a FM session before this point (so we'll need to write
-                # a new .csv file later)
+                # The subject's log of FOILs used so far (empty if the subject
+                # has never run a FM session before this point)
+                FM_foil_registry = FMFoilRegistry(self.subject_ID)
                     
-                # Once we find this info, we can choose our FOIL for our FM
-                # probe trials via a few "if" statements.
-                while FM_probe_FOIL_stimulus == "NA":
-                    possible_FM_probe_FOIL_stimulus = choice(stimuli_files_list)
-                    # First, make sure file is an image (.bmp file)
-                    if possible_FM_probe_FOIL_stimulus.split(".")[1] == "bmp":
-                        # Next, make sure the possible choice has not been
-                        # used before:
-                        stimulus_used = False
-                        # If we have run FM tests before, we have to check our
-                        # list of dictionaries that was generated...
-                        if len(FM_log_list) != 0:
-                            for FM_dict in FM_log_list:
-                                if FM_dict["Used_FM"] == possible_FM_probe_FOIL_stimulus:
-                                    stimulus_used = True
-                                    break
-                        if not stimulus_used:
-                            # Lastly, determine the phase the possible FOIL stimulus
-                            # to make sure it has never been seen in prior training
-                            # (or in test subphases). NOTE THIS ASSUMES THAT WE 
-                            # HAVE NOT YET REACHED PHASE 8)
-                            img_phase_integer = int(possible_FM_probe_FOIL_stimulus.split(".")[0][-1])
-                            if (img_phase_integer > self.training_phase + 1):
-                                # If all of the requests are met, we have
-                                # found our FM probe FOIL!
-                                FM_probe_FOIL_stimulus = possible_FM_probe_FOIL_stimulus
-                                break
+                # The FOIL is chosen from the images that have never been used
+                # before, and that have never been seen in prior training (or
+                # in test subphases), i.e., those of later phases. (NOTE THIS
+                # ASSUMES THAT WE HAVE NOT YET REACHED PHASE 8)
+                FM_probe_FOIL_stimulus = FM_foil_registry.choose(stimuli_manifest,
+                                                                 self.training_phase + 2)
                 
                 # Finally, we should update our csv document with this new probe
                 # if we're going to use it for this session (so its not used
-                # again). First up, we need to append this entry to the dictionary
-                FM_log_list.append({
-                    "Subject" : self.subject_ID,
-                    "Used_FM" : FM_probe_FOIL_stimulus,
-                    "Date_Used" : self.date,
-                    "FM_phase" : f"{self.training_phase_name_list[self.training_phase].split(':')[0]}.{self.training_subphase_name_list[self.training_subphase].split(':')[0]}"
-                    })
-                
-                # Then write the updated list to a csv file
-                with open(FM_stimuli_log_directory, 'w') as csvfile:
-                    writer = DictWriter(csvfile,
-                                        fieldnames = ['Subject', 'Used_FM',
-                                                      'Date_Used', 'FM_phase'])
-                    writer.writeheader()
-                    writer.writerows(FM_log_list)
+                # again). The new entry is appended to the csv file once the
+                # session actually starts (see first_ITI below), so that the
+                # FOIL isn't used up if the session is closed before the
+                # spacebar is pressed
+                FM_log_entry = FM_foil_registry.new_entry(FM_probe_FOIL_stimulus, self.date,
+                                                          f"{self.training_phase_name_list[self.training_phase].split(':')[0]}.{self.training_subphase_name_list[self.training_subphase].split(':')[0]}")
+                self.FM_log_update = (FM_foil_registry.log_path, FM_log_entry)
+
 
-                
             
             # Next, we can build the primary dictionary that will hold all the
             # photo file information, their connections to  other stimuli, and
             # the actual loaded image itself,
             self.stimuli_dict = {} 
             
-            for i in stimuli_files_list:
+            for i in stimuli_manifest.names():
                 # Image should be "NA" until categorized (if applicable)
                 pair_type = "NA"
-                # First, make sure file is an image (.bmp file)
-                if i.split(".")[1] == "bmp":
-                    # First we can determine whether its a sample or comparison
-                    # stimulus for future reference 
-                    if i[0] == "C":
-                        pair = "S"
-                    elif i[0] == "S":
-                        pair = "C"
-                    
-                    # Then, check if we need it for this specific training phase.
-                    # Autoshaping (or training phase 0)  is special in that it
-                    # copies the stimuli used in the first phase. If we are
-                    # running the new/old program, then we only select 
-                    img_phase_integer = int(i.split(".")[0][-1])
-                    if self.all_new_simuli_var:
-                        # In "all new stimuli sessions," the image's phase
-                        # number must be EQUAL the current phase if it is a 
-                        # comparison stimulus OR if the FOIL sample is less
-                        # than or equal to the phase num.
-                        if (img_phase_integer == self.training_phase) or (img_phase_integer < self.training_phase and i[0] == "C"):
-                            # If so, categorize it as a training type stimulus (for
-                            # appending ot the dictionary later)
-                            pair_type = "training"
-                    
-                    # For the "new/old" sessions, we take all the comparisons
-                    # like normal, but will only select specific samples. If 
-                    # new, we only grab the samples from the current phase (e.g.,
-                    # img_phase_integer == self.training_phase). If old, we only
-                    # grab samples that are from previous phases.
-                    elif self.new_old_var in ["New", "Old"]:
-                        # If a comparison and from this phase or a previous
-                        # one, then buisness as usual
-                        if pair == "S" and (img_phase_integer <= self.training_phase): 
-                            pair_type = "training"
-                        # If a sample, there's more nuance to accept it...
-                        else:
-                            if self.new_old_var == "New" and img_phase_integer == self.training_phase:
-                                pair_type = "training"
-                            elif self.new_old_var == "Old" and img_phase_integer < self.training_phase:
-                                pair_type = "training"
-                        
-                    elif (img_phase_integer <= self.training_phase) or (self.training_phase == 0 and img_phase_integer == 1):
+                stimulus_entry = stimuli_manifest[i]
+                # First we can determine whether its a sample or comparison
+                # stimulus for future reference 
+                if i[0] == "C":
+                    pair = "S"
+                elif i[0] == "S":
+                    pair = "C"
+                
+                # Then, check if we need it for this specific training phase.
+                # Autoshaping (or training phase 0)  is special in that it
+                # copies the stimuli used in the first phase. If we are
+                # running the new/old program, then we only select 
+                img_phase_integer = stimulus_entry["phase"]
+                if self.all_new_simuli_var:
+                    # In "all new stimuli sessions," the image's phase
+                    # number must be EQUAL the current phase if it is a 
+                    # comparison stimulus OR if the FOIL sample is less
+                    # than or equal to the phase num.
+                    if (img_phase_integer == self.training_phase) or (img_phase_integer < self.training_phase and i[0] == "C"):
                         # If so, categorize it as a training type stimulus (for
                         # appending ot the dictionary later)
                         pair_type = "training"
-                        
-                    # For non-training probe trials...
-                    elif i in probe_stim_list:
-                        pair_type = self.training_subphase_name_list[self.training_subphase].split(" ")[1]
+                
+                # For the "new/old" sessions, we take all the comparisons
+                # like normal, but will only select specific samples. If 
+                # new, we only grab the samples from the current phase (e.g.,
+                # img_phase_integer == self.training_phase). If old, we only
+                # grab samples that are from previous phases.
+                elif self.new_old_var in ["New", "Old"]:
+                    # If a comparison and from this phase or a previous
+                    # one, then buisness as usual
+                    if pair == "S" and (img_phase_integer <= self.training_phase): 
+                        pair_type = "training"
+                    # If a sample, there's more nuance to accept it...
+                    else:
+                        if self.new_old_var == "New" and img_phase_integer == self.training_phase:
+                            pair_type = "training"
+                        elif self.new_old_var == "Old" and img_phase_integer < self.training_phase:
+                            pair_type = "training"
                     
-                    elif i == FM_probe_FOIL_stimulus:
-                        pair_type = "FM_foil"
-                        
-                    # Finally, generate the actual image and append it's
-                    # information to the dictionary before moving on to
-                    # the next image.
-                    if pair_type != "NA":
-                        # If we want to use this stimulus for the
-                        # current session, we can process/load the image into 
-                        # the existing program.
-                        img_file = Image.open(f"{stimuli_folder_path}{i}")
-                        # resized_img = img_file.resize(self.choice_key_dims, Image.ANTIALIAS)
-                        new_img = ImageTk.PhotoImage(img_file)
-                        
-                        # Then append everything to the dictionary...
-                        self.stimuli_dict[i] = {"type": i[0],
-                                                "pair_num": int(i.split("_")[0][1:]),
-                                                "phase": int(i.split(".")[0][-1]),
-                                                "pair":f"{pair}{i[1:]}",
-                                                "trial_type": pair_type,
-                                                "image_file": new_img
-                                                }
+                elif (img_phase_integer <= self.training_phase) or (self.training_phase == 0 and img_phase_integer == 1):
+                    # If so, categorize it as a training type stimulus (for
+                    # appending ot the dictionary later)
+                    pair_type = "training"
+                    
+                # For non-training probe trials...
+                elif i in probe_stim_list:
+                    pair_type = self.training_subphase_name_list[self.training_subphase].split(" ")[1]
+                
+                elif i == FM_probe_FOIL_stimulus:
+                    pair_type = "FM_foil"
+                    
+                # Finally, append the image's information to the
+                # dictionary before moving on to the next image. Note
+                # that the image itself isn't loaded here; only the
+                # stimuli that end up in the trial order are loaded (in
+                # the background) once the order has been built below.
+                if pair_type != "NA":
+                    self.stimuli_dict[i] = {"type": stimulus_entry["type"],
+                                            "pair_num": stimulus_entry["pair_num"],
+                                            "phase": stimulus_entry["phase"],
+                                            "pair":f"{pair}{i[1:]}",
+                                            "trial_type": pair_type
+                                            }
 
             # Now that we have a dictionary with all this session's stimuli, 
             # we should next determine the order of stimulus presentation for
@@ -776,16 +641,11 @@ class MainScreen(object):
             # either left or right, randomly.
             
             
-            # This function just sorts through the created dictionary
-            # of stimuli for samples (or "S" type), adds them to a list,
-            # and returns it. It's used both for probe trials and for normal
-            # stimuli trials.
-            def build_stimuli_list(s_dict, stim_type):
-                l = []
-                for j in s_dict:
-                    if s_dict[j]["type"] == "S" and s_dict[j]["trial_type"] == stim_type:
-                        l.append(j)
-                return l
+            # The stimuli are first grouped by type (sample/comparison), trial
+            # type, and phase (see p035.schedule), so that every sample and
+            # foil below is drawn straight from its group rather than by
+            # going through every stimulus in the dictionary
+            stimulus_index = StimulusIndex(self.stimuli_dict)
                 
             # First, we need to set up the order of any forced choice trials 
             # if the correction procedure is in place. Note that these forced
@@ -834,19 +694,9 @@ class MainScreen(object):
                     # names until it reaches 4 items. This will result in 
                     # repeated FOILs if the number of prior stimuli is less 
                     # than 4. 
-                    while len(probe_foil_stimulus_list) < self.probe_trials_per_session:
-                        # First we can just choose a random training comparison
-                        # from the previous training set:
-                        pf = choice(list(self.stimuli_dict.keys()))
-                        # This should be a comparison and from training
-                        if self.stimuli_dict[pf]["type"] == "C" and self.stimuli_dict[pf]["trial_type"] == "training":
-                            # Next make sure if it's either not in the list
-                            # OR if the number of available comparisons is less
-                            # than the number of probe trials, we can have 
-                            # repeats after all available training comparisons
-                            # are used
-                            if pf not in probe_foil_stimulus_list or (self.training_phase == 1 and len(probe_foil_stimulus_list) >= 3):
-                                probe_foil_stimulus_list.append(pf)
+                    # Each training comparison is used once before any is
+                    # repeated (see p035.schedule)
+                    probe_foil_stimulus_list = NoRepeatPool(stimulus_index.names("C", "training")).draw_many(self.probe_trials_per_session)
                 
                 # There's a different process for the fast mapping test types,
                 # which have the same foil for every single trial within a session
@@ -864,8 +714,10 @@ class MainScreen(object):
             # within our "for" loop:
             self.stimulus_order_dict = {} # This will be the order of each trial's stimuli
             c = 1 # Counter (for each trial)
-            list_of_samples = [] # For training trials
-            probe_trials_sample_list = [] # For probe trials
+            # Samples are drawn without replacement (e.g., bag of marbles),
+            # which is refilled whenever it is empty
+            training_samples = NoRepeatPool(stimulus_index.names("S", "training")) # For training trials
+            probe_samples = NoRepeatPool(stimulus_index.names("S", self.training_subphase_name_list[self.training_subphase].split(" ")[1])) # For probe trials
             
             # Then set up the left/right counterbalancing
             def refill_left_right_list ():
@@ -879,13 +731,8 @@ class MainScreen(object):
             while c <= self.max_number_of_reinforced_trials:
                 # If a CBE or FM non-training probe trial, we do something special
                 if c in probe_trial_index:
-                    if len(probe_trials_sample_list) == 0:
-                        probe_trials_sample_list = build_stimuli_list(self.stimuli_dict,
-                                                                      self.training_subphase_name_list[self.training_subphase].split(" ")[1])
-                    # Choose a sample from that list...
-                    sample_choice = choice(probe_trials_sample_list) # this is our sample!!
-                    # ...without replacement (remove it)
-                    probe_trials_sample_list.remove(sample_choice)
+                    # Choose a sample (without replacement)...
+                    sample_choice = probe_samples.draw() # this is our sample!!
                     
                     # Next, choose a left and right sample. One should be the
                     # correct comparison, one should be the foil. We can start 
@@ -894,8 +741,7 @@ class MainScreen(object):
                     # repeated across trials (as much as possible), and is
                     # pre-determined before this loop begins in the 4-item
                     # probe_foil_stimulus_list.
-                    foil = probe_foil_stimulus_list[0]
-                    probe_foil_stimulus_list.remove(foil)
+                    foil = probe_foil_stimulus_list.pop()
 
                     # Next we grab the correct image:
                     correct_comp = self.stimuli_dict[sample_choice]["pair"]
@@ -912,32 +758,16 @@ class MainScreen(object):
                     
                     # If a training trial (non-probe), we do the default
                     else:
-                        # (Re)fill our list of samples population (e.g., bag of marbles)
-                        #if it is empty
-                        if len(list_of_samples) == 0:
-                            list_of_samples = build_stimuli_list(self.stimuli_dict,
-                                                                 "training")
-                        # Choose a sample from that list...
-                        sample_choice = choice(list_of_samples) # this is our sample!!
-                        # ...without replacement (remove it)
-                        list_of_samples.remove(sample_choice)
+                        # Choose a sample (without replacement)...
+                        sample_choice = training_samples.draw() # this is our sample!!
                         # Next we grab the correct image:
                         correct_comp = self.stimuli_dict[sample_choice]["pair"]
                         
                     # Next, choose the foil stimulus (the incorrect comparison)
-                    foil = "NA"
-                    while foil == "NA":
-                        possible_foil = choice(list(self.stimuli_dict.keys())) # Choose some random stimulus
-                        # First, it MUST be a comparison (not sample)
-                        if self.stimuli_dict[possible_foil]["type"] == "C":
-                            # ...and must be one of the training comparions...
-                            if self.stimuli_dict[possible_foil]["trial_type"] == "training":
-                                # ...and it MUST NOT be the sample for the chosen sample (e.g., different pair numbers)
-                                if self.stimuli_dict[possible_foil]["pair_num"] != self.stimuli_dict[sample_choice]["pair_num"]:
-                                    # If both are yes, we've found a foil!
-                                    foil = possible_foil
-                    # If the chosen foil does not match any of these boolean
-                    # statements, we try again w/ another random choice...
+                    # It's one of the training comparisons, and it MUST NOT be
+                    # the pair of the chosen sample (e.g., different pair numbers)
+                    foil = stimulus_index.choose("C", "training",
+                                                 excluded_pair_num = self.stimuli_dict[sample_choice]["pair_num"])
                 
                 
                 # After we determine the correct comparison and the the foil,
@@ -947,24 +777,22 @@ class MainScreen(object):
                 if len(left_right_list) == 0:
                     left_right_list = refill_left_right_list()
                 
-                if left_right_list[0] == "left":
+                # (Taking that choice out of the list)
+                if left_right_list.pop() == "left":
                     left = correct_comp
                     right = foil
                 else:
                     left = foil
                     right = correct_comp
                 
-                # Remove that choice
-                left_right_list.remove(left_right_list[0])
-                
                 # Finally, we can add this trial to our dictionary before moving
                 # on to the next trial.
                 self.stimulus_order_dict[c] = {
-                    # These are the literal image files
-                    "sample_key": self.stimuli_dict[sample_choice]["image_file"],
-                    "left_comparison_key": self.stimuli_dict[left]["image_file"],
-                    "right_comparison_key": self.stimuli_dict[right]["image_file"],
-                    "correct_comparison_key": self.stimuli_dict[correct_comp]["image_file"],
+                    # These are the image files (loaded by the prefetcher)
+                    "sample_key": sample_choice,
+                    "left_comparison_key": left,
+                    "right_comparison_key": right,
+                    "correct_comparison_key": correct_comp,
                     # This is for writing data
                     "sample_stimulus_name": sample_choice.split(".")[0],
                     "left_stimulus_name": left.split(".")[0],
@@ -981,23 +809,94 @@ class MainScreen(object):
 
                 # Lastly, increment the counter by 1 for the next trial!
                 c += 1
-            
-            # After we ~finally~ set up the stimulus order, we need to set up 
-            # a timer and move on to the ITI
-            
-            if self.subject_ID == "TEST": # If test, don't worry about first ITI delay
-                self.ITI_duration = 1 * 1000
-                self.root.after(1, lambda: self.ITI())
-            else:
-                self.root.after(30000, lambda: self.ITI())
 
-        self.root.bind("<space>", first_ITI) # bind cursor state to "space" key
+        def start_loading_stimuli():
+            # After we ~finally~ set up the stimulus order, we can start
+            # loading the images in trial order (so trial 1's are first)
+            session_stimuli_list = []
+            for trial_dict in self.stimulus_order_dict.values():
+                for key in self.stimulus_keys:
+                    session_stimuli_list.append(trial_dict[key])
+            self.stimulus_prefetcher = StimulusPrefetcher(self.root,
+                                                          stimuli_folder_path,
+                                                          session_stimuli_list,
+                                                          progress_callback = update_loading_text,
+                                                          look_ahead = self.look_ahead_trials * len(self.stimulus_keys),
+                                                          max_images = self.max_stimulus_images)
+
+        def update_loading_text(n_loaded, n_total):
+            # Progress indicator for the stimulus loading (only shown on the
+            # "place bird in box" screen; afterwards it's printed once done)
+            if self.start_time is None:
+                self.mastercanvas.itemconfigure(self.loading_text,
+                                                text = f"Stimuli loaded: {n_loaded}/{n_total}")
+            if n_loaded == n_total:
+                console.info(f"- First {n_total} session stimuli loaded")
+
+        self.root.bind("<space>", self.first_ITI) # bind cursor state to "space" key
         self.mastercanvas.create_text(448,384,
                                       fill="white",
                                       font="Times 26 italic bold",
                                       text=f"P035 \n Place bird in box, then press space \n Subject: {self.subject_ID} \n Training Phase {self.training_phase_name_list[self.training_phase]} \n Subphase {self.training_subphase_name_list[self.training_subphase]}")
-        
+        self.loading_text = self.mastercanvas.create_text(448, 600,
+                                                          fill="white",
+                                                          font="Times 18 italic",
+                                                          text="Loading stimuli...")
+        # The stimulus order is built now, unless it was generated ahead of
+        # time (see p035.session_schedules), and then the stimuli start loading
+        if not self.load_precompiled_schedule():
+            build_session_stimuli()
+        start_loading_stimuli()
+
                 
+    def schedule_phase(self):
+        # The order of a FM session depends on the subject's FM log at the
+        # time (its FOIL is new to every FM session), and forced choice and
+        # "new stimuli" sessions are set up by hand, so those always build
+        # their own. Others can use a precompiled one (e.g., "3.0" for
+        # Phase 3, training).
+        if (self.training_subphase in [2,4,6] or self.forced_choice_stim_list
+            or self.all_new_simuli_var or self.new_old_var != "NA"):
+            return None
+        return f"{self.training_phase}.{self.training_subphase}"
+
+    # Once the space bar is pressed, TaskScreen.first_ITI() starts the
+    # session, then waits 30 s before the first trial to let birds settle in
+    # and acclimate. FOAM only skips that wait for "TEST" sessions.
+    def is_test_session(self):
+        return self.subject_ID == "TEST"
+
+    def session_started(self):
+        self.trial_stage = "NA" # Not in a trial until the first one starts
+        self.current_key_stimulus_dict = {"left_comparison_key": "black",
+                                       "right_comparison_key": "black",
+                                       "sample_key": "black"}
+
+        # If a FM session, add the new FOIL to the end of the FM log now that
+        # the FOIL is actually being used
+        if self.FM_log_update is not None:
+            FM_stimuli_log_directory, FM_log_entry = self.FM_log_update
+            append_fm_log_entry(FM_stimuli_log_directory, FM_log_entry)
+            # ...and add the FOIL to the session database (if there is one)
+            if database_enabled:
+                add_to_database(ingest_fm_log, FM_stimuli_log_directory)
+
+    def session_ended(self):
+        # The stimuli that are still loading are no longer needed
+        self.stimulus_prefetcher.close()
+
+    def end_first_ITI(self):
+        # The first trial's stimuli are the first to be loaded, so they
+        # will almost always be ready long before now. If not, this
+        # waits for them so that trial 1 never starts without them.
+        first_trial_dict = self.stimulus_order_dict[1]
+        self.stimulus_prefetcher.wait_for([first_trial_dict[key] for key in self.stimulus_keys])
+        self.ITI()
+
+    def data_file_path(self):
+        # FOAM's data files are named after the training phase
+        return f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P035_data-Phase{self.training_phase}.csv"
+
 ## %% ITI
 
     # Every trial (including the first) "starts" with an ITI. The ITI function
@@ -1027,7 +926,7 @@ class MainScreen(object):
         # First, check to see if any session limits have been reached (e.g.,
         # if the max time or reinforcers earned limits are reached).
         if self.current_trial_counter  == self.max_number_of_reinforced_trials:
-            print("&&& Trial max reached &&&")
+            console.info("&&& Trial max reached &&&")
             self.exit_program("event")
         # elif datetime.now() >= (self.session_duration):
         #    print("Time max reached")
@@ -1046,19 +945,13 @@ class MainScreen(object):
                 
             # This turns all the stimuli off from the previous trial (during the
             # ITI).
-            if operant_box_version:
-                rpi_board.write(hopper_light_GPIO_num,
-                                False) # Turn off the hopper light
-                rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                               hopper_down_val) # Hopper down
-                rpi_board.write(house_light_GPIO_num, 
-                                False) # Turn off house light
+            hopper_down() # Hopper down and lights off
             
             # Tracks whether HL light is currently on
             self.light_HL_on_bool = False
                 
             # Reset other variables for the following trial.
-            self.trial_start = time() # Set trial start time (note that it includes the ITI, which is subtracted later)
+            self.trial_start = self.clock.now() # Set trial start time (note that it includes the ITI, which is subtracted later)
             self.write_comp_data(False) # update data .csv with trial data from the previous trial
             
             # Next up, set the sample key FR for this upcoming
@@ -1072,9 +965,13 @@ class MainScreen(object):
             # Increase trial counter by one
             self.current_trial_counter += 1
             
+            # Start loading the stimuli of the trials after this one (older
+            # trials' stimuli can now be dropped)
+            self.stimulus_prefetcher.advance((self.current_trial_counter - 1) * len(self.stimulus_keys))
+            
             # Next, set a delay timer to proceed to the next trial
-            self.root.after(self.ITI_duration,
-                            lambda: self.sample_key_loop(self.sample_key_FR))
+            self.scheduler.after(self.ITI_duration,
+                                 lambda: self.sample_key_loop(self.sample_key_FR), "trial_start")
             
             # If autoshaping, pick the key that will be illuminated 
             if self.training_phase == 0:
@@ -1084,8 +981,8 @@ class MainScreen(object):
                 self.illuminated_key = choice(as_options)
                 
             # Finally, print terminal feedback "headers" for each event within the next trial
-            print(f"\n{'*'*35} Trial {self.current_trial_counter} begins {'*'*35}") # Terminal feedback...
-            print(f"{'Event Type':>30} | Xcord. Ycord. | Stage | Session Time | Trial Type")
+            console.info(f"\n{'*'*35} Trial {self.current_trial_counter} begins {'*'*35}") # Terminal feedback...
+            console.info(f"{'Event Type':>30} | Xcord. Ycord. | Stage | Session Time | Trial Type")
         
 #    #%%  Pre-choice loop 
     """
@@ -1119,9 +1016,8 @@ class MainScreen(object):
         # This is one half of the RR loop. It can be thought of as the resting
         # "return state" that is dependent upon a key press (on the O key). 
         # Otherwise, it will stay in this state forever.
-        if operant_box_version and not self.light_HL_on_bool:
-            rpi_board.write(house_light_GPIO_num,
-                            True) # Turn on the houselight
+        if not self.light_HL_on_bool:
+            house_light_on() # Turn on the houselight
         self.trial_FR = passed_FR
         self.clear_canvas()
         self.trial_stage = 0
@@ -1152,8 +1048,8 @@ class MainScreen(object):
         self.build_keys()
         self.FI_complete = not self.FI_complete # Flip boolean to false (or back to true)
         if not self.FI_complete:
-            self.FI_timer = self.root.after(self.FI_duration,
-                                            self.matching_stage)
+            self.FI_timer = self.scheduler.after(self.FI_duration,
+                                                 self.matching_stage, "FI")
     
         
     def build_keys(self):
@@ -1164,65 +1060,27 @@ class MainScreen(object):
         # during specific times. However, pecks to keys will be differentiated
         # regardless of activity.
         
-        # First, build the background. This basically builds a button the size of 
-        # screen to track any pecks; buttons built on top of this button will
+        # First, show the background. This is basically a button the size of 
+        # screen to track any pecks; buttons on top of this button will
         # NOT count as background pecks but as key pecks, because the object is
         # covering that part of the background. Once a peck is made, an event line
         # is appended to the data matrix.
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "background_peck": 
-                                       self.write_data(event, event_type))
+        self.scene.show_background()
         
         # Nest, we update all the colors needed for this stage of the trial
         self.calculate_trial_key_stimuli() # updates color list
         
-        # Coordinate dictionary for the shapes around a key
-        key_coord_dict = {"sample_key": [416, 352, 608, 544], # [325, 275, 475, 425], # ~192 p diameter
-                          "left_comparison_key": [128, 448, 320, 640], #[100, 350, 250, 500], # ~192 diameter
-                          "right_comparison_key": [704, 448, 896, 640] #[550, 350, 700, 500] # ~192 diameter
-                          }
-        
-        # Now that we have all the coordinates linked to each specific key,
-        # we can use a for loop to build each one.
-        for key_string in key_coord_dict:
-            # First up, build the actual circle that is the key and will
-            # contain the stimulus. Order is important here, as shapes built
-            # on top of each other will overlap/cover each other.
+        # Now we can use a for loop to show each key (all of which were
+        # built when the session started) with its stimulus, if any
+        for key_string in self.key_center_dict:
+            key_stimulus = self.current_key_stimulus_dict[key_string]
+            if key_stimulus == "black": # A blank (dark) key has no image
+                key_stimulus = ""
+            self.scene.show_key(key_string,
+                                key_stimulus,
+                                *self.key_center_dict[key_string])
             
-            # Next up, build the in the stimuli (if they should be built)
-            if self.current_key_stimulus_dict[key_string] != "black": # Only strue if its an image
-                self.mastercanvas.create_image((key_coord_dict[key_string][0] + key_coord_dict[key_string][2])//2,
-                                               (key_coord_dict[key_string][1] + key_coord_dict[key_string][3])//2,
-                                               anchor='center',
-                                               image= self.current_key_stimulus_dict[key_string],
-                                               tag = key_string)
-                
-            self.mastercanvas.create_oval(key_coord_dict[key_string],
-# =============================================================================
-#                 [key_coord_dict[key_string][0],
-#                                           key_coord_dict[key_string][1],
-#                                           key_coord_dict[key_string][2],
-#                                           key_coord_dict[key_string][3]],
-# =============================================================================
-                                                         fill = "",
-                                                         outline = "",
-                                                         tag = key_string)
-                
-            self.mastercanvas.tag_bind(key_string,
-                                       "<Button-1>",
-                                       lambda event,
-                                       key_string = key_string: self.key_press(event,
-                                                                    key_string))
-            
-        # If we're in a forced choice trial, we need to cover up the incorrect 
+        # If we're in a forced choice trial, we need to hide the incorrect 
         # foil such that only the sample and correct comparison are visible 
         # (and active) on the screen.
         if self.stimulus_order_dict[self.current_trial_counter]["trial_type"] == "FC_trial":
@@ -1230,27 +1088,17 @@ class MainScreen(object):
             # left or the right side. If the correct comparison is on the left,
             # foil should be on the right:
             if self.stimulus_order_dict[self.current_trial_counter]["correct_comparison_key"] == self.stimulus_order_dict[self.current_trial_counter]["left_comparison_key"]:
-                cover_cords = key_coord_dict["right_comparison_key"]
+                self.scene.hide_key("right_comparison_key")
                 # foil should be on the right:
             elif self.stimulus_order_dict[self.current_trial_counter]["correct_comparison_key"] == self.stimulus_order_dict[self.current_trial_counter]["right_comparison_key"]:
-                cover_cords = key_coord_dict["left_comparison_key"]
-            # Then we can build the cover on top of the foil:
-            self.mastercanvas.create_rectangle(cover_cords,
-                                               fill = "black",
-                                               outline = "black",
-                                               tag = "bkgrd")
-            # This cover should be just like the background and write data
-            # events accordingly...
-            self.mastercanvas.tag_bind("bkgrd",
-                                       "<Button-1>",
-                                       lambda event, 
-                                       event_type = "background_peck": 
-                                           self.write_data(event, event_type))
+                self.scene.hide_key("left_comparison_key")
+            # Pecks where the foil would be now land on the background and
+            # write data events accordingly...
             
         # Lastly, start an auto timer if it's autoshaping
         if self.training_phase == 0:
-            self.auto_timer = self.root.after(self.auto_reinforcer_timer,
-                                               lambda: self.provide_food(False)) # False b/c non autoreinforced
+            self.auto_timer = self.scheduler.after(self.auto_reinforcer_timer,
+                                                    lambda: self.provide_food(False), "auto_reinforcer") # False b/c non autoreinforced
 
 
     def calculate_trial_key_stimuli(self):
@@ -1265,15 +1113,15 @@ class MainScreen(object):
             }
         
         if self.training_phase == 0: # If autoshaping...
-            self.current_key_stimulus_dict[self.illuminated_key] = self.stimulus_order_dict[self.current_trial_counter][self.illuminated_key]
+            self.current_key_stimulus_dict[self.illuminated_key] = self.stimulus_prefetcher.get(self.stimulus_order_dict[self.current_trial_counter][self.illuminated_key])
                             
         else:
             if self.trial_stage == 0: # sample key alone
-                self.current_key_stimulus_dict["sample_key"] = self.stimulus_order_dict[self.current_trial_counter]["sample_key"]
+                self.current_key_stimulus_dict["sample_key"] = self.stimulus_prefetcher.get(self.stimulus_order_dict[self.current_trial_counter]["sample_key"])
             
             elif self.trial_stage == 1: # shows all stimuli
                 for stim in self.current_key_stimulus_dict:
-                    self.current_key_stimulus_dict[stim] = self.stimulus_order_dict[self.current_trial_counter][stim]
+                    self.current_key_stimulus_dict[stim] = self.stimulus_prefetcher.get(self.stimulus_order_dict[self.current_trial_counter][stim])
 
 
     
@@ -1305,7 +1153,7 @@ class MainScreen(object):
                 self.write_data(event, "correct_choice")
                 # Next, cancel the timer
                 try:
-                    self.root.after_cancel(self.auto_timer)
+                    self.scheduler.cancel(self.auto_timer)
                 except AttributeError:
                     pass
                 # Next, provide food!
@@ -1316,7 +1164,7 @@ class MainScreen(object):
                 if self.trial_stage == 1: 
                     if self.FI_complete: # If FI is complete...
                         # If correct choice
-                        if self.stimulus_order_dict[self.current_trial_counter]["correct_comparison_key"] == self.current_key_stimulus_dict[keytag]:
+                        if self.stimulus_prefetcher.get(self.stimulus_order_dict[self.current_trial_counter]["correct_comparison_key"]) == self.current_key_stimulus_dict[keytag]:
                             self.write_data(event, "correct_choice")
                             # Only training trials are reinforced (including FC training)
                             if self.stimulus_order_dict[self.current_trial_counter]["trial_type"] in ["training", "FC_trial"]:
@@ -1331,7 +1179,7 @@ class MainScreen(object):
                     else: # FI is not complete
                         self.write_data(event, "pre_FI_choice")
                 else:
-                    print("ERROR: something is fucked up")
+                    console.warning("ERROR: something is fucked up")
             
     
     # %% Post-choice contingencies: always either reinforcement (provide_food)
@@ -1363,32 +1211,15 @@ class MainScreen(object):
                                   text=f"Auto-timer complete \nFood accessible ({int(self.hopper_duration/1000)} s)") # just onscreen feedback
             self.write_data(None, "auto_reinforcer_provided")
         # Next send output to the box's hardware
-        if operant_box_version:
-            rpi_board.write(house_light_GPIO_num,
-                            False) # Turn off the house light
-            rpi_board.write(hopper_light_GPIO_num,
-                            True) # Turn off the house light
-            rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                           hopper_up_val) # Move hopper to up position
-        self.root.after(self.hopper_duration,
-                        lambda: self.ITI())
+        hopper_up() # House light off, hopper (and its light) up
+        self.scheduler.after(self.hopper_duration,
+                             lambda: self.ITI(), "hopper_down")
         
 
     # %% Outside of the main loop functions, there are several additional
     # repeated functions that are called either outside of the loop or 
     # multiple times across phases.
     
-    def change_cursor_state(self):
-        # This function toggles the cursor state on/off. 
-        # May need to update accessibility settings on your machince.
-        if self.cursor_visible: # If cursor currently on...
-            self.root.config(cursor="none") # Turn off cursor
-            print("### Cursor turned off ###")
-            self.cursor_visible = False
-        else: # If cursor currently off...
-            self.root.config(cursor="") # Turn on cursor
-            print("### Cursor turned on ###")
-            self.cursor_visible = True
 # =============================================================================
 #                                                          
 #     def manual_reinforcer(self):
@@ -1413,62 +1244,6 @@ class MainScreen(object):
 #         
 # =============================================================================
     
-    def clear_canvas(self):
-         # This is by far the most called function across the program. It
-         # deletes all the objects currently on the Canvas. A finer point to 
-         # note here is that objects still exist onscreen if they are covered
-         # up (rendering them invisible and inaccessible); if too many objects
-         # are stacked upon each other, it can may be too difficult to track/
-         # project at once (especially if many of the objects have functions 
-         # tied to them. Therefore, its important to frequently clean up the 
-         # Canvas by literally deleting every element.
-        try:
-            self.mastercanvas.delete("all")
-        except TclError:
-            print("No screen to exit")
-        
-    def exit_program(self, event): 
-        # This function can be called two different ways: automatically (when
-        # time/reinforcer session constraints are reached) or manually (via the
-        # "End Program" button in the control panel or bound "esc" key).
-            
-        # The program does a few different things:
-        #   1) Return hopper to down state, in case session was manually ended
-        #       during reinforcement (it shouldn't be)
-        #   2) Turn cursor back on
-        #   3) Writes compiled data matrix to a .csv file 
-        #   4) Destroys the Canvas object 
-        #   5) Calls the Paint object, which creates an onscreen Paint Canvas.
-        #       In the future, if we aren't using the paint object, we'll need 
-        #       to 
-        def other_exit_funcs():
-            if operant_box_version:
-                rpi_board.write(hopper_light_GPIO_num,
-                                False) # turn off hopper light
-                rpi_board.write(house_light_GPIO_num,
-                                False) # Turn off the house light
-                rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                               hopper_down_val) # set hopper to down state
-                sleep(1) # Sleep for 1 s
-                rpi_board.set_PWM_dutycycle(servo_GPIO_num,
-                                            False)
-                rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                            False)
-                rpi_board.stop() # Kill RPi board
-                # root.after_cancel(AFTER)
-                if not self.cursor_visible:
-                	self.change_cursor_state() # turn cursor back on, if applicable
-            self.write_comp_data(True) # write data for end of session
-            self.root.destroy() # destroy Canvas
-            print("\n GUI window exited")
-            
-        self.clear_canvas()
-        other_exit_funcs()
-        print("\n You may now exit the terminal and operater windows now.")
-        if operant_box_version:
-            polygon_fill.main(self.subject_ID) # call paint object
-        
-    
     def write_data(self, event, outcome):
         # This function writes a new data line after EVERY peck. Data is
         # organized into a matrix (just a list/vector with two dimensions,
@@ -1478,27 +1253,31 @@ class MainScreen(object):
             x, y = event.x, event.y
         else: # There are certain data events that are not pecks.
             x, y = "NA", "NA"
+        # When the peck (or other event) came in, on the session clock
+        event_ns = self.clock.stamp(event)
+        session_time = self.clock.session_time(event_ns)
             
-        print(f"{outcome:>25} | x: {x: ^3} y: {y:^3} | {self.trial_stage:^5} | {str(datetime.now() - self.start_time)} | {self.stimulus_order_dict[self.current_trial_counter]['trial_type']}")
+        trial_dict = self.stimulus_order_dict[self.current_trial_counter] # (looked up once)
+        self.print_event(outcome, x, y, session_time, trial_dict["trial_type"])
         # print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | Target: {self.current_target_location: ^2} | {str(datetime.now() - self.start_time)}")
-        self.session_data_frame.append([
-            str(datetime.now() - self.start_time), # SessionTime as datetime object
+        self.session_writer.write_row([
+            str(session_time), # SessionTime as timedelta object
             x, # X coordinate of a peck
             y, # Y coordinate of a peck
             outcome, # Type of event (e.g., background peck, target presentation, session end, etc.)
             # For the three stimuli shown, we need to split the filename from the directory
-            self.stimulus_order_dict[self.current_trial_counter]["sample_stimulus_name"], # Sample stimulus
-            self.stimulus_order_dict[self.current_trial_counter]["left_stimulus_name"], # Left comparison
-            self.stimulus_order_dict[self.current_trial_counter]["right_stimulus_name"], # Right comparison 
-            self.stimulus_order_dict[self.current_trial_counter]["correct_stimulus_name"], # Correct stimulus
-            self.stimulus_order_dict[self.current_trial_counter]["pair_num"], # Number of the pair
+            trial_dict["sample_stimulus_name"], # Sample stimulus
+            trial_dict["left_stimulus_name"], # Left comparison
+            trial_dict["right_stimulus_name"], # Right comparison 
+            trial_dict["correct_stimulus_name"], # Correct stimulus
+            trial_dict["pair_num"], # Number of the pair
             self.trial_stage, # Substage within each trial (1 or 2)
-            round((time() - self.trial_start - (self.ITI_duration/1000)), 5), # Time into this trial minus ITI (if session ends during ITI, will be negative)
+            round((self.clock.seconds_between(self.trial_start, event_ns) - (self.ITI_duration/1000)), 5), # Time into this trial minus ITI (if session ends during ITI, will be negative)
             self.current_trial_counter, # Trial count within session (1 - max # trials)
             self.reinforced_trial_counter, # Reinforced trial counter
             self.trial_FR, # FR of a specific trial
             self.FI_duration, # FI Timer
-            self.stimulus_order_dict[self.current_trial_counter]["trial_type"], # Trial type (e.g., "training", "CBE.1", etc.)
+            trial_dict["trial_type"], # Trial type (e.g., "training", "CBE.1", etc.)
             self.subject_ID, # Name of subject (same across datasheet)
             self.training_phase, # Phase of training as a number (0 - 7)
             self.training_subphase,  # Phase of training subphase as a numer (0 - 4)
@@ -1516,37 +1295,9 @@ class MainScreen(object):
                        "TrainingSubPhase", "ForcedChoiceSession", "AllNewStimuli",
                        "NewOldStimuliSession", "Date"] # Column headers
         
-    def write_comp_data(self, SessionEnded):
-        # The following function creates a .csv data document. It is either 
-        # called after each trial during the ITI (SessionEnded ==False) or 
-        # one the session finishes (SessionEnded). If the first time the 
-        # function is called, it will produce a new .csv out of the
-        # session_data_matrix variable, named after the subject, date, and
-        # training phase. Consecutive iterations of the function will simply
-        # write over the existing document.
-        if SessionEnded:
-            self.write_data(None, "SessionEnds") # Writes end of session to df
-        if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
-            myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P035_data-Phase{self.training_phase}.csv" # location of written .csv
-            # This loop writes the data in the matrix to the .csv              
-            edit_myFile = open(myFile_loc, 'w', newline='')
-            with edit_myFile as myFile:
-                w = writer(myFile, quoting=QUOTE_MINIMAL)
-                w.writerows(self.session_data_frame) # Write all event/trial data 
-            print(f"\n- Data file written to {myFile_loc}")
-    
 #%% Finally, this is the code that actually runs:
-try:   
-    if __name__ == '__main__':
-        cp = ExperimenterControlPanel()
-except:
-    # If an unexpected error, make sure to clean up the GPIO board
-    if operant_box_version:
-        rpi_board.set_PWM_dutycycle(servo_GPIO_num,
-                                    False)
-        rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                    False)
-        rpi_board.stop()
+def main():
+    run_program(ExperimenterControlPanel)
 
-
-    
+if __name__ == '__main__':
+    main()
@@ -41,215 +41,38 @@ session (20 combinations x 6 repetitions).
 # along with python, or other files within this folder (like control_panel or 
 # maestro).
 # =============================================================================
-from csv import writer, QUOTE_MINIMAL, DictReader
-from datetime import datetime, timedelta, date
-from sys import setrecursionlimit, path as sys_path
-from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
-     StringVar, OptionMenu, IntVar, Radiobutton
-from time import time, sleep
-from os import getcwd, popen, mkdir, listdir, path as os_path
+from datetime import datetime, date
+from p035.engine import operant_box_version, TaskScreen, \
+     ExperimenterControlPanel, run_program, hopper_up, hopper_down, \
+     house_light_on
+from p035.stimulus_cache import StimulusCache
+from p035.stimulus_manifest import load_manifest
+from p035.console import console
+from p035.schedule import balanced_side_rounds
+from os import path as os_path
 from random import choice, shuffle
-from PIL import ImageTk, Image  
 
-# The first variable declared is whether the program is the operant box version
-# for pigeons, or the test version for humans to view. The variable below is 
-# a T/F boolean that will be referenced many times throughout the program 
-# when the two options differ (for example, when the Hopper is accessed or
-# for onscreen text, etc.). It is changed automatically based on whether
-# the program is running in operant boxes (True) or not (False). It is
-# automatically set to True if the user is "blaisdelllab" (e.g., running
-# on a rapberry pi) or False if not. The output of os_path.expanduser('~')
-# should be "/home/blaisdelllab" on the RPis.
+# Whether this is running in an operant box (operant_box_version), the box's
+# hardware, the experimenter control panel, and everything else that the P035
+# programs have in common are in the shared engine (p035/engine.py). This
+# program only declares what is particular to its own task.
 
-if os_path.expanduser('~').split("/")[2] =="blaisdelllab":
-    operant_box_version = True
-    print("*** Running operant box version *** \n")
-else:
-    operant_box_version = False
-    print("*** Running test version (no hardware) *** \n")
-
-# Import hopper/other specific libraries from files on operant box computers
-try:
-    if operant_box_version:
-        # Import additional libraries...
-        import pigpio # import pi, OUTPUT
-        import csv
-        #...including art scripts
-        sys_path.insert(0, str(os_path.expanduser('~')+"/Desktop/Experiments/P033/"))
-        import graph
-        import polygon_fill
-        
-        # Setup GPIO numbers (NOT PINS; gpio only compatible with GPIO num)
-        servo_GPIO_num = 2
-        hopper_light_GPIO_num = 13
-        house_light_GPIO_num = 21
-        
-        # Setup use of pi()
-        rpi_board = pigpio.pi()
-        
-        # Then set each pin to output 
-        rpi_board.set_mode(servo_GPIO_num,
-                           pigpio.OUTPUT) # Servo motor...
-        rpi_board.set_mode(hopper_light_GPIO_num,
-                           pigpio.OUTPUT) # Hopper light LED...
-        rpi_board.set_mode(house_light_GPIO_num,
-                           pigpio.OUTPUT) # House light LED...
-        
-        # Setup the servo motor 
-        rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                    50) # Default frequency is 50 MhZ
-        
-        # Next grab the up/down 
-        hopper_vals_csv_path = str(os_path.expanduser('~')+"/Desktop/Box_Info/Hopper_vals.csv")
-        
-        # Store the proper UP/DOWN values for the hopper from csv file
-        up_down_table = list(csv.reader(open(hopper_vals_csv_path)))
-        hopper_up_val = up_down_table[1][0]
-        hopper_down_val = up_down_table[1][1]
-        
-        # Lastly, run the shell script that maps the touchscreen to operant box monitor
-        popen("sh /home/blaisdelllab/Desktop/Hardware_Code/map_touchscreen.sh")
-                             
-        
-except ModuleNotFoundError:
-    input("ERROR: Cannot find hopper hardware! Check desktop.")
-
-# Below  is just a safety measure to prevent too many recursive loops). It
-# doesn't need to be changed.
-setrecursionlimit(5000) 
-
-"""
-The code below jumpstarts the loop by first building the hopper object and 
-making sure everything is turned off, then passes that object to the
-control_panel. The program is largely recursive and self-contained within each
-object, and a macro-level overview is:
-    
-    ControlPanel -----------> MainScreen ------------> PaintProgram
-         |                        |                         |
-    Collects main           Runs the actual         Gets passed subject
-    variables, passes      experiment, saves        name, but operates
-    to Mainscreen          data when exited          independently
-    
-
-"""
-
-# The first of two objects we declare is the ExperimentalControlPanel (CP). It
-# exists "behind the scenes" throughout the entire session, and if it is exited,
-# the session will terminate.
-class ExperimenterControlPanel(object):
-    # The init function declares the inherent variables within that object
-    # (meaning that they don't require any input).
-    def __init__(self):
-        # First, setup the data directory in "Documents"
-        self.doc_directory = str(os_path.expanduser('~'))+"/Documents/"
-        # Next up, we need to do a couple things that will be different based
-        # on whether the program is being run in the operant boxes or on a 
-        # personal computer. These include setting up the hopper object so it 
-        # can be referenced in the future, or the location where data files
-        # should be stored.
-        if operant_box_version:
-            # Setup the data directory in "Documents"
-            self.data_folder = "P035_data" # The folder within Documents where subject data is kept
-            self.data_folder_directory = str(os_path.expanduser('~'))+"/Desktop/Data/" + self.data_folder
-        else: # If not, just save in the current directory the program us being run in 
-            self.data_folder_directory = getcwd() + "/data"
-        
-        # setup the root Tkinter window
-        self.control_window = Tk()
-        self.control_window.title("P035b Control Panel")
-        ##  Next, setup variables within the control panel
-        # Subject ID
-        self.pigeon_name_list = ["Bowser", "Yoshi", "Shy Guy", "Athena",
-                                 "Darwin","Cousteau",
-                                 "Bon Jovi"]
-        self.pigeon_name_list.sort() # This alphabetizes the list
-        self.pigeon_name_list.insert(0, "TEST")
-        
-        Label(self.control_window, text="Pigeon Name:").pack()
-        self.subject_ID_variable = StringVar(self.control_window)
-        self.subject_ID_variable.set("Subject")
-        self.subject_ID_menu = OptionMenu(self.control_window,
-                                          self.subject_ID_variable,
-                                          *self.pigeon_name_list,
-                                          command=self.set_pigeon_ID).pack()
-
-        
-        # Exp phases
-        self.experimental_phase_titles = ["Phase 1 (Familiarization)", 
-                                          "Phase 2 (Experimental trials)"]
-        
-        Label(self.control_window, text="Experimental Phase:").pack()
-        self.exp_phase_variable = StringVar(self.control_window)
-        self.exp_phase_variable.set("Select")
-        self.exp_phase_menu = OptionMenu(self.control_window,
-                                          self.exp_phase_variable,
-                                          *self.experimental_phase_titles
-                                          ).pack()
-        
-        # Record data variable?
-        Label(self.control_window,
-              text = "Record data in seperate data sheet?").pack()
-        self.record_data_variable = IntVar()
-        self.record_data_rad_button1 =  Radiobutton(self.control_window,
-                                   variable = self.record_data_variable, text = "Yes",
-                                   value = True).pack()
-        self.record_data_rad_button2 = Radiobutton(self.control_window,
-                                  variable = self.record_data_variable, text = "No",
-                                  value = False).pack()
-        self.record_data_variable.set(True) # Default set to True
-        
-        
-        # Start button
-        self.start_button = Button(self.control_window,
-                                   text = 'Start program',
-                                   bg = "green2",
-                                   command = self.build_chamber_screen).pack()
-        
-        # This makes sure that the control panel remains onscreen until exited
-        self.control_window.mainloop() # This loops around the CP object
-        
-        
-    def set_pigeon_ID(self, pigeon_name):
-        # This function checks to see if a pigeon's data folder currently 
-        # exists in the respective "data" folder within the Documents
-        # folder and, if not, creates one.
-        try:
-            if not os_path.isdir(self.data_folder_directory + pigeon_name):
-                mkdir(os_path.join(self.data_folder_directory, pigeon_name))
-                print("\n ** NEW DATA FOLDER FOR %s CREATED **" % pigeon_name.upper())
-        except FileExistsError:
-            print(f"DATA FOLDER FOR {pigeon_name.upper()} EXISTS")
-                
-                
-    def build_chamber_screen(self):
-        # Once the green "start program" button is pressed, then the mainscreen
-        # object is created and pops up in a new window. It gets passed the
-        # important inputs from the control panel.
-        if self.subject_ID_variable.get() in self.pigeon_name_list:
-            if self.exp_phase_variable.get() != "Select":
-                print("Operant Box Screen Built") 
-                self.MS = MainScreen(
-                    str(self.subject_ID_variable.get()), # subject_ID
-                    self.record_data_variable.get(), # Boolean for recording data (or not)
-                    self.data_folder_directory, # directory for data folder
-                    self.exp_phase_variable.get(), # Exp phase name
-                    self.experimental_phase_titles.index(self.exp_phase_variable.get()) # Exp Phase number (0-1)
-                    )
-            else:
-                print("\n ERROR: Input Stimulus Set Before Starting Session")
-        else:
-            print("\n ERROR: Input Correct Pigeon ID Before Starting Session")
-            
 
 # Then, setup the MainScreen object
 # This is where we set up our experiment, really 
 
 #let's first set up the familiarization phase (Phase 1)
 
-class MainScreen(object):
+class MainScreen(TaskScreen):
     # First, we need to declare several functions that are 
     # called within the initial __init__() function that is 
     # run when the object is first built:
+    # What sets this task apart (everything else is in p035.engine.TaskScreen)
+    task_code = "P035b"
+    experimental_phase_titles = ["Phase 1 (Familiarization)",
+                                 "Phase 2 (Experimental trials)"]
+    # What build_schedule() sets (the trial order)
+    schedule_attributes = ["max_trials", "stimuli_assignment_dict"]
     
     def __init__(self, subject_ID, record_data, data_folder_directory,
                  exp_phase_name, exp_phase_num):
@@ -274,37 +97,8 @@ class MainScreen(object):
         self.subject_ID = subject_ID
         self.record_data = record_data
         
-        ## Set up the visual Canvas
-        self.root = Toplevel() 
-        self.root.title(f"P035b {self.exp_phase_name}: ") # this is the title of the window
-        self.mainscreen_height = 768 # height of the experimental canvas screen
-        self.mainscreen_width = 1024 # width of the experimental canvas screen
-        self.root.bind("<Escape>", self.exit_program) # bind exit program to the "esc" key
-        
-        # If the version is the one running in the boxes...
-        if operant_box_version: 
-            # Keybind relevant keys
-            self.cursor_visible = True # Cursor starts on...
-            self.change_cursor_state() # turn off cursor UNCOMMENT
-            self.root.bind("<c>",
-                           lambda event: self.change_cursor_state()) # bind cursor on/off state to "c" key
-            # Then fullscreen (on a 1024x768p screen). Assumes that both screens
-            # that are being used have identical dimensions
-            self.root.geometry(f"{self.mainscreen_width}x{self.mainscreen_height}+1920+0")
-            self.root.attributes('-fullscreen',
-                                 True)
-            self.mastercanvas = Canvas(self.root,
-                                   bg="black")
-            self.mastercanvas.pack(fill = BOTH,
-                                   expand = True)
-        # If we want to run a "human-friendly" version
-        else: 
-            # No keybinds and  1024x768p fixed window
-            self.mastercanvas = Canvas(self.root,
-                                   bg="black",
-                                   height=self.mainscreen_height,
-                                   width = self.mainscreen_width)
-            self.mastercanvas.pack()
+        ## Set up the visual Canvas (and the session clock and scheduler)
+        self.build_screen(f"P035b {self.exp_phase_name}: ")
         
         self.start_time = datetime.now()  # This will be reset once the session actually starts
         self.trial_start = None # Duration into each trial as a second count, resets each trial
@@ -348,7 +142,6 @@ class MainScreen(object):
             self.max_trials = 60 # Max number of trials within a session = 60 (10 comparisons shown 6 times)
         elif self.exp_phase_num == 1:
             self.max_trials = 80 # 20 pairs shown  4 times each
-        self.session_data_frame = [] #This where trial-by-trial data is stored
         self.trial_stage = 0 # This tracks the stage within the trial
         self.current_trial_counter = 0 # This counts the number of trials that have passed
         header_list = [
@@ -356,27 +149,42 @@ class MainScreen(object):
             "TrialSubStage", "SampleStimulus", "LComp", "RComp", "CorrectKey",
             "TrialTime", "TrialNum", "ReinTrialNum", "SampleFR", "SampleTrialType", 
             "CorrectComparisonGroup", "FoilGroup", "Date","ComparisonTrialTime"] # Column headers
-        self.session_data_frame.append(header_list) # First row of matrix is the column headers
+        self.start_data(header_list) # First row of the data is the column headers
         self.date = date.today().strftime("%y-%m-%d")
         self.myFile_loc = 'FILL' # To be filled later on after Pig. ID is provided (in set vars func below)
         
         if operant_box_version:
             if self.exp_phase_num == 0:
                 self.stimuli_folder_path = "/home/blaisdelllab/Desktop/Experiments/P035/P035b_Stimuli_familiarized_comparisons" #grabs the stimuli
-                self.stimuli_files_list = listdir(self.stimuli_folder_path) #creates a dictionary of the stimuli
+                self.stimuli_files_list = load_manifest(self.stimuli_folder_path).file_names #creates a dictionary of the stimuli
             elif self.exp_phase_num == 1:
                 self.stimuli_folder_path = "/home/blaisdelllab/Desktop/Experiments/P035/P035b_Stimuli" #grabs the stimuli
-                self.stimuli_files_list = listdir(self.stimuli_folder_path) #creates a dictionary of the stimuli
+                self.stimuli_files_list = load_manifest(self.stimuli_folder_path).file_names #creates a dictionary of the stimuli
         else: 
             if self.exp_phase_num == 0:
                 self.stimuli_folder_path = "/Users/kayleyozimac/Desktop/P035b/P035b (mini project)/P035b_Stimuli_familiarized_comparisons" #grabs the stimuli
-                self.stimuli_files_list = listdir(self.stimuli_folder_path) #creates a dictionary of the stimuli
+                self.stimuli_files_list = load_manifest(self.stimuli_folder_path).file_names #creates a dictionary of the stimuli
             elif self.exp_phase_num == 1:
                 self.stimuli_folder_path = "/Users/kayleyozimac/Desktop/P035b/P035b (mini project)/P035b_Stimuli" #grabs the stimuli
-                self.stimuli_files_list = listdir(self.stimuli_folder_path) #creates a dictionary of the stimuli
+                self.stimuli_files_list = load_manifest(self.stimuli_folder_path).file_names #creates a dictionary of the stimuli
         
-        ## SET UP STIMULI ORDER FOR TRIALS
+        ## SET UP STIMULI ORDER FOR TRIALS (unless this session's order was
+        # generated ahead of time; see p035.session_schedules)
+        if not self.load_precompiled_schedule():
+            self.build_schedule()
+
+        ## Decode every stimulus used in this session ahead of time, so that
+        # nothing needs to be read from the disk on each peck
+        self.stimulus_cache = StimulusCache()
+        self.stimulus_cache.preload([self.stimuli_folder_path],
+                                    self.stimuli_assignment_dict)
         
+        ## Finally, start the recursive loop that runs the program:
+        self.place_birds_in_box()
+                
+    def build_schedule(self):
+        # The order of the session's trials (and their stimuli), built at
+        # random. Its results are the schedule_attributes above.
         if self.exp_phase_num == 0: # For familiarization phase
             self.presentation_counts = {stimulus: {"left": 0, "right": 0} for stimulus in self.stimuli_files_list}
             self.max_presentations = 6  # Each image should be shown 6 times (3 times in each location)
@@ -392,26 +200,16 @@ class MainScreen(object):
             self.stimuli_assignment_dict = {}
             trial_counter = 1
             
-            # Create a list of locations, ensuring each comparison is shown equally on the left and right within each block of 10 trials
-            def generate_balanced_location_list(size):
-                return ["left", "right"] * (size // 2)
+            # Each pass shows every comparison once, half of them on the left
+            # and half on the right, and over the six passes each comparison
+            # is shown exactly 3 times in each location (see p035.schedule)
+            location_rounds = balanced_side_rounds(comparison_list, self.max_presentations)
             
-            while trial_counter <= self.max_trials:
-                location_list = generate_balanced_location_list(10)
-                shuffle(location_list)
+            for locations in location_rounds:
                 shuffle(comparison_list)  # Reshuffle comparisons for each pass
             
-                for i in range(num_comparisons):
-                    if trial_counter > self.max_trials:
-                        break
-                    comparison = comparison_list[i]
-                    location = location_list.pop()
-            
-                    # Ensure each stimulus is shown 3 times on each side
-                    while self.presentation_counts[comparison][location] >= 3:
-                        location_list.insert(0, location)
-                        shuffle(location_list)
-                        location = location_list.pop()
+                for comparison in comparison_list:
+                    location = locations[comparison]
             
                     # Update the assignment dictionary
                     self.stimuli_assignment_dict[trial_counter] = {
@@ -529,84 +327,31 @@ class MainScreen(object):
             self.stimuli_assignment_dict = dict(sorted(self.stimuli_assignment_dict.items()))
           #  print(self.stimuli_assignment_dict)
 
-        ## Finally, start the recursive loop that runs the program:
-        self.place_birds_in_box()
-                
-    def place_birds_in_box(self):
-        # This is the default screen run until the birds are placed into the
-        # box and the space bar is pressed. It then proceedes to the ITI. It only
-        # runs in the operant box version. After the space bar is pressed, the
-        # "first_ITI" function is called for the only time prior to the first trial
-        self.root.bind("<space>", self.first_ITI) # bind cursor state to "space" key
-        #shows program text (i.e., what was chosen in the control panel)
-        self.mastercanvas.create_text(512,384,
-                                      fill="white",
-                                      font="Times 26 italic bold",
-                                      text=f"P035b \n Place bird in box, then press space \n Subject: {self.subject_ID} \n Training Phase: {self.exp_phase_name}")
-    
-    def first_ITI(self, event):
-        print("Spacebar pressed -- SESSION STARTED") 
-        self.root.unbind("<space>") # bind cursor state to "space" key
-        self.clear_canvas()
-        self.start_time = datetime.now()  # This is the ACTUAL time the session starts
-        if not operant_box_version or self.subject_ID == "TEST": # If test, don't worry about first ITI delay
-            self.ITI_duration = 1 * 1000
-            self.root.after(1, lambda: self.ITI())
-        else:
-            self.root.after(30000, lambda: self.ITI())
-            
-    #create the first part of a trial (e.g., sample stimulus presented)
     def sample_phase(self):
         
         if self.exp_phase_num == 1:
-            if operant_box_version and not self.light_HL_on_bool:
-                rpi_board.write(house_light_GPIO_num,
-                                True) # Turn on the houselight
+            if not self.light_HL_on_bool:
+                house_light_on() # Turn on the houselight
             
         self.clear_canvas()
         self.trial_stage = 0
-        #build background (i.e., "background pecks)
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "background_peck": 
-                                       self.write_data(event, event_type))
+        #show background (i.e., "background pecks)
+        self.scene.show_background()
 
         trial_info_dict = self.stimuli_assignment_dict[self.current_trial_counter]
-        sample_image_name = trial_info_dict["sample"]  
+        sample_image_name = trial_info_dict["sample"]
 
         # Load the selected image
         selected_image_path = os_path.join(self.stimuli_folder_path, sample_image_name)
-        selected_image = Image.open(selected_image_path)
-        self.image = ImageTk.PhotoImage(selected_image)
-        
+        self.image = self.stimulus_cache.get(selected_image_path)
+
         x,y = 512, 384
-        
-        #Create black circle around stimuli
-        oval_radius = 85  
-        self.mastercanvas.create_oval(x - oval_radius, y - oval_radius,
-                                      x + oval_radius, y + oval_radius,
-                                      fill = "black",
-            #                          outline = "red",
-                                      tag = "button")
-        
-        # Finally, create/show the image on the canvas
-        self.mastercanvas.create_image(x, y, 
-                                       image=self.image, 
-                                       anchor="center", 
-                                       tag="button")
 
-        # Bind the click event (i.e., peck to the stimulus results in moving onto reinforcement_phase)
-        self.mastercanvas.tag_bind("button", 
-                                   "<Button-1>", 
-                                   self.sample_key_press)
-        
+        # Finally, show the image (in its black circle) on the canvas. A
+        # peck to the stimulus results in moving onto reinforcement_phase
+        self.scene.show_key("button", self.image, x, y,
+                            self.sample_key_press)
+
         # Assign sample_FR from trial_info_dict
         self.sample_FR = trial_info_dict.get("sample_FR")
         
@@ -631,29 +376,18 @@ class MainScreen(object):
         self.clear_canvas()
         
         if self.exp_phase_num == 0:
-            if operant_box_version and not self.light_HL_on_bool:
-                rpi_board.write(house_light_GPIO_num,
-                                True) # Turn on the houselight
+            if not self.light_HL_on_bool:
+                house_light_on() # Turn on the houselight
         
         self.trial_stage = 1
         
         # Check if the trial number has changed
         if self.current_trial_counter != self.last_written_trial_num:
-            self.comparison_start_time = datetime.now()  # Start the timer if the trial number has changed
+            self.comparison_start_time = self.clock.now()  # Start the timer if the trial number has changed
             self.last_written_trial_num = self.current_trial_counter
         
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        #build background (i.e., "background pecks)
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "background_peck": 
-                                       self.write_data(event, event_type))
+        #show background (i.e., "background pecks)
+        self.scene.show_background()
             
         #differentiate between phase 1 and phase 2 
         
@@ -671,13 +405,11 @@ class MainScreen(object):
         
         # Load the comparison image
             comparison_image_path = os_path.join(self.stimuli_folder_path, comparison_image_name)
-            comparison_image = Image.open(comparison_image_path)
-            self.comparison_image = ImageTk.PhotoImage(comparison_image)
+            self.comparison_image = self.stimulus_cache.get(comparison_image_path)
         
         # Load the foil image
             foil_image_path = os_path.join(self.stimuli_folder_path, foil_image_name)
-            foil_image = Image.open(foil_image_path)
-            self.foil_image = ImageTk.PhotoImage(foil_image)
+            self.foil_image = self.stimulus_cache.get(foil_image_path)
         
         # Determine coordinates based on comparison_location
             if comparison_location == "left":
@@ -687,44 +419,16 @@ class MainScreen(object):
                     comparison_x, comparison_y = 864, 550  # Right side
                     foil_x, foil_y = 160, 550  # Left side
         
-        # Create black circle around comparison image
-            oval_radius = 85
-            self.mastercanvas.create_oval(comparison_x - oval_radius, comparison_y - oval_radius,
-                              comparison_x + oval_radius, comparison_y + oval_radius,
-                              fill="black",
-            #                  outline="red",
-                              tag="comparison_button")
-
-        # Create black circle around foil image
-            self.mastercanvas.create_oval(foil_x - oval_radius, foil_y - oval_radius,
-                              foil_x + oval_radius, foil_y + oval_radius,
-                              fill="black",
-             #                 outline="red",
-                              tag="foil_button")
-        
-        # Finally, create/show the comparison image on the canvas
-            self.mastercanvas.create_image(comparison_x, comparison_y,
-                               image=self.comparison_image,
-                               anchor="center",
-                               tag="comparison_button")
-            
-            # Bind the comparison button to the correct choice handler
-            self.mastercanvas.tag_bind("comparison_button",
-                                       "<Button-1>",
-                                       self.correct_choice)
-                
-                                                       
+        # Show the comparison (in its black circle), bound to the correct
+        # choice handler
+            self.scene.show_key("comparison_button", self.comparison_image,
+                                comparison_x, comparison_y,
+                                self.correct_choice)
     
-        # Finally, create/show the foil image on the canvas
-            self.mastercanvas.create_image(foil_x, foil_y,
-                               image=self.foil_image,
-                               anchor="center",
-                               tag="foil_button")
-        
-        # Bind the foil button to the incorrect choice handler
-            self.mastercanvas.tag_bind("foil_button",
-                           "<Button-1>",
-                            self.incorrect_choice)
+        # Show the foil, bound to the incorrect choice handler
+            self.scene.show_key("foil_button", self.foil_image,
+                                foil_x, foil_y,
+                                self.incorrect_choice)
             
             #Keep the sample up
             
@@ -732,36 +436,14 @@ class MainScreen(object):
 
         # Load the selected image
             selected_image_path = os_path.join(self.stimuli_folder_path, sample_image_name)
-            selected_image = Image.open(selected_image_path)
-            self.image = ImageTk.PhotoImage(selected_image)
+            self.image = self.stimulus_cache.get(selected_image_path)
             
             x,y = 512, 384
             
-            #Create black circle around stimuli
-            oval_radius = 85  
-            self.mastercanvas.create_oval(x - oval_radius, y - oval_radius,
-                                          x + oval_radius, y + oval_radius,
-                                          fill = "black",
-                     #                     outline = "red",
-                                          tag = "inactive_sample_key_press")
-            
-                        
-            self.mastercanvas.tag_bind("inactive_sample_key_press",
-                                       "<Button-1>",
-                                       lambda event, 
-                                       event_type = "inactive_sample_key_press": 
-                                           self.write_data(event, event_type))
-            
-            self.mastercanvas.create_image(x,y,
-                                image=self.image, 
-                                anchor="center", 
-                                tag="inactive_sample_key_press")
-            
-            self.mastercanvas.tag_bind("inactive_sample_key_press",
-                                       "<Button-1>",
-                                       lambda event, 
-                                       event_type = "inactive_sample_key_press": 
-                                           self.write_data(event, event_type))
+            self.scene.show_key("inactive_sample_key_press", self.image, x, y,
+                                lambda event, 
+                                event_type = "inactive_sample_key_press": 
+                                    self.write_data(event, event_type))
             
             
         elif self.exp_phase_num == 0: # For familiarization phase
@@ -778,38 +460,23 @@ class MainScreen(object):
         
         # Load the selected image
             selected_image_path = os_path.join(self.stimuli_folder_path, stimulus_file)
-            selected_image = Image.open(selected_image_path)
-            self.image = ImageTk.PhotoImage(selected_image)
+            self.image = self.stimulus_cache.get(selected_image_path)
 
         # Determine coordinates based on the selected location above
             if location == "left":
                 x, y = 160, 550
             else:  # If right...
                 x, y = 864, 550
-        #Create black circle around stimuli
-            oval_radius = 85  
-            self.mastercanvas.create_oval(x - oval_radius, y - oval_radius,
-                                      x + oval_radius, y + oval_radius,
-                                      fill = "black",
-               #                       outline = "red",
-                                      tag = "button")
-
-        # Finally, create/show the image on the canvas
-            self.mastercanvas.create_image(x,y, 
-                                       image=self.image, 
-                                       anchor="center", 
-                                       tag="button")
-
-        # Bind the click event (i.e., peck to the stimulus results in moving onto reinforcement_phase)
-            self.mastercanvas.tag_bind("button", 
-                                   "<Button-1>", 
-                                   self.comp_key_press)
+        # Finally, show the image (in its black circle) on the canvas. A
+        # peck to the stimulus results in moving onto reinforcement_phase
+            self.scene.show_key("button", self.image, x, y,
+                                self.comp_key_press)
             
     #comparison phase timer
         
     def update_comparison_trial_time(self):
         if hasattr(self, 'comparison_start_time'):
-            self.comparison_trial_time = (datetime.now() - self.comparison_start_time).total_seconds()
+            self.comparison_trial_time = self.clock.seconds_between(self.comparison_start_time, self.clock.now())
         else:
             self.comparison_trial_time = "NA"
         
@@ -874,18 +541,12 @@ class MainScreen(object):
                                       text=f"Reinforcement TIME ({int(self.hopper_duration/1000)} s)")
         
         # Next send output to the box's hardware
-        if operant_box_version:
-            rpi_board.write(house_light_GPIO_num,
-                            False) # Turn off the house light
-            rpi_board.write(hopper_light_GPIO_num,
-                            True) # Turn off the house light
-            rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                           hopper_up_val) # Move hopper to up position
+        hopper_up() # House light off, hopper (and its light) up
             # Check if this is the last trial
         if self.current_trial_counter == self.max_trials:
-            self.root.after(self.hopper_duration, lambda: self.exit_program("event"))
+            self.scheduler.after(self.hopper_duration, lambda: self.exit_program("event"), "hopper_down")
         else:
-            self.root.after(self.hopper_duration, lambda: self.ITI())
+            self.scheduler.after(self.hopper_duration, lambda: self.ITI(), "hopper_down")
        # self.root.after(self.hopper_duration,
        #                 lambda: self.ITI())
     
@@ -919,7 +580,7 @@ class MainScreen(object):
         # First, check to see if any session limits have been reached (e.g.,
         # if the max time or reinforcers earned limits are reached).
         if self.current_trial_counter  == self.max_trials + 1:
-            print("&&& Trial max reached &&&")
+            console.info("&&& Trial max reached &&&")
             self.exit_program("event")
             
       # Else, after a timer move on to the next trial. Note that,
@@ -935,13 +596,7 @@ class MainScreen(object):
               
           # This turns all the stimuli off from the previous trial (during the
           # ITI).
-        if operant_box_version:
-              rpi_board.write(hopper_light_GPIO_num,
-                              False) # Turn off the hopper light
-              rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                             hopper_down_val) # Hopper down
-              rpi_board.write(house_light_GPIO_num, 
-                              False) # Turn off house light
+        hopper_down() # Hopper down and lights off
           
           # Tracks whether HL light is currently on
         self.light_HL_on_bool = False
@@ -957,7 +612,7 @@ class MainScreen(object):
         self.incorrect_comparison_key_presses = 0 # counts number of key presses on comp for each trial
         self.sample_key_presses = 0
         self.trial_stage = 0 
-        self.trial_start = time() # Set trial start time (note that it includes the ITI, which is subtracted later)
+        self.trial_start = self.clock.now() # Set trial start time (note that it includes the ITI, which is subtracted later)
          # Update everything for the next trial
         self.last_written_trial_num = None  # Reset the last written trial number for the new trial
         self.comparison_start_time = None  # Reset the comparison start time for the new trial
@@ -979,86 +634,16 @@ class MainScreen(object):
         self.write_comp_data(False) # update data .csv with trial data from the previous trial
         # Timer
         if self.exp_phase_num == 0:
-            self.root.after(self.ITI_duration,
-                            self.comparison_phase)
+            self.scheduler.after(self.ITI_duration,
+                                 self.comparison_phase, "trial_start")
         elif self.exp_phase_num == 1:
-            self.root.after(self.ITI_duration,
-                            self.sample_phase)
+            self.scheduler.after(self.ITI_duration,
+                                 self.sample_phase, "trial_start")
         
         # Finally, print terminal feedback "headers" for each event within the next trial
-        print(f"\n{'*'*30} Trial {self.current_trial_counter} begins {'*'*30}") # Terminal feedback...
-        print(f"{'Event Type':>30} | Xcord. Ycord. | Stage | Session Time")
+        self.print_trial_header()
             
         
-    def change_cursor_state(self):
-        # This function toggles the cursor state on/off. 
-        # May need to update accessibility settings on your machince.
-        if self.cursor_visible: # If cursor currently on...
-            self.root.config(cursor="none") # Turn off cursor
-            print("### Cursor turned off ###")
-            self.cursor_visible = False
-        else: # If cursor currently off...
-            self.root.config(cursor="") # Turn on cursor
-            print("### Cursor turned on ###")
-            self.cursor_visible = True
-    
-    def clear_canvas(self):
-         # This is by far the most called function across the program. It
-         # deletes all the objects currently on the Canvas. A finer point to 
-         # note here is that objects still exist onscreen if they are covered
-         # up (rendering them invisible and inaccessible); if too many objects
-         # are stacked upon each other, it can may be too difficult to track/
-         # project at once (especially if many of the objects have functions 
-         # tied to them. Therefore, its important to frequently clean up the 
-         # Canvas by literally deleting every element.
-        try:
-            self.mastercanvas.delete("all")
-        except TclError:
-            print("No screen to exit")
-        
-    def exit_program(self, event): 
-        # This function can be called two different ways: automatically (when
-        # time/reinforcer session constraints are reached) or manually (via the
-        # "End Program" button in the control panel or bound "esc" key).
-            
-        # The program does a few different things:
-        #   1) Return hopper to down state, in case session was manually ended
-        #       during reinforcement (it shouldn't be)
-        #   2) Turn cursor back on
-        #   3) Writes compiled data matrix to a .csv file 
-        #   4) Destroys the Canvas object 
-        #   5) Calls the Paint object, which creates an onscreen Paint Canvas.
-        #       In the future, if we aren't using the paint object, we'll need 
-        #       to 
-        def other_exit_funcs():
-            if operant_box_version:
-                rpi_board.write(hopper_light_GPIO_num,
-                                False) # turn off hopper light
-                rpi_board.write(house_light_GPIO_num,
-                                False) # Turn off the house light
-                rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                               hopper_down_val) # set hopper to down state
-                sleep(1) # Sleep for 1 s
-                rpi_board.set_PWM_dutycycle(servo_GPIO_num,
-                                            False)
-                rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                            False)
-                rpi_board.stop() # Kill RPi board
-                # root.after_cancel(AFTER)
-                if not self.cursor_visible:
-                	self.change_cursor_state() # turn cursor back on, if applicable
-            self.write_comp_data(True) # write data for end of session
-            if self.root.winfo_exists():  # Check if the window still exists
-                self.root.destroy()  # destroy Canvas
-            print("\n GUI window exited")
-            
-        self.clear_canvas()
-        other_exit_funcs()
-        print("\n You may now exit the terminal and operater windows now.")
-        if operant_box_version:
-            polygon_fill.main(self.subject_ID) # call paint object
-            
-
     def write_data(self, event, outcome):
         # This function writes a new data line after EVERY peck. Data is
         # organized into a matrix (just a list/vector with two dimensions,
@@ -1070,7 +655,10 @@ class MainScreen(object):
             x, y = event.x, event.y
         else: # There are certain data events that are not pecks.
             x, y = "NA", "NA"   
-        print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | {self.trial_stage:^5} | {str(datetime.now() - self.start_time)}")
+        # When the peck (or other event) came in, on the session clock
+        event_ns = self.clock.stamp(event)
+        session_time = self.clock.session_time(event_ns)
+        self.print_event(outcome, x, y, session_time)
         
         # Initialize comparison_group and foil_group
         comparison_group = "NA"
@@ -1112,11 +700,11 @@ class MainScreen(object):
                 LComp = self.foil_name
                 RComp = self.comparison_name 
             # Calculate the comparison trial time consistently
-        comparison_trial_time = (datetime.now() - self.comparison_start_time).total_seconds() if self.trial_stage == 1 else "NA"
+        comparison_trial_time = self.clock.seconds_between(self.comparison_start_time, event_ns) if self.trial_stage == 1 else "NA"
 
         # Append peck data to data frame...
-        self.session_data_frame.append([
-            str(datetime.now() - self.start_time), # SessionTime as datetime object
+        self.session_writer.write_row([
+            str(session_time), # SessionTime as timedelta object
             self.exp_phase,
             self.subject_ID,
             x,
@@ -1127,7 +715,7 @@ class MainScreen(object):
             LComp, # LComp
             RComp, # RComp
             self.comparison_name, # "CorrectKey"
-            round((time() - self.trial_start - (self.ITI_duration/1000)), 5), # Time into this trial minus ITI (if session ends during ITI, will be negative)
+            round((self.clock.seconds_between(self.trial_start, event_ns) - (self.ITI_duration/1000)), 5), # Time into this trial minus ITI (if session ends during ITI, will be negative)
             self.current_trial_counter, 
             self.reinforced_trial_counter, # ReinTrialNum
             self.sample_FR, # SampleFR
@@ -1144,36 +732,9 @@ class MainScreen(object):
             "CorrectComparisonGroup", "FoilGroup", "Date", "ComparisonTrialTime"] # Column headers
         
         
-    def write_comp_data(self, SessionEnded):
-        # The following function creates a .csv data document. It is either 
-        # called after each trial during the ITI (SessionEnded ==False) or 
-        # one the session finishes (SessionEnded). If the first time the 
-        # function is called, it will produce a new .csv out of the
-        # session_data_matrix variable, named after the subject, date, and
-        # training phase. Consecutive iterations of the function will simply
-        # write over the existing document.
-        if SessionEnded:
-            self.write_data(None, "SessionEnds") # Writes end of session to df
-        if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
-            myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P035b_data-Phase{self.exp_phase_num}.csv" # location of written .csv
-            
-            # This loop writes the data in the matrix to the .csv              
-            edit_myFile = open(myFile_loc, 'w', newline='')
-            with edit_myFile as myFile:
-                w = writer(myFile, quoting=QUOTE_MINIMAL)
-                w.writerows(self.session_data_frame) # Write all event/trial data 
-                
-            print(f"\n- Data file written to {myFile_loc}")
-
 #%% Finally, this is the code that actually runs:
-try:   
-    if __name__ == '__main__':
-        cp = ExperimenterControlPanel()
-except:
-    # If an unexpected error, make sure to clean up the GPIO board
-    if operant_box_version:
-        rpi_board.set_PWM_dutycycle(servo_GPIO_num,
-                                    False)
-        rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                    False)
-        rpi_board.stop()
+def main():
+    run_program(lambda: ExperimenterControlPanel(MainScreen))
+
+if __name__ == '__main__':
+    main()
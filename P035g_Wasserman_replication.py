@@ -48,213 +48,22 @@ trained with differential reinforcement to explicitly learn sample-comparison ma
 # along with python, or other files within this folder (like control_panel or 
 # maestro).
 # =============================================================================
-from csv import writer, QUOTE_MINIMAL, DictReader
-from datetime import datetime, timedelta, date
-from sys import setrecursionlimit, path as sys_path
-from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
-     StringVar, OptionMenu, IntVar, Radiobutton
-from time import time, sleep
-from os import getcwd, popen, mkdir, listdir, path as os_path
+from datetime import datetime, date
+from p035.engine import operant_box_version, TaskScreen, \
+     ExperimenterControlPanel, run_program, hopper_up, hopper_down, \
+     house_light_on
+from p035.stimulus_cache import StimulusCache
+from p035.stimulus_manifest import load_manifest
+from p035.console import console, DEBUG
+from p035.schedule import NoRepeatPool, spaced_interleave
+from os import path as os_path
 from random import choice, shuffle
-from PIL import ImageTk, Image  
 
-# The first variable declared is whether the program is the operant box version
-# for pigeons, or the test version for humans to view. The variable below is 
-# a T/F boolean that will be referenced many times throughout the program 
-# when the two options differ (for example, when the Hopper is accessed or
-# for onscreen text, etc.). It is changed automatically based on whether
-# the program is running in operant boxes (True) or not (False). It is
-# automatically set to True if the user is "blaisdelllab" (e.g., running
-# on a rapberry pi) or False if not. The output of os_path.expanduser('~')
-# should be "/home/blaisdelllab" on the RPis.
+# Whether this is running in an operant box (operant_box_version), the box's
+# hardware, the experimenter control panel, and everything else that the P035
+# programs have in common are in the shared engine (p035/engine.py). This
+# program only declares what is particular to its own task.
 
-if os_path.expanduser('~').split("/")[2] =="blaisdelllab":
-    operant_box_version = True
-    print("*** Running operant box version *** \n")
-else:
-    operant_box_version = False
-    print("*** Running test version (no hardware) *** \n")
-
-# Import hopper/other specific libraries from files on operant box computers
-try:
-    if operant_box_version:
-        # Import additional libraries...
-        import pigpio # import pi, OUTPUT
-        import csv
-        #...including art scripts
-        sys_path.insert(0, str(os_path.expanduser('~')+"/Desktop/Experiments/P033/"))
-        import graph
-        import polygon_fill
-        
-        # Setup GPIO numbers (NOT PINS; gpio only compatible with GPIO num)
-        servo_GPIO_num = 2
-        hopper_light_GPIO_num = 13
-        house_light_GPIO_num = 21
-        
-        # Setup use of pi()
-        rpi_board = pigpio.pi()
-        
-        # Then set each pin to output 
-        rpi_board.set_mode(servo_GPIO_num,
-                           pigpio.OUTPUT) # Servo motor...
-        rpi_board.set_mode(hopper_light_GPIO_num,
-                           pigpio.OUTPUT) # Hopper light LED...
-        rpi_board.set_mode(house_light_GPIO_num,
-                           pigpio.OUTPUT) # House light LED...
-        
-        # Setup the servo motor 
-        rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                    50) # Default frequency is 50 MhZ
-        
-        # Next grab the up/down 
-        hopper_vals_csv_path = str(os_path.expanduser('~')+"/Desktop/Box_Info/Hopper_vals.csv")
-        
-        # Store the proper UP/DOWN values for the hopper from csv file
-        up_down_table = list(csv.reader(open(hopper_vals_csv_path)))
-        hopper_up_val = up_down_table[1][0]
-        hopper_down_val = up_down_table[1][1]
-        
-        # Lastly, run the shell script that maps the touchscreen to operant box monitor
-        popen("sh /home/blaisdelllab/Desktop/Hardware_Code/map_touchscreen.sh")
-                             
-        
-except ModuleNotFoundError:
-    input("ERROR: Cannot find hopper hardware! Check desktop.")
-
-# Below  is just a safety measure to prevent too many recursive loops). It
-# doesn't need to be changed.
-setrecursionlimit(5000) 
-
-"""
-The code below jumpstarts the loop by first building the hopper object and 
-making sure everything is turned off, then passes that object to the
-control_panel. The program is largely recursive and self-contained within each
-object, and a macro-level overview is:
-    
-    ControlPanel -----------> MainScreen ------------> PaintProgram
-         |                        |                         |
-    Collects main           Runs the actual         Gets passed subject
-    variables, passes      experiment, saves        name, but operates
-    to Mainscreen          data when exited          independently
-    
-
-"""
-
-# The first of two objects we declare is the ExperimentalControlPanel (CP). It
-# exists "behind the scenes" throughout the entire session, and if it is exited,
-# the session will terminate.
-class ExperimenterControlPanel(object):
-    # The init function declares the inherent variables within that object
-    # (meaning that they don't require any input).
-    def __init__(self):
-        # First, setup the data directory in "Documents"
-        self.doc_directory = str(os_path.expanduser('~'))+"/Documents/"
-        # Next up, we need to do a couple things that will be different based
-        # on whether the program is being run in the operant boxes or on a 
-        # personal computer. These include setting up the hopper object so it 
-        # can be referenced in the future, or the location where data files
-        # should be stored.
-        if operant_box_version:
-            # Setup the data directory in "Documents"
-            self.data_folder = "P035_data" # The folder within Documents where subject data is kept
-            self.data_folder_directory = str(os_path.expanduser('~'))+"/Desktop/Data/" + self.data_folder
-        else: # If not, just save in the current directory the program us being run in 
-            self.data_folder_directory = getcwd() + "/data"
-        
-        # setup the root Tkinter window
-        self.control_window = Tk()
-        self.control_window.title("P035g Control Panel")
-        ##  Next, setup variables within the control panel
-        # Subject ID
-        self.pigeon_name_list = ["Bowser", "Yoshi", "Shy Guy", "Athena",
-                                 "Darwin","Cousteau",
-                                 "Bon Jovi"]
-        self.pigeon_name_list.sort() # This alphabetizes the list
-        self.pigeon_name_list.insert(0, "TEST")
-        
-        Label(self.control_window, text="Pigeon Name:").pack()
-        self.subject_ID_variable = StringVar(self.control_window)
-        self.subject_ID_variable.set("Subject")
-        self.subject_ID_menu = OptionMenu(self.control_window,
-                                          self.subject_ID_variable,
-                                          *self.pigeon_name_list,
-                                          command=self.set_pigeon_ID).pack()
-
-        
-        # Exp phases
-        self.experimental_phase_titles = [
-            "Phase 1.i (Acclimation: S01–S08 / C01–C08)",
-            "Phase 1.ii (Acclimation: S09–S16 / C09–C16)",
-            "Phase 2 (Unsupervised Training)",
-            "Phase 3 (Testing Session)",
-            "Phase 4 (Supervised Training)"
-        ]
-        
-        Label(self.control_window, text="Experimental Phase:").pack()
-        self.exp_phase_variable = StringVar(self.control_window)
-        self.exp_phase_variable.set("Select")
-        self.exp_phase_menu = OptionMenu(self.control_window,
-                                          self.exp_phase_variable,
-                                          *self.experimental_phase_titles
-                                          ).pack()
-        
-        # Record data variable?
-        Label(self.control_window,
-              text = "Record data in seperate data sheet?").pack()
-        self.record_data_variable = IntVar()
-        self.record_data_rad_button1 =  Radiobutton(self.control_window,
-                                   variable = self.record_data_variable, text = "Yes",
-                                   value = True).pack()
-        self.record_data_rad_button2 = Radiobutton(self.control_window,
-                                  variable = self.record_data_variable, text = "No",
-                                  value = False).pack()
-        self.record_data_variable.set(True) # Default set to True
-        
-        
-        # Start button
-        self.start_button = Button(self.control_window,
-                                   text = 'Start program',
-                                   bg = "green2",
-                                   command = self.build_chamber_screen).pack()
-        
-        # This makes sure that the control panel remains onscreen until exited
-        self.control_window.mainloop() # This loops around the CP object
-        
-        
-    def set_pigeon_ID(self, pigeon_name):
-        # First, ensure the main data directory exists
-        if not os_path.isdir(self.data_folder_directory):
-            mkdir(self.data_folder_directory)
-    
-        # Then check and create the subfolder for the specific pigeon
-        pigeon_path = os_path.join(self.data_folder_directory, pigeon_name)
-        if not os_path.isdir(pigeon_path):
-            mkdir(pigeon_path)
-            print(f"\n ** NEW DATA FOLDER FOR {pigeon_name.upper()} CREATED **")
-        else:
-            print(f"DATA FOLDER FOR {pigeon_name.upper()} EXISTS")
-
-                
-                
-    def build_chamber_screen(self):
-        # Once the green "start program" button is pressed, then the mainscreen
-        # object is created and pops up in a new window. It gets passed the
-        # important inputs from the control panel.
-        if self.subject_ID_variable.get() in self.pigeon_name_list:
-            if self.exp_phase_variable.get() != "Select":
-                print("Operant Box Screen Built") 
-                self.MS = MainScreen(
-                    str(self.subject_ID_variable.get()),
-                    self.record_data_variable.get(),
-                    self.data_folder_directory,
-                    self.exp_phase_variable.get(),
-                    self.experimental_phase_titles.index(self.exp_phase_variable.get())
-                )
-            else:
-                print("\n ERROR: Input Stimulus Set Before Starting Session")
-        else:
-            print("\n ERROR: Input Correct Pigeon ID Before Starting Session")
-            
 
 # Then, setup the MainScreen object
 # This is where we set up our experiment, really 
@@ -262,10 +71,19 @@ class ExperimenterControlPanel(object):
 #let's first set up the familiarization phase (Phase 1)
 
 
-class MainScreen(object):
+class MainScreen(TaskScreen):
     # First, we need to declare several functions that are 
     # called within the initial __init__() function that is 
     # run when the object is first built:
+    # What sets this task apart (everything else is in p035.engine.TaskScreen)
+    task_code = "P035g"
+    experimental_phase_titles = ["Phase 1.i (Acclimation: S01–S08 / C01–C08)",
+                                 "Phase 1.ii (Acclimation: S09–S16 / C09–C16)",
+                                 "Phase 2 (Unsupervised Training)",
+                                 "Phase 3 (Testing Session)",
+                                 "Phase 4 (Supervised Training)"]
+    # What build_schedule() sets (the trial order)
+    schedule_attributes = ["max_trials", "stimuli_assignment_dict"]
     
     def __init__(self, subject_ID, record_data, data_folder_directory,
                  exp_phase_name, exp_phase_num):
@@ -300,41 +118,8 @@ class MainScreen(object):
         self.subject_ID = subject_ID
         self.record_data = record_data
         
-        ## Set up the visual Canvas
-        self.root = Toplevel() 
-        self.root.title(f"P035g {self.exp_phase_name}: ") # this is the title of the window
-        self.mainscreen_height = 768 # height of the experimental canvas screen
-        self.mainscreen_width = 1024 # width of the experimental canvas screen
-        self.root.bind("<Escape>", self.exit_program) # bind exit program to the "esc" key
-        
-        # If the version is the one running in the boxes...
-        if operant_box_version: 
-            # Keybind relevant keys
-            self.cursor_visible = True # Cursor starts on...
-            self.change_cursor_state() # turn off cursor UNCOMMENT
-            self.root.bind("<c>",
-                           lambda event: self.change_cursor_state()) # bind cursor on/off state to "c" key
-            # Then fullscreen (on a 1024x768p screen). Assumes that both screens
-            # that are being used have identical dimensions
-            # Set geometry before showing window
-            self.root.geometry(f"{self.mainscreen_width}x{self.mainscreen_height}+1920+0")
-            self.root.attributes('-fullscreen', 
-                                 True)
-            self.mastercanvas = Canvas(self.root,
-                                   bg="black")
-            self.mastercanvas.pack(fill = BOTH,
-                                   expand = True)
-            # House light state tracking (prevents AttributeError)
-            self.light_HL_on_bool = False
-
-        # If we want to run a "human-friendly" version
-        else: 
-            # No keybinds and  1024x768p fixed window
-            self.mastercanvas = Canvas(self.root,
-                                   bg="black",
-                                   height=self.mainscreen_height,
-                                   width = self.mainscreen_width)
-            self.mastercanvas.pack()
+        ## Set up the visual Canvas (and the session clock and scheduler)
+        self.build_screen(f"P035g {self.exp_phase_name}: ")
         
         self.start_time = datetime.now()  # This will be reset once the session actually starts
         self.trial_start = None # Duration into each trial as a second count, resets each trial
@@ -374,7 +159,6 @@ class MainScreen(object):
             self.comparison_location = "NA"
 
         # These are additional "under the hood" variables that need to be declared
-        self.session_data_frame = [] #This where trial-by-trial data is stored
         self.trial_stage = 0 # This tracks the stage within the trial
         self.current_trial_counter = 0 # This counts the number of trials that have passed
       
@@ -401,7 +185,7 @@ class MainScreen(object):
                 "Date"
         ]
     
-        self.session_data_frame.append(header_list) # First row of matrix is the column headers
+        self.start_data(header_list) # First row of the data is the column headers
         self.date = date.today().strftime("%y-%m-%d")
         self.myFile_loc = 'FILL' # To be filled later on after Pig. ID is provided (in set vars func below)
         
@@ -423,32 +207,30 @@ class MainScreen(object):
         
         self.stimuli_path = os_path.join(base_path, "P035g_stimuli")
         
-        # Load stimuli from one folder
-        all_files = sorted([f for f in listdir(self.stimuli_path) if f.lower().endswith(".bmp")])
+        # Load stimuli from one folder (via its manifest, which already has
+        # each image's type and number; see p035.stimulus_manifest)
+        stimuli_manifest = load_manifest(self.stimuli_path)
+        all_files = sorted(stimuli_manifest.names())
         
         # Split into samples vs comparisons by filename prefix
-        self.sample_files = sorted([f for f in all_files if f.upper().startswith("S")])
-        self.comparison_files = sorted([f for f in all_files if f.upper().startswith("C")])
+        self.sample_files = sorted(stimuli_manifest.names("S"))
+        self.comparison_files = sorted(stimuli_manifest.names("C"))
         
         assert len(self.sample_files) == 16, f"Need 16 sample stimuli (S##.bmp), found {len(self.sample_files)}: {self.sample_files}"
         assert len(self.comparison_files) == 16, f"Need 16 comparison stimuli (C##.bmp), found {len(self.comparison_files)}: {self.comparison_files}"
                
          # Pair map: S01->C01, S02->C02, etc.
-        def stim_num(fname):
-            # "S01.bmp" -> 1
-            return int(fname[1:3])
-        
         self.pair_map = {}
         for s in self.sample_files:
-            n = stim_num(s)
-            c_match = f"C{str(n).zfill(2)}.bmp"
-            if c_match not in self.comparison_files:
-                raise ValueError(f"Missing comparison for {s}: expected {c_match}")
+            n = stimuli_manifest[s]["pair_num"] # "S01.bmp" -> 1
+            c_match = stimuli_manifest.find("C", n)
+            if c_match is None:
+                raise ValueError(f"Missing comparison for {s}: expected C{str(n).zfill(2)}.bmp")
             self.pair_map[s] = c_match
         
-        print("Loaded samples:", self.sample_files)
-        print("Loaded comparisons:", self.comparison_files)
-        print("Pair map:", self.pair_map)
+        console.debug("Loaded samples:", self.sample_files)
+        console.debug("Loaded comparisons:", self.comparison_files)
+        console.debug("Pair map:", self.pair_map)
         
         # ---------------------------------------------------------
         # DE-group split (Phase 2–3 uses only 8 pairs; Phase 4 returns the other 8)
@@ -469,9 +251,27 @@ class MainScreen(object):
         self.phase23_comps = [self.pair_map[s] for s in self.phase23_samples]
         self.withheld_comps = [self.pair_map[s] for s in self.withheld_samples]
         
-        print("\nDE split:")
-        print(" Phase2–3 samples:", self.phase23_samples)
-        print(" Withheld samples:", self.withheld_samples)
+        console.debug("\nDE split:")
+        console.debug(" Phase2–3 samples:", self.phase23_samples)
+        console.debug(" Withheld samples:", self.withheld_samples)
+        
+        ## Build the trial order (unless this session's order was generated
+        # ahead of time; see p035.session_schedules)
+        if not self.load_precompiled_schedule():
+            self.build_schedule()
+
+        ## Decode every stimulus used in this session ahead of time, so that
+        # nothing needs to be read from the disk on each peck
+        self.stimulus_cache = StimulusCache()
+        self.stimulus_cache.preload([self.stimuli_path],
+                                    self.stimuli_assignment_dict)
+        
+        ## Finally, start the recursive loop that runs the program:
+        self.place_birds_in_box()
+    
+    def build_schedule(self):
+        # The order of the session's trials (and their stimuli), built at
+        # random. Its results are the schedule_attributes above.
         
         # Always initialize, so later code never crashes
         self.stimuli_assignment_dict = {}
@@ -485,32 +285,6 @@ class MainScreen(object):
         
         self.draw_vr5_bounded_3_10 = draw_vr5_bounded_3_10
         
-        def interleave_with_spacing(train_trials, probe_trials, min_train_between_probes=1):
-            train = train_trials.copy()
-            probe = probe_trials.copy()
-            shuffle(train)
-            shuffle(probe)
-        
-            out = []
-            train_since_probe = min_train_between_probes
-        
-            while train or probe:
-                can_take_probe = bool(probe) and train_since_probe >= min_train_between_probes
-                can_take_train = bool(train)
-        
-                if can_take_probe and (not can_take_train or choice([True, False])):
-                    out.append(probe.pop())
-                    train_since_probe = 0
-                elif can_take_train:
-                    out.append(train.pop())
-                    train_since_probe += 1
-                else:
-                    # fallback only if probes remain
-                    out.append(probe.pop())
-                    train_since_probe = 0
-        
-            return out
-        
         def build_counterbalanced_train_trials(samples, n_blocks, pair_map):
             """
             Build n_blocks of training trials where each block contains each sample once.
@@ -581,11 +355,13 @@ class MainScreen(object):
             return isinstance(fname, str) and fname.upper().startswith("C")
         
         def pretty_print_trial_order(phase_num, trials_dict):
+            if not console.enabled(DEBUG): # (the schedule isn't shown)
+                return
             if not trials_dict:
-                print("NOTE: stimuli_assignment_dict not built for this phase yet.")
+                console.debug("NOTE: stimuli_assignment_dict not built for this phase yet.")
                 return
         
-            print("\n" + "="*72)
+            console.debug("\n" + "="*72)
             # nicer label (so 0/1 show as Phase 1.i / 1.ii, etc.)
             phase_labels = {
                 0: "Phase 1.i (Acclimation: S01–S08 / C01–C08)",
@@ -594,11 +370,11 @@ class MainScreen(object):
                 3: "Phase 3 (Testing Session)",
                 4: "Phase 4 (Supervised Training)"
             }
-            print(f"TRIAL ORDER PREVIEW ({phase_labels.get(phase_num, f'Phase {phase_num}')})")
+            console.debug(f"TRIAL ORDER PREVIEW ({phase_labels.get(phase_num, f'Phase {phase_num}')})")
             
             if phase_num == 3:
-                print("NOTE: In Phase 3 (Testing Session), '*' indicates a TEST/PROBE trial.")
-            print("="*72)
+                console.debug("NOTE: In Phase 3 (Testing Session), '*' indicates a TEST/PROBE trial.")
+            console.debug("="*72)
         
             for tn in sorted(trials_dict.keys()):
                 tr = trials_dict[tn]
@@ -624,7 +400,7 @@ class MainScreen(object):
                     else:
                         line = f"Trial {tn:>3}{star}: UNKNOWN {stim}  (side={side})"
         
-                    print(line)
+                    console.debug(line)
                     
                     continue
         
@@ -636,7 +412,7 @@ class MainScreen(object):
                     c = tr.get("single_comp", "NA")
                     side = tr.get("single_side", "NA")
         
-                    print(f"Trial {tn:>3}{star}: TRAIN  S={s}  ->  C={c}  (side={side})")
+                    console.debug(f"Trial {tn:>3}{star}: TRAIN  S={s}  ->  C={c}  (side={side})")
                     continue
         
                 # -------------------------
@@ -648,7 +424,7 @@ class MainScreen(object):
                     if ttype == "train":
                         c = tr.get("single_comp", "NA")
                         side = tr.get("single_side", "NA")
-                        print(f"Trial {tn:>3}{star}: TRAIN  S={s}  ->  C={c}  (side={side})")
+                        console.debug(f"Trial {tn:>3}{star}: TRAIN  S={s}  ->  C={c}  (side={side})")
         
                     elif ttype == "test":
                         L = tr.get("left_comp", "NA")
@@ -657,12 +433,12 @@ class MainScreen(object):
                         foil = tr.get("foil_comp", "NA")
         
                         # sanity check: label them as comps if they start with C
-                        print(
+                        console.debug(
                             f"Trial {tn:>3}{star}: TEST   S={s}  |  L={L}  R={R}  "
                             f"|  correct={correct}  foil={foil}"
                         )
                     else:
-                        print(f"Trial {tn:>3}{star}: UNKNOWN_TTYPE={ttype}  raw={tr}")
+                        console.debug(f"Trial {tn:>3}{star}: UNKNOWN_TTYPE={ttype}  raw={tr}")
                     continue
         
                 # -------------------------
@@ -678,14 +454,14 @@ class MainScreen(object):
                     if correct != "NA" and L != "NA" and R != "NA":
                         foil = R if L == correct else L
         
-                    print(
+                    console.debug(
                         f"Trial {tn:>3}{star}: SUP    S={s}  |  L={L}  R={R}  "
                         f"|  correct={correct}  foil={foil}"
                     )
                     continue
         
                 # Fallback for unexpected phases
-                print(f"Trial {tn:>3}{star}: {ttype}  raw={tr}")
+                console.debug(f"Trial {tn:>3}{star}: {ttype}  raw={tr}")
             
         if self.exp_phase_num in [0, 1]:
             self.max_trials = 160
@@ -757,17 +533,14 @@ class MainScreen(object):
             probe_sample_seq = cycle_shuffle(self.phase23_samples, 32)  # 8-sample cycles
             
             # Optional: make foil selection cycle-y too (per sample), so foils aren’t overly repetitive
-            foil_pools = {s: [] for s in self.phase23_samples}
+            # (each sample's pool is a shuffled cycle of the 7 allowed foils)
+            foil_pools = {s: NoRepeatPool([c for c in self.phase23_comps if c != self.pair_map[s]])
+                          for s in self.phase23_samples}
             
             for s in probe_sample_seq:
                 correct = self.pair_map[s]
             
-                # Build/refill that sample's foil pool as a shuffled cycle of the 7 allowed foils
-                if len(foil_pools[s]) == 0:
-                    foil_pools[s] = [c for c in self.phase23_comps if c != correct]
-                    shuffle(foil_pools[s])
-            
-                foil = foil_pools[s].pop()  # no-repeat foils (within that sample) until exhausted
+                foil = foil_pools[s].draw()  # no-repeat foils (within that sample) until exhausted
             
                 # randomize left/right positions
                 if choice([True, False]):
@@ -785,7 +558,7 @@ class MainScreen(object):
                     "foil_comp": foil
                 })
             # --- 4) pseudorandomize remaining (112 train + 28 probe) ---
-            remaining = interleave_with_spacing(train112, probe32, min_train_between_probes=1)
+            remaining = spaced_interleave(train112, probe32, min_gap=1)  # probes never back to back
             trials = first16 + remaining
             
             self.stimuli_assignment_dict = {i+1: tr for i, tr in enumerate(trials)}
@@ -801,8 +574,9 @@ class MainScreen(object):
             comps_A = self.comparison_files[:8]   # C01–C08
             comps_B = self.comparison_files[8:]   # C09–C16
         
-            # Separate foil pools so you never cross families
-            foil_pools = {"A": [], "B": []}
+            # Separate foil pools so you never cross families (each a full
+            # shuffled cycle of that family, see p035.schedule)
+            foil_pools = {"A": NoRepeatPool(comps_A), "B": NoRepeatPool(comps_B)}
         
             def comp_family(correct_comp):
                 # correct_comp like "C03.bmp" or "C12.bmp"
@@ -810,21 +584,8 @@ class MainScreen(object):
                 return "A" if n <= 8 else "B"
         
             def get_next_foil(correct):
-                fam = comp_family(correct)
-        
-                # refill that family pool as a full shuffled cycle
-                if len(foil_pools[fam]) == 0:
-                    foil_pools[fam] = (comps_A.copy() if fam == "A" else comps_B.copy())
-                    shuffle(foil_pools[fam])
-        
-                # pull until not the correct comp
-                for _ in range(len(foil_pools[fam])):
-                    f = foil_pools[fam].pop()
-                    if f != correct:
-                        return f
-        
-                # fallback (shouldn't happen)
-                return choice([c for c in (comps_A if fam == "A" else comps_B) if c != correct])
+                # the next foil of that family's cycle that isn't the correct comp
+                return foil_pools[comp_family(correct)].draw(excluded={correct})
         
             trials = []
             for _ in range(7):  # 7 blocks × 16 = 112
@@ -857,56 +618,18 @@ class MainScreen(object):
             self.stimuli_assignment_dict = {i+1: tr for i, tr in enumerate(trials)}
             pretty_print_trial_order(self.exp_phase_num, self.stimuli_assignment_dict)
 
-
-        ## Finally, start the recursive loop that runs the program:
-        self.place_birds_in_box()
-    
-    def place_birds_in_box(self):
-        # Default screen until birds are placed into the box and space bar is pressed.
-        # After spacebar, the first ITI occurs prior to the first trial.
-        self.root.bind("<space>", self.first_ITI)
-        self.mastercanvas.create_text(
-            512, 384,
-            fill="white",
-            font="Times 26 italic bold",
-            text=(f"P035g \n Place bird in box, then press space \n "
-                  f"Subject: {self.subject_ID} \n Phase: {self.exp_phase_name}")
-        )
-    
-    def first_ITI(self, event):
-        print("Spacebar pressed -- SESSION STARTED")
-        self.root.unbind("<space>")
-        self.clear_canvas()
-        self.trial_stage = 0
-        self.start_time = datetime.now()  # actual session start
-    
-        if not operant_box_version or self.subject_ID == "TEST":
-            self.ITI_duration = 1 * 1000
-            self.root.after(1, lambda: self.ITI())
-        else:
-            self.root.after(30000, lambda: self.ITI())
-    
-    # Orienting stimulus phase
-    
     def orienting_phase(self):
         
         self.clear_canvas()
         self.trial_stage = 0
     
         # House light on during trial phases
-        if operant_box_version and not self.light_HL_on_bool:
-            rpi_board.write(house_light_GPIO_num, True)
+        if not self.light_HL_on_bool:
+            house_light_on() # Turn on the houselight
             self.light_HL_on_bool = True
     
         # Background pecks
-        self.mastercanvas.create_rectangle(
-            0, 0, self.mainscreen_width, self.mainscreen_height,
-            fill="black", outline="black", tag="bkgrd"
-        )
-        self.mastercanvas.tag_bind(
-            "bkgrd", "<Button-1>",
-            lambda event, event_type="background_peck": self.write_data(event, event_type)
-        )
+        self.scene.show_background()
     
         # Center white square orienting stimulus
         x, y = 512, 384
@@ -932,23 +655,16 @@ class MainScreen(object):
         self.trial_stage = 1
     
         # House light on during trial phases
-        if operant_box_version and not self.light_HL_on_bool:
-            rpi_board.write(house_light_GPIO_num, True)
+        if not self.light_HL_on_bool:
+            house_light_on() # Turn on the houselight
             self.light_HL_on_bool = True
     
         # Background pecks
-        self.mastercanvas.create_rectangle(
-            0, 0, self.mainscreen_width, self.mainscreen_height,
-            fill="black", outline="black", tag="bkgrd"
-        )
-        self.mastercanvas.tag_bind(
-            "bkgrd", "<Button-1>",
-            lambda event, event_type="background_peck": self.write_data(event, event_type)
-        )
+        self.scene.show_background()
     
         trial_info = self.stimuli_assignment_dict.get(self.current_trial_counter, None)
         if trial_info is None:
-            print(f"ERROR: No trial info for trial {self.current_trial_counter}. Ending session.")
+            console.warning(f"ERROR: No trial info for trial {self.current_trial_counter}. Ending session.")
             self.exit_program("event")
             return
 
@@ -988,8 +704,7 @@ class MainScreen(object):
             self.sample_name = stim_name
 
         # Load and display sample image
-        selected_image = Image.open(stim_path)
-        self.image = ImageTk.PhotoImage(selected_image)
+        self.image = self.stimulus_cache.get(stim_path)
         
         # -------------------------------------------------
         # Coordinates:
@@ -1001,16 +716,7 @@ class MainScreen(object):
                 y = 460
         # else: keep x,y already computed in Phase 1 logic
         
-        oval_radius = 85
-        self.mastercanvas.create_oval(
-            x - oval_radius, y - oval_radius,
-            x + oval_radius, y + oval_radius,
-            fill="black", tag="sample_button"
-        )
-        self.mastercanvas.create_image(
-            x, y, image=self.image, anchor="center", tag="sample_button"
-        )
-        self.mastercanvas.tag_bind("sample_button", "<Button-1>", self.sample_key_press)
+        self.scene.show_key("sample_button", self.image, x, y, self.sample_key_press)
 
     
     def sample_key_press(self, event):
@@ -1041,22 +747,15 @@ class MainScreen(object):
     
         # Track trial start for this stage
         if self.current_trial_counter != self.last_written_trial_num:
-            self.comparison_start_time = datetime.now()
+            self.comparison_start_time = self.clock.now()
             self.last_written_trial_num = self.current_trial_counter
     
         # Background pecks
-        self.mastercanvas.create_rectangle(
-            0, 0, self.mainscreen_width, self.mainscreen_height,
-            fill="black", outline="black", tag="bkgrd"
-        )
-        self.mastercanvas.tag_bind(
-            "bkgrd", "<Button-1>",
-            lambda event, event_type="background_peck": self.write_data(event, event_type)
-        )
+        self.scene.show_background()
     
         trial = self.stimuli_assignment_dict.get(self.current_trial_counter, None)
         if trial is None:
-            print(f"ERROR: No trial dict for trial {self.current_trial_counter}")
+            console.warning(f"ERROR: No trial dict for trial {self.current_trial_counter}")
             self.exit_program("event")
             return
     
@@ -1067,19 +766,12 @@ class MainScreen(object):
         # -------------------------
         left_x, left_y = 160, 550
         right_x, right_y = 864, 550
-        oval_radius = 85
     
-        # Helper to draw a comp key
+        # Helper to show a comp key
         def draw_comp(tag, stim_name, x, y):
-            img = ImageTk.PhotoImage(Image.open(os_path.join(self.stimuli_path, stim_name)))
+            img = self.stimulus_cache.get(os_path.join(self.stimuli_path, stim_name))
             setattr(self, f"{tag}_image", img)  # keep reference
-            self.mastercanvas.create_oval(
-                x - oval_radius, y - oval_radius,
-                x + oval_radius, y + oval_radius,
-                fill="black", tag=tag
-            )
-            self.mastercanvas.create_image(x, y, image=img, anchor="center", tag=tag)
-            self.mastercanvas.tag_bind(tag, "<Button-1>", self.comp_key_press)
+            self.scene.show_key(tag, img, x, y, self.comp_key_press)
     
         # -------------------------
         # PHASE 2: Unsupervised training (single comparison)
@@ -1120,7 +812,7 @@ class MainScreen(object):
                 return
     
             else:
-                print(f"ERROR: Unknown trial_type in Phase 3: {ttype}")
+                console.warning(f"ERROR: Unknown trial_type in Phase 3: {ttype}")
                 self.exit_program("event")
                 return
     
@@ -1140,22 +832,15 @@ class MainScreen(object):
 
     def _draw_inactive_sample(self, sample_name):
         stim_path = os_path.join(self.stimuli_path, sample_name)
-        img = ImageTk.PhotoImage(Image.open(stim_path))
+        img = self.stimulus_cache.get(stim_path)
         self.inactive_sample_image = img  # keep reference
     
         sx, sy = 512, 405
         if self.subject_ID == "Darwin":
             sy = 460
     
-        oval_radius = 85
-        self.mastercanvas.create_oval(
-            sx - oval_radius, sy - oval_radius,
-            sx + oval_radius, sy + oval_radius,
-            fill="black", tag="inactive_sample"
-        )
-        self.mastercanvas.create_image(sx, sy, image=self.inactive_sample_image, anchor="center", tag="inactive_sample")
-        self.mastercanvas.tag_bind(
-            "inactive_sample", "<Button-1>",
+        self.scene.show_key(
+            "inactive_sample", self.inactive_sample_image, sx, sy,
             lambda event, event_type="inactive_sample_key_press": self.write_data(event, event_type)
         )
 
@@ -1205,9 +890,9 @@ class MainScreen(object):
             if getattr(self, "chosen_comp_tag", None) is None:
                 if chosen_side in ("left", "right"):
                     self.chosen_comp_tag = chosen_side  # "left" or "right"
-                    self.choice_lock_time = datetime.now()
+                    self.choice_lock_time = self.clock.stamp(event) # when the locking peck came in
                     if getattr(self, "comparison_start_time", None) is not None:
-                        self.choice_latency = (self.choice_lock_time - self.comparison_start_time).total_seconds()
+                        self.choice_latency = self.clock.seconds_between(self.comparison_start_time, self.choice_lock_time)
                     self.write_data(None, f"choice_locked_{self.chosen_comp_tag}")
                 else:
                     # If somehow we didn't click left/right in a 2-choice trial, ignore
@@ -1222,29 +907,30 @@ class MainScreen(object):
         self.comparison_key_presses += 1
     
         if self.comparison_key_presses >= int(self.comparison_FR):
-            self.choice_complete_time = datetime.now()
+            self.choice_complete_time = self.clock.stamp(event) # when the last required peck came in
             if getattr(self, "choice_lock_time", None) is not None:
-                self.choice_duration = (self.choice_complete_time - self.choice_lock_time).total_seconds()
+                self.choice_duration = self.clock.seconds_between(self.choice_lock_time, self.choice_complete_time)
             self.clear_canvas()
     
             # Decide what happens after meeting the comparison requirement
+            # (the 250 ms delay is timed from the completing peck itself)
             # Phase 2: single comp -> reinforce
             if self.exp_phase_num == 2:
-                self.root.after(250, self.reinforcement_phase)
+                self.scheduler.after(250, self.reinforcement_phase, "post_choice_delay", anchor_ns = self.choice_complete_time)
     
             # Phase 3:
             #   - training trials (single comp) -> reinforce
             #   - test trials (2-choice) -> both choices reinforced
             elif self.exp_phase_num == 3:
-                self.root.after(250, self.reinforcement_phase)
+                self.scheduler.after(250, self.reinforcement_phase, "post_choice_delay", anchor_ns = self.choice_complete_time)
     
             # Phase 4 supervised: after FR on chosen key, check correct vs foil
             elif self.exp_phase_num == 4:
-                self.root.after(250, self._finish_supervised_choice)
+                self.scheduler.after(250, self._finish_supervised_choice, "post_choice_delay", anchor_ns = self.choice_complete_time)
     
             else:
                 # Fallback
-                self.root.after(250, self.reinforcement_phase)
+                self.scheduler.after(250, self.reinforcement_phase, "post_choice_delay", anchor_ns = self.choice_complete_time)
     
         else:
             self.comparison_phase()
@@ -1320,16 +1006,13 @@ class MainScreen(object):
                 text=f"Reinforcement TIME ({int(self.hopper_duration/1000)} s)"
             )
     
-        if operant_box_version:
-            rpi_board.write(house_light_GPIO_num, False)
-            rpi_board.write(hopper_light_GPIO_num, True)
-            rpi_board.set_servo_pulsewidth(servo_GPIO_num, hopper_up_val)
+        hopper_up() # House light off, hopper (and its light) up
     
         # End check
         if self.current_trial_counter == self.max_trials:
-            self.root.after(self.hopper_duration, lambda: self.exit_program("event"))
+            self.scheduler.after(self.hopper_duration, lambda: self.exit_program("event"), "hopper_down")
         else:
-            self.root.after(self.hopper_duration, lambda: self.ITI())
+            self.scheduler.after(self.hopper_duration, lambda: self.ITI(), "hopper_down")
 
     def ITI(self):
     # In this part of a trial, it is ITI
@@ -1362,7 +1045,7 @@ class MainScreen(object):
             return
     
         if self.current_trial_counter == self.max_trials + 1:
-            print("&&& Trial max reached &&&")
+            console.info("&&& Trial max reached &&&")
             self.exit_program("event")
             return
     
@@ -1376,10 +1059,7 @@ class MainScreen(object):
             )
     
         # Hardware off during ITI
-        if operant_box_version:
-            rpi_board.write(hopper_light_GPIO_num, False)
-            rpi_board.set_servo_pulsewidth(servo_GPIO_num, hopper_down_val)
-            rpi_board.write(house_light_GPIO_num, False)
+        hopper_down() # Hopper down and lights off
     
         self.light_HL_on_bool = False
     
@@ -1405,7 +1085,7 @@ class MainScreen(object):
         self.incorrect_comparison_key_presses = 0
         self.sample_key_presses = 0
         self.trial_stage = 0
-        self.trial_start = time()
+        self.trial_start = self.clock.now()
         self.last_written_trial_num = None
         self.comparison_start_time = None
     
@@ -1447,10 +1127,9 @@ class MainScreen(object):
         # ---------------------------------------------------------
         # IMPORTANT: next stage should be orienting_phase, not sample_phase
         # ---------------------------------------------------------
-        self.root.after(self.ITI_duration, self.orienting_phase)
+        self.scheduler.after(self.ITI_duration, self.orienting_phase, "trial_start")
     
-        print(f"\n{'*'*30} Trial {self.current_trial_counter} begins {'*'*30}")
-        print(f"{'Event Type':>30} | Xcord. Ycord. | Stage | Session Time")
+        self.print_trial_header()
     
         # If we were in correction, keep flag True until the bird gets it correct.
         # We DO NOT clear it here.
@@ -1458,74 +1137,6 @@ class MainScreen(object):
         #   in _finish_supervised_choice(): if correct -> self.in_correction = False
 
         
-    def change_cursor_state(self):
-        # This function toggles the cursor state on/off. 
-        # May need to update accessibility settings on your machince.
-        if self.cursor_visible: # If cursor currently on...
-            self.root.config(cursor="none") # Turn off cursor
-            print("### Cursor turned off ###")
-            self.cursor_visible = False
-        else: # If cursor currently off...
-            self.root.config(cursor="") # Turn on cursor
-            print("### Cursor turned on ###")
-            self.cursor_visible = True
-    
-    def clear_canvas(self):
-         # This is by far the most called function across the program. It
-         # deletes all the objects currently on the Canvas. A finer point to 
-         # note here is that objects still exist onscreen if they are covered
-         # up (rendering them invisible and inaccessible); if too many objects
-         # are stacked upon each other, it can may be too difficult to track/
-         # project at once (especially if many of the objects have functions 
-         # tied to them. Therefore, its important to frequently clean up the 
-         # Canvas by literally deleting every element.
-        try:
-            self.mastercanvas.delete("all")
-        except TclError:
-            print("No screen to exit")
-        
-    def exit_program(self, event): 
-        # This function can be called two different ways: automatically (when
-        # time/reinforcer session constraints are reached) or manually (via the
-        # "End Program" button in the control panel or bound "esc" key).
-            
-        # The program does a few different things:
-        #   1) Return hopper to down state, in case session was manually ended
-        #       during reinforcement (it shouldn't be)
-        #   2) Turn cursor back on
-        #   3) Writes compiled data matrix to a .csv file 
-        #   4) Destroys the Canvas object 
-        #   5) Calls the Paint object, which creates an onscreen Paint Canvas.
-        #       In the future, if we aren't using the paint object, we'll need 
-        #       to 
-        def other_exit_funcs():
-            if operant_box_version:
-                rpi_board.write(hopper_light_GPIO_num,
-                                False) # turn off hopper light
-                rpi_board.write(house_light_GPIO_num,
-                                False) # Turn off the house light
-                rpi_board.set_servo_pulsewidth(servo_GPIO_num,
-                                               hopper_down_val) # set hopper to down state
-                sleep(1) # Sleep for 1 s
-                rpi_board.set_PWM_dutycycle(servo_GPIO_num,
-                                            False)
-                rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                            False)
-                rpi_board.stop() # Kill RPi board
-                # root.after_cancel(AFTER)
-                if not self.cursor_visible:
-                	self.change_cursor_state() # turn cursor back on, if applicable
-            self.write_comp_data(True) # write data for end of session
-            if self.root.winfo_exists():  # Check if the window still exists
-                self.root.destroy()  # destroy Canvas
-            print("\n GUI window exited")
-            
-        self.clear_canvas()
-        other_exit_funcs()
-        print("\n You may now exit the terminal and operater windows now.")
-        if operant_box_version:
-            polygon_fill.main(self.subject_ID) # call paint object        
-        
     def write_data(self, event, outcome):
         """
         Event-level logger.
@@ -1550,8 +1161,11 @@ class MainScreen(object):
             x, y = event.x, event.y
         else:
             x, y = "NA", "NA"
+        # When the peck (or other event) came in, on the session clock
+        event_ns = self.clock.stamp(event)
+        session_time = self.clock.session_time(event_ns)
     
-        print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | {self.trial_stage:^5} | {str(datetime.now() - self.start_time)}")
+        self.print_event(outcome, x, y, session_time)
     
         # Grab current trial info safely
         trial_info = self.stimuli_assignment_dict.get(self.current_trial_counter, {})
@@ -1689,11 +1303,11 @@ class MainScreen(object):
         # ---- Trial time (relative to trial_start, keeping your existing logic) ----
         trial_time = "NA"
         if self.trial_start is not None:
-            trial_time = round((time() - self.trial_start - (self.ITI_duration / 1000)), 5)
+            trial_time = round((self.clock.seconds_between(self.trial_start, event_ns) - (self.ITI_duration / 1000)), 5)
     
         # ---- Append row ----
-        self.session_data_frame.append([
-            str(datetime.now() - self.start_time),  # SessionTime
+        self.session_writer.write_row([
+            str(session_time),  # SessionTime
             self.exp_phase,                         # ExpPhase
             self.subject_ID,                        # Subject
             x,                                      # Xcord
@@ -1727,39 +1341,9 @@ class MainScreen(object):
         ])
 
         
-    def write_comp_data(self, SessionEnded):
-        # The following function creates a .csv data document. It is either 
-        # called after each trial during the ITI (SessionEnded ==False) or 
-        # one the session finishes (SessionEnded). If the first time the 
-        # function is called, it will produce a new .csv out of the
-        # session_data_matrix variable, named after the subject, date, and
-        # training phase. Consecutive iterations of the function will simply
-        # write over the existing document.
-        if SessionEnded:
-            self.write_data(None, "SessionEnds") # Writes end of session to df
-        if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
-            subject_folder = f"{self.data_folder_directory}/{self.subject_ID}"
-            if not os_path.isdir(subject_folder):
-                mkdir(subject_folder)
-            myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P035g_data-Phase{self.exp_phase_num}.csv" # location of written .csv
-            
-            # This loop writes the data in the matrix to the .csv              
-            edit_myFile = open(myFile_loc, 'w', newline='')
-            with edit_myFile as myFile:
-                w = writer(myFile, quoting=QUOTE_MINIMAL)
-                w.writerows(self.session_data_frame) # Write all event/trial data 
-                
-            print(f"\n- Data file written to {myFile_loc}")
-
 #%% Finally, this is the code that actually runs:
-try:   
-    if __name__ == '__main__':
-        cp = ExperimenterControlPanel()
-except:
-    # If an unexpected error, make sure to clean up the GPIO board
-    if operant_box_version:
-        rpi_board.set_PWM_dutycycle(servo_GPIO_num,
-                                    False)
-        rpi_board.set_PWM_frequency(servo_GPIO_num,
-                                    False)
-        rpi_board.stop()
+def main():
+    run_program(lambda: ExperimenterControlPanel(MainScreen))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the P035 (FOAM) experiment programs.
+
+Each of the P035 programs in the folder above this one (the FOAM main program,
+P035b through P035g, etc.) can still be run directly as its own script, or
+by name with "python -m p035" (see p035.tasks). The modules in this package
+hold the pieces of code that every one of those programs needs, so that a
+fix only has to be made once; p035.engine holds everything the programs
+have in common apart from their trial stages.
+"""
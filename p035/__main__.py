@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Starts one of the P035 programs by name (see p035.tasks), e.g.:
+
+    python -m p035 FOAM
+"""
+from argparse import ArgumentParser
+from p035.tasks import task_files, load_task
+
+
+def main():
+    parser = ArgumentParser(prog = "python -m p035",
+                            description = "Starts one of the P035 programs.")
+    parser.add_argument("task", nargs = "?", choices = list(task_files),
+                        help = "the program to start (leave out to list them)")
+    args = parser.parse_args()
+    if args.task is None:
+        print("The P035 programs are:")
+        for task, file_name in task_files.items():
+            print(f"  {task:<14}{file_name}")
+        return
+    load_task(args.task).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the P035 programs, run headless (see p035.simulation).
+
+Each phase of each program is run as a simulated session (with synthetic
+pecks, on the virtual clock) in a fresh process of its own, and timed with
+the real clock:
+
+- Setup: loading the program, building its MainScreen (trial orders,
+  stimuli, etc.), and the space bar press that starts the session.
+- Events: how long each peck and each timer (ITI, hopper, etc.) takes to
+  handle, as percentiles.
+- Data: how long write_comp_data takes on the Tk thread (against the number
+  of rows by then), and how long the final drain of the data file takes
+  when the session ends.
+- Hopper: how long the (simulated) hopper was up each time, on the
+  virtual clock (see p035.chamber), to check reinforcement timing.
+- Memory: the peak resident set size of the process.
+
+Stimuli are decoded (with PIL, from the atlas if there is one) just like in a
+real session; only the PhotoImage/Canvas side (which needs a display) is
+left out. A synthetic test of the SessionWriter (how writing and closing the
+data file scales with the number of rows) is run at the end. From the P035
+folder:
+
+    python -m p035.benchmark                # every phase of every program
+    python -m p035.benchmark P035g FOAM     # ...or just some programs
+    python -m p035.benchmark --json benchmark.json
+
+Compare the numbers (or the saved .json) before and after a change, on the
+same computer, to catch regressions before they reach the chambers.
+Like simulations, benchmarks must NOT be run on an operant box computer.
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stderr
+from datetime import datetime, timedelta
+from json import dump
+from multiprocessing import get_context, TimeoutError as PoolTimeoutError
+from os import devnull, path as os_path
+from shutil import rmtree
+from sys import platform
+from tempfile import mkdtemp
+from time import perf_counter, perf_counter_ns
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError: # (not on Windows)
+    getrusage = None
+
+from p035.session_writer import SessionWriter
+from p035.simulation import SimulatedSession, VirtualTimeline, HeadlessCanvas, \
+     HeadlessImage, HeadlessStimulusCache, HeadlessStimulusPrefetcher, \
+     RandomPecker, load_task_module
+from p035.stimulus_atlas import load_stimulus
+from p035.tasks import task_files
+
+# FOAM's phases and subphases, as listed in its control panel. Only the
+# training subphase is benchmarked.
+foam_phases = ["0: Autoshaping",
+               "1: Three Pairs",
+               "2: Six Pairs",
+               "3: Twelve Pairs",
+               "4: Twenty-four Pairs",
+               "5: Forty-Eight Pairs",
+               "6: Ninety-Six Pairs",
+               "7: 192 Pairs"]
+foam_subphases = ["i: Training",
+                  "ii: CBE.1",
+                  "iii: FM.1",
+                  "iv: CBE.2",
+                  "v: FM.2",
+                  "vi: CBE.3",
+                  "vii: FM.3"]
+
+
+def task_phases(task, data_folder):
+    # (phase label, MainScreen arguments) for every phase of a program
+    if task.startswith("FOAM"):
+        return [(phase, ["TEST", True, data_folder, phase, foam_phases,
+                         foam_subphases[0], foam_subphases, "NA", 0, False, "NA", []])
+                for phase in foam_phases]
+    module = load_task_module(task)
+    return [(title, ["TEST", True, data_folder, title, n])
+            for n, title in enumerate(module.MainScreen.experimental_phase_titles)]
+
+
+class TimedTimeline(VirtualTimeline):
+    # Times (with the real clock) every callback it runs, sorted into pecks
+    # and timers
+    def __init__(self):
+        super().__init__()
+        self.peck_ns = []
+        self.timer_ns = []
+        self.pecked = False # Set by TimedCanvas.peck()
+
+    def run_callback(self, callback):
+        self.pecked = False
+        start = perf_counter_ns()
+        super().run_callback(callback)
+        elapsed_ns = perf_counter_ns() - start
+        (self.peck_ns if self.pecked else self.timer_ns).append(elapsed_ns)
+
+
+class TimedCanvas(HeadlessCanvas):
+    def peck(self, x, y, time_ms):
+        self.root.timeline.pecked = True
+        super().peck(x, y, time_ms)
+
+
+# Stimuli are decoded for real (so that setup times include it), but only
+# their size is kept
+class DecodingStimulusCache(HeadlessStimulusCache):
+    def load_image(self, stimulus_path):
+        load_stimulus(stimulus_path)
+        return HeadlessImage(stimulus_path)
+
+
+class DecodingStimulusPrefetcher(HeadlessStimulusPrefetcher):
+    def decode(self, file_name):
+        load_stimulus(os_path.join(self.folder_path, file_name))
+        return super().decode(file_name)
+
+
+class BenchmarkSession(SimulatedSession):
+    timeline_class = TimedTimeline
+    canvas_class = TimedCanvas
+    stimulus_cache_class = DecodingStimulusCache
+    stimulus_prefetcher_class = DecodingStimulusPrefetcher
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.load_seconds = 0
+        self.build_seconds = 0
+        self.start_seconds = 0
+        self.flushes = [] # (rows so far, seconds) for each write_comp_data()
+        self.close_seconds = 0
+
+    def run(self):
+        start = perf_counter()
+        load_task_module(self.script_path) # (only loaded once per process)
+        self.load_seconds = perf_counter() - start
+        return super().run()
+
+    def build_main_screen(self, module):
+        start = perf_counter()
+        main_screen = super().build_main_screen(module)
+        self.build_seconds = perf_counter() - start
+
+        # Time the data writes too
+        write_comp_data = main_screen.write_comp_data
+        def timed_write_comp_data(SessionEnded):
+            start = perf_counter()
+            write_comp_data(SessionEnded)
+            self.flushes.append((len(main_screen.session_data_frame),
+                                 perf_counter() - start))
+        main_screen.write_comp_data = timed_write_comp_data
+
+        close = main_screen.session_writer.close
+        def timed_close(*args, **kwargs):
+            start = perf_counter()
+            close(*args, **kwargs)
+            self.close_seconds += perf_counter() - start
+        main_screen.session_writer.close = timed_close
+        return main_screen
+
+    def start_session(self):
+        start = perf_counter()
+        super().start_session()
+        self.start_seconds = perf_counter() - start
+
+
+def percentiles_ms(values_ns, fractions = (0.5, 0.9, 0.99, 1)):
+    # Nearest-rank percentiles, in ms
+    if not values_ns:
+        return [None for fraction in fractions]
+    values_ns = sorted(values_ns)
+    return [values_ns[max(0, min(len(values_ns) - 1, int(round(fraction * len(values_ns))) - 1))] / 1e6
+            for fraction in fractions]
+
+
+def peak_rss_mb():
+    if getrusage is None:
+        return None
+    max_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    # (kB on Linux, bytes on macOS)
+    return max_rss / (1024 * 1024 if platform == "darwin" else 1024)
+
+
+def benchmark_phase(task, phase_label, mainscreen_args, n_sessions, seed):
+    # Run in a process of its own (see main()), so that the peak memory
+    # use is this phase's alone. Errors in the program's callbacks are only
+    # counted (the simulation would print each one).
+    results = {"task": task, "phase": phase_label, "sessions": n_sessions}
+    sessions = []
+    with open(devnull, "w") as sink, redirect_stderr(sink):
+        for n in range(n_sessions):
+            session = BenchmarkSession(task, mainscreen_args, seed = seed + n,
+                                       pecker = RandomPecker(seed + n),
+                                       start_datetime = datetime(2000, 1, 1, 9, 0, 0) + timedelta(days = n))
+            sessions.append(session.run())
+    peck_ns = [t for session in sessions for t in session.timeline.peck_ns]
+    timer_ns = [t for session in sessions for t in session.timeline.timer_ns]
+    flushes = [flush for session in sessions for flush in session.flushes]
+    hopper_ns = [t for session in sessions for t in session.chamber.hopper_durations_ns]
+    results.update({
+        "load_ms": sessions[0].load_seconds * 1e3,
+        "build_ms": sum(s.build_seconds for s in sessions) / n_sessions * 1e3,
+        "start_ms": sum(s.start_seconds for s in sessions) / n_sessions * 1e3,
+        "rows": sum(len(s.main_screen.session_data_frame) for s in sessions) // n_sessions,
+        "callback_errors": sum(s.timeline.callback_errors for s in sessions),
+        "pecks": len(peck_ns),
+        "peck_ms": percentiles_ms(peck_ns),
+        "timers": len(timer_ns),
+        "timer_ms": percentiles_ms(timer_ns),
+        "flushes": len(flushes),
+        "flush_ms": percentiles_ms([seconds * 1e9 for rows, seconds in flushes]),
+        "close_ms": sum(s.close_seconds for s in sessions) / n_sessions * 1e3,
+        "reinforcements": len(hopper_ns),
+        "hopper_ms": percentiles_ms(hopper_ns, (0, 0.5, 1)),
+        "peak_rss_mb": peak_rss_mb()})
+    return results
+
+
+def benchmark_session_writer(row_counts, n_columns = 20):
+    # How writing and closing a data file scales with the number of rows
+    # (a "row" here is n_columns short strings, like a session's rows)
+    results = []
+    data_folder = mkdtemp(prefix = "p035_benchmark_")
+    try:
+        for n_rows in row_counts:
+            session_data_frame = [[f"column_{c}" for c in range(n_columns)]]
+            session_writer = SessionWriter(session_data_frame)
+            row = [f"{c}.000" for c in range(n_columns)]
+            start = perf_counter()
+            for n in range(n_rows):
+                session_writer.write_row(list(row))
+                if n % 50 == 0: # (about one flush per trial)
+                    session_writer.flush(os_path.join(data_folder, f"{n_rows}.csv"))
+            write_seconds = perf_counter() - start
+            start = perf_counter()
+            session_writer.close()
+            close_seconds = perf_counter() - start
+            results.append({"rows": n_rows,
+                            "write_row_us": write_seconds / n_rows * 1e6,
+                            "close_ms": close_seconds * 1e3})
+    finally:
+        rmtree(data_folder, ignore_errors = True)
+    return results
+
+
+def format_ms(values):
+    return " ".join("   -  " if value is None else f"{value:6.2f}" for value in values)
+
+
+def print_phase_results(results):
+    print(f"{results['task']:<13} {results['phase'][:34]:<34} "
+          f"setup {results['load_ms'] + results['build_ms']:7.1f} + {results['start_ms']:6.1f} ms | "
+          f"{results['rows']:>5} rows | "
+          f"peck p50/90/99/max {format_ms(results['peck_ms'])} | "
+          f"timer p50/99 {format_ms([results['timer_ms'][0], results['timer_ms'][2]])} | "
+          f"flush p99 {format_ms(results['flush_ms'][2:3])}, close {results['close_ms']:6.1f} ms | "
+          f"hopper min/max {format_ms([results['hopper_ms'][0], results['hopper_ms'][2]])}"
+          + ("" if results["peak_rss_mb"] is None else f" | {results['peak_rss_mb']:6.1f} MB")
+          + (f" | {results['callback_errors']} callback errors" if results["callback_errors"] else ""))
+
+
+def main():
+    parser = ArgumentParser(description = "Benchmark the P035 programs (headless)")
+    parser.add_argument("tasks", nargs = "*",
+                        help = f"programs to benchmark: {', '.join(task_files)} (default: all of them)")
+    parser.add_argument("--sessions", type = int, default = 1,
+                        help = "sessions per phase")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--timeout", type = float, default = 300,
+                        help = "seconds before a phase is given up on")
+    parser.add_argument("--flush-rows", type = int, nargs = "*",
+                        default = [1000, 10000, 100000],
+                        help = "row counts for the SessionWriter benchmark")
+    parser.add_argument("--json", help = "also save the results to this file")
+    args = parser.parse_args()
+    for task in args.tasks:
+        if task not in task_files:
+            parser.error(f"unknown program: {task}")
+
+    data_folder = mkdtemp(prefix = "p035_benchmark_")
+    all_results = {"phases": [], "session_writer": []}
+    # A fresh ("spawned", not forked) process for every phase
+    context = get_context("spawn")
+    try:
+        for task in args.tasks or list(task_files):
+            for phase_label, mainscreen_args in task_phases(task, data_folder):
+                with context.Pool(1) as pool:
+                    pending = pool.apply_async(benchmark_phase,
+                                               (task, phase_label, mainscreen_args,
+                                                args.sessions, args.seed))
+                    try:
+                        results = pending.get(args.timeout)
+                    except PoolTimeoutError:
+                        print(f"{task:<13} {phase_label[:34]:<34} timed out after {args.timeout:.0f} s")
+                        continue
+                    except Exception as error:
+                        print(f"{task:<13} {phase_label[:34]:<34} failed: {error!r}")
+                        continue
+                print_phase_results(results)
+                all_results["phases"].append(results)
+    finally:
+        rmtree(data_folder, ignore_errors = True)
+
+    if args.flush_rows:
+        print("\nSessionWriter:")
+        for results in benchmark_session_writer(args.flush_rows):
+            print(f"{results['rows']:>8} rows | write_row {results['write_row_us']:6.2f} us/row | "
+                  f"close {results['close_ms']:8.1f} ms")
+            all_results["session_writer"].append(results)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            dump(all_results, json_file, indent = 1)
+
+
+if __name__ == '__main__':
+    main()
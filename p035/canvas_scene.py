@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Retained-mode key layout for the operant box Canvas.
+
+The P035 programs used to delete every item on the Canvas (clear_canvas)
+and then re-create the background, each key's oval and image, and all of
+their tag_bind() bindings every time the screen changed -- including on
+every single sample peck of an FR requirement. The CanvasScene below
+creates the background and each key only once per session. After that,
+each trial stage just moves, re-images, shows, or hides the items that
+already exist (via coords() and itemconfigure()), which is a small fraction
+of the Tcl traffic.
+
+Every scene item is tagged "scene". Anything else drawn on the Canvas (ITI
+text, feedback, etc.) is still temporary, so clear_canvas() should call
+scene.hide() and then delete everything that is NOT part of the scene:
+
+    self.scene.hide()
+    self.mastercanvas.delete("!scene")
+"""
+
+
+class CanvasScene(object):
+    # The background is a full-screen black rectangle that logs any
+    # "background" pecks via background_callback(event). Keys are added
+    # the first time they are shown and then reused for the rest of the
+    # session.
+    def __init__(self, canvas, width, height, background_callback):
+        self.canvas = canvas
+        self.keys = {} # key tag -> [oval item, image item, oval radius]
+        self.callbacks = {} # key tag -> function called when key is pecked
+        self.key_images = {} # key tag -> PhotoImage (keeps a reference to it)
+        self.background = canvas.create_rectangle(0, 0, width, height,
+                                                  fill = "black",
+                                                  outline = "black",
+                                                  state = "hidden",
+                                                  tags = ("scene_bkgrd", "scene"))
+        self.background_callback = background_callback
+        canvas.tag_bind("scene_bkgrd", "<Button-1>",
+                        lambda event: self.background_callback(event))
+
+    def add_key(self, key_tag, radius = 85, fill = "black", outline = "black",
+                image_above_oval = True, callback = None):
+        # Builds a (hidden) key. The key's own tag is its FIRST tag, so code
+        # that checks gettags("current")[0] still gets the key's name. The
+        # key is bound once; which function a peck calls can be changed at
+        # any time by show_key().
+        oval = self.canvas.create_oval(0, 0, 0, 0,
+                                       fill = fill,
+                                       outline = outline,
+                                       state = "hidden",
+                                       tags = (key_tag, "scene"))
+        image = self.canvas.create_image(0, 0,
+                                         anchor = "center",
+                                         state = "hidden",
+                                         tags = (key_tag, "scene"))
+        if not image_above_oval:
+            self.canvas.tag_raise(oval, image)
+        self.keys[key_tag] = [oval, image, radius]
+        self.callbacks[key_tag] = callback
+        self.canvas.tag_bind(key_tag, "<Button-1>",
+                             lambda event, key_tag = key_tag: self.callbacks[key_tag](event))
+
+    def show_background(self, callback = None):
+        # Shows the background (optionally changing what a peck to it logs)
+        if callback is not None:
+            self.background_callback = callback
+        self.canvas.itemconfigure(self.background, state = "normal")
+
+    def show_key(self, key_tag, image, x, y, callback = None):
+        # Moves a key to (x, y), swaps in its image ("" for a blank key),
+        # sets the function that pecks to it call (if given), and shows it.
+        if key_tag not in self.keys:
+            self.add_key(key_tag)
+        oval, image_item, radius = self.keys[key_tag]
+        self.canvas.coords(oval, x - radius, y - radius, x + radius, y + radius)
+        self.canvas.coords(image_item, x, y)
+        if self.key_images.get(key_tag) is not image:
+            self.canvas.itemconfigure(image_item, image = image)
+            self.key_images[key_tag] = image
+        if callback is not None:
+            self.callbacks[key_tag] = callback
+        self.canvas.itemconfigure(key_tag, state = "normal")
+
+    def hide_key(self, key_tag):
+        if key_tag in self.keys:
+            self.canvas.itemconfigure(key_tag, state = "hidden")
+
+    def hide(self):
+        # Hides the background and every key (e.g., at the start of the ITI)
+        self.canvas.itemconfigure("scene", state = "hidden")
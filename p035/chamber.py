@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+The operant chamber (hopper, hopper light, house light, and touchscreen),
+behind one interface with several backends.
+
+The engine used to decide between "operant box" and "test version" by
+checking whether the home folder was /home/blaisdelllab, and to drive the
+pigpio board directly wherever the two differed. The chamber it uses is now
+one of the following, all with the same methods:
+
+- Chamber: the test version (no hardware). Nothing happens.
+- PigpioChamber: the operant box. Commands go to the pigpio daemon through
+  a HardwareController (see p035.hardware), so they never block the Tk
+  thread.
+- SimulatedChamber: a software chamber. It keeps track of the state of the
+  hopper and lights, and records when each change was made (and for how
+  long the hopper was up), on whatever clock it is given. Simulated
+  sessions and benchmarks (see p035.simulation) use it on their virtual
+  clock, so the whole session, hopper timing included, can be run on any
+  computer.
+
+Which one is used is set with the P035_CHAMBER environment variable ("pigpio",
+"simulated", or "none"). Without it, the operant box computers (where the
+home folder is /home/blaisdelllab) use "pigpio" and every other computer
+uses "none", as before.
+"""
+from csv import reader as csv_reader
+from os import environ, popen, path as os_path
+from time import perf_counter_ns
+from p035.console import console
+from p035.hardware import HardwareController
+
+chamber_kinds = ["pigpio", "simulated", "none"]
+
+
+def is_operant_box_computer():
+    # The operant box computers' home folder is /home/blaisdelllab
+    return "blaisdelllab" in os_path.expanduser('~').split("/")
+
+
+def chamber_kind_from_environment():
+    kind = environ.get("P035_CHAMBER", "").strip().lower()
+    if kind in chamber_kinds:
+        return kind
+    return "pigpio" if is_operant_box_computer() else "none"
+
+
+class Chamber(object):
+    # The test version: every change is ignored. Backends override the
+    # first group of methods below; the programs (via p035.engine) only
+    # ever use the second.
+    is_operant_box = False # Fullscreen, no cursor, etc. (see TaskScreen)
+
+    ## What each backend does
+    def set_house_light(self, on, force = False):
+        # "force": sent even if it is already on/off
+        pass
+
+    def set_hopper_light(self, on, force = False):
+        pass
+
+    def move_hopper(self, up, force = False):
+        pass
+
+    def pause(self, seconds):
+        # Waits before the next change is made (without blocking the caller)
+        pass
+
+    def release(self):
+        # No more changes can be made afterwards
+        pass
+
+    def map_touchscreen(self):
+        # Makes touches on the chamber's screen arrive as clicks on the
+        # experimental Canvas
+        pass
+
+    def print_summary(self):
+        pass
+
+    ## What the programs do
+    def house_light_on(self):
+        # At the start of each trial
+        self.set_house_light(True)
+
+    def hopper_up(self):
+        # Reinforcement: house light off, and hopper (and its light) up
+        self.set_house_light(False)
+        self.set_hopper_light(True)
+        self.move_hopper(True)
+
+    def hopper_down(self):
+        # ITI: hopper (and its light) down, and house light off
+        self.set_hopper_light(False)
+        self.move_hopper(False)
+        self.set_house_light(False)
+
+    def shut_down(self):
+        # At the end of a session: everything off, and the hopper down (even
+        # if they should be already, in case the session was ended
+        # mid-change), then let the hopper settle before letting go
+        self.set_hopper_light(False, force = True)
+        self.set_house_light(False, force = True)
+        self.move_hopper(False, force = True)
+        self.pause(1)
+        self.release()
+
+
+class PigpioChamber(Chamber):
+    # Connects to the pigpio daemon and sets up the GPIO pins when built
+    is_operant_box = True
+    # GPIO numbers (NOT PINS; gpio only compatible with GPIO num)
+    servo_GPIO_num = 2
+    hopper_light_GPIO_num = 13
+    house_light_GPIO_num = 21
+
+    def __init__(self):
+        import pigpio # (only on the operant box computers)
+
+        # Setup use of pi()
+        board = pigpio.pi()
+
+        # Then set each pin to output
+        board.set_mode(self.servo_GPIO_num,
+                       pigpio.OUTPUT) # Servo motor...
+        board.set_mode(self.hopper_light_GPIO_num,
+                       pigpio.OUTPUT) # Hopper light LED...
+        board.set_mode(self.house_light_GPIO_num,
+                       pigpio.OUTPUT) # House light LED...
+
+        # Setup the servo motor
+        board.set_PWM_frequency(self.servo_GPIO_num,
+                                50) # Default frequency is 50 MhZ
+
+        # Next grab the up/down
+        hopper_vals_csv_path = str(os_path.expanduser('~')+"/Desktop/Box_Info/Hopper_vals.csv")
+
+        # Store the proper UP/DOWN values for the hopper from csv file
+        with open(hopper_vals_csv_path) as hopper_vals_csv:
+            up_down_table = list(csv_reader(hopper_vals_csv))
+        self.hopper_up_val = up_down_table[1][0]
+        self.hopper_down_val = up_down_table[1][1]
+
+        # From here on, every change is made (in the background) by the
+        # hardware controller
+        self.hardware = HardwareController(board)
+        self.released = False
+
+    def set_house_light(self, on, force = False):
+        self.hardware.write(self.house_light_GPIO_num, on, "house_light", force)
+
+    def set_hopper_light(self, on, force = False):
+        self.hardware.write(self.hopper_light_GPIO_num, on, "hopper_light", force)
+
+    def move_hopper(self, up, force = False):
+        self.hardware.set_servo_pulsewidth(self.servo_GPIO_num,
+                                           self.hopper_up_val if up else self.hopper_down_val,
+                                           "hopper", force)
+
+    def pause(self, seconds):
+        self.hardware.pause(seconds)
+
+    def release(self):
+        # Turns off the servo and lets go of the GPIO board (only the first
+        # time it is called)
+        if self.released:
+            return
+        self.released = True
+        self.hardware.call("set_PWM_dutycycle", self.servo_GPIO_num, False)
+        self.hardware.call("set_PWM_frequency", self.servo_GPIO_num, False)
+        self.hardware.call("stop") # Kill RPi board
+        self.hardware.close()
+
+    def map_touchscreen(self):
+        # Runs the shell script that maps the touchscreen to operant box monitor
+        popen("sh /home/blaisdelllab/Desktop/Hardware_Code/map_touchscreen.sh")
+
+    def print_summary(self):
+        self.hardware.print_summary()
+
+
+class SimulatedChamber(Chamber):
+    # "time_ns" is the clock changes are stamped with (e.g., a simulated
+    # session's virtual clock), and "actuation_delay_ms" how long each
+    # change takes to be made after it is asked for.
+    def __init__(self, time_ns = perf_counter_ns, actuation_delay_ms = 0):
+        self.time_ns = time_ns
+        self.actuation_delay_ns = int(actuation_delay_ms * 1000000)
+        self.state = {} # "house_light"/"hopper_light"/"hopper" -> True/False
+        self.n_skipped = 0 # Changes that wouldn't have changed anything
+        self.actuation_log = [] # (name, on/up, requested ns, actuated ns)
+        self.hopper_up_ns = None # When the hopper last went up
+        self.hopper_durations_ns = [] # How long the hopper was up, each time
+        self.n_touches = 0
+        self.released = False
+
+    def set(self, name, value, force):
+        if self.released: # (like the board, which can't be reached anymore)
+            return
+        if not force and self.state.get(name) == value:
+            self.n_skipped += 1
+            return
+        self.state[name] = value
+        requested_ns = self.time_ns()
+        actuated_ns = requested_ns + self.actuation_delay_ns
+        self.actuation_log.append((name, value, requested_ns, actuated_ns))
+        if name == "hopper":
+            if value:
+                self.hopper_up_ns = actuated_ns
+            elif self.hopper_up_ns is not None:
+                self.hopper_durations_ns.append(actuated_ns - self.hopper_up_ns)
+                self.hopper_up_ns = None
+
+    def set_house_light(self, on, force = False):
+        self.set("house_light", on, force)
+
+    def set_hopper_light(self, on, force = False):
+        self.set("hopper_light", on, force)
+
+    def move_hopper(self, up, force = False):
+        self.set("hopper", up, force)
+
+    def release(self):
+        self.released = True
+
+    def touch(self, canvas, x, y):
+        # A touch on the chamber's screen at (x, y), now
+        self.n_touches += 1
+        canvas.peck(x, y, self.time_ns() // 1000000)
+
+    def print_summary(self):
+        if not self.hopper_durations_ns:
+            return
+        hopper_ms = [duration_ns / 1e6 for duration_ns in self.hopper_durations_ns]
+        console.info(f"- {len(hopper_ms)} reinforcements | hopper up (ms): mean {sum(hopper_ms)/len(hopper_ms):.2f}, min {min(hopper_ms):.2f}, max {max(hopper_ms):.2f}")
+
+
+def make_chamber(kind = None):
+    # The chamber for the given kind (by default, from the environment)
+    kind = kind or chamber_kind_from_environment()
+    if kind == "pigpio":
+        return PigpioChamber()
+    if kind == "simulated":
+        return SimulatedChamber()
+    return Chamber()
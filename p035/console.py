@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered console output for the P035 programs.
+
+The programs used to print() a line for every event (every peck, from inside
+write_data), a header for every trial, and whole trial schedules while
+setting up. On the Pi's framebuffer console, writing to the terminal is slow
+and blocks, so all of that was time taken out of the peck handlers and
+timers. Everything a session prints now goes through the console below:
+
+- A line is only put on a queue; a background thread writes whatever has
+  queued up in one go, at most every "interval" seconds. If the terminal
+  falls so far behind that "max_pending" lines are waiting, event lines
+  are dropped (and how many is noted) until it catches up.
+- Event lines (one per peck, etc.) are only formatted on that thread, and
+  not at all below the "events" verbosity.
+- If the output is a terminal, a status line (trial, reinforcers, and
+  accuracy so far) is kept at the bottom of it.
+
+The verbosity is set with the P035_VERBOSITY environment variable:
+
+    quiet   only warnings/errors (and the status line)
+    trials  + session and trial messages
+    events  + a line for every event (the default)
+    debug   + trial schedules, stimulus lists, etc.
+"""
+from os import environ
+from queue import Queue, Empty
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+import sys
+
+# Verbosity levels (see above)
+verbosity_levels = ["quiet", "trials", "events", "debug"]
+QUIET, TRIALS, EVENTS, DEBUG = range(len(verbosity_levels))
+
+
+def verbosity_from_environment(default = EVENTS):
+    name = environ.get("P035_VERBOSITY", "").strip().lower()
+    if name in verbosity_levels:
+        return verbosity_levels.index(name)
+    return default
+
+
+class ConsoleSink(object):
+    # There is one console (see the bottom of this file), shared by
+    # everything that prints during a session.
+    def __init__(self, verbosity = None, interval = 0.05, max_pending = 5000,
+                 status_interval = 0.5):
+        self.verbosity = verbosity if verbosity is not None else verbosity_from_environment()
+        self.interval = interval # Min seconds between writes to the terminal
+        self.max_pending = max_pending
+        self.status_interval = status_interval # Min seconds between status line updates
+        self.line_queue = Queue() # Text, or (format string, args) for events
+        self.n_dropped = 0 # Event lines dropped since the last write
+        self.status_fields = None # Set by set_status()
+        self.status_shown = False # Whether the status line is on the terminal
+        self.writer_thread = None
+        self.start_lock = Lock()
+
+    def enabled(self, level):
+        return level <= self.verbosity
+
+    def write(self, level, *values, sep = " "):
+        # Like print() (but with a verbosity level). The line is made right
+        # away, so it shows the values as they are now.
+        if level <= self.verbosity:
+            self.put(sep.join(str(value) for value in values))
+
+    def warning(self, *values, sep = " "):
+        self.write(QUIET, *values, sep = sep)
+
+    def info(self, *values, sep = " "):
+        self.write(TRIALS, *values, sep = sep)
+
+    def debug(self, *values, sep = " "):
+        self.write(DEBUG, *values, sep = sep)
+
+    def event(self, format_string, *args):
+        # One line per event: format_string.format(*args) is only run on the
+        # writer thread (so args should be strings, numbers, etc., that
+        # won't change in the meantime)
+        if self.verbosity < EVENTS:
+            return
+        if self.line_queue.qsize() >= self.max_pending:
+            self.n_dropped += 1
+            return
+        self.put((format_string, args))
+
+    def set_status(self, **fields):
+        # trial, reinforced, correct, incorrect (shown by the writer thread
+        # if the output is a terminal)
+        self.status_fields = fields
+        if self.writer_thread is None:
+            self.start()
+
+    def clear_status(self):
+        # At the end of a session: the status line is taken off the
+        # terminal (the next time anything is written, or flush() is called)
+        self.status_fields = None
+
+    def put(self, line):
+        if self.writer_thread is None:
+            self.start()
+        self.line_queue.put(line)
+
+    def flush(self, timeout = 10):
+        # Waits until everything queued so far has been written (e.g., at the
+        # end of a session, before anything else is printed directly)
+        if self.writer_thread is None:
+            return
+        written = Event()
+        self.line_queue.put(written)
+        written.wait(timeout)
+
+    def start(self):
+        with self.start_lock:
+            if self.writer_thread is None:
+                self.writer_thread = Thread(target = self._write_lines,
+                                            name = "ConsoleSink",
+                                            daemon = True)
+                self.writer_thread.start()
+
+    def status_text(self, fields):
+        n_choices = fields.get("correct", 0) + fields.get("incorrect", 0)
+        accuracy = f"{fields.get('correct', 0) / n_choices:.0%}" if n_choices else "-"
+        return (f"Trial {fields.get('trial', 0)} | Reinforced {fields.get('reinforced', 0)}"
+                f" | Accuracy {accuracy} ({fields.get('correct', 0)}/{n_choices})")
+
+    def _write_lines(self):
+        # The body of the writer thread. sys.stdout is looked up each time
+        # (rather than once), so output follows it if it is redirected.
+        last_status = 0
+        while True:
+            try:
+                items = [self.line_queue.get(timeout = self.status_interval)]
+            except Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self.line_queue.get_nowait())
+                except Empty:
+                    break
+            lines = []
+            flushed = []
+            for item in items:
+                if isinstance(item, Event):
+                    flushed.append(item)
+                elif isinstance(item, tuple):
+                    format_string, args = item
+                    lines.append(format_string.format(*args))
+                else:
+                    lines.append(item)
+            if self.n_dropped:
+                lines.append(f"... {self.n_dropped} event lines not shown (console too slow)")
+                self.n_dropped = 0
+
+            stream = sys.stdout
+            is_terminal = hasattr(stream, "isatty") and stream.isatty()
+            status_fields = self.status_fields
+            text = ""
+            if lines:
+                if self.status_shown:
+                    text += "\r\033[K" # The status line is rewritten below them
+                    self.status_shown = False
+                text += "\n".join(lines) + "\n"
+            if is_terminal and status_fields is not None:
+                if lines or monotonic() - last_status >= self.status_interval:
+                    text += "\r\033[K" + self.status_text(status_fields)
+                    self.status_shown = True
+                    last_status = monotonic()
+            elif self.status_shown:
+                text += "\r\033[K"
+                self.status_shown = False
+            if text:
+                try:
+                    stream.write(text)
+                    stream.flush()
+                except (OSError, ValueError): # (e.g., the terminal was closed)
+                    pass
+            for written in flushed:
+                written.set()
+            if lines:
+                sleep(self.interval) # Lets more lines queue up
+
+
+# The one console
+console = ConsoleSink()
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+"""
+The shared experiment engine for the P035 programs.
+
+Every P035 program used to carry its own copy of the operant box hardware
+setup, the experimenter control panel, and the parts of the MainScreen that
+have nothing to do with the task itself (building the window and Canvas,
+starting the session, writing the data file, cleaning up at the end, etc.).
+All of that now lives here, once:
+
+- The operant box check and hardware setup are run when this module is
+  first imported. The hopper/light changes that the programs make are the
+  functions hopper_up(), hopper_down(), and house_light_on() (which do
+  nothing when the program isn't running in an operant box). They are
+  passed on to the chamber (see p035.chamber), which may be the real one,
+  none at all (the test version), or a simulated one.
+- TaskScreen is the base class of each program's MainScreen. A task
+  declares what sets it apart as class attributes (its code, phases, and
+  subjects) and implements its own trial stages (ITI, sample, comparison,
+  reinforcement, etc.) and write_data(); everything else is inherited.
+- ExperimenterControlPanel is the control panel that most of the programs
+  share (subject, phase, and whether to record data). It is built from the
+  attributes declared by the task's MainScreen.
+
+A program is started with run_program(), either by running the program
+file itself (as before) or by name, with "python -m p035" (see
+p035.tasks).
+"""
+from datetime import datetime
+from os import getcwd, mkdir, stat, path as os_path
+from sys import setrecursionlimit, path as sys_path
+from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
+     StringVar, OptionMenu, IntVar, Radiobutton
+from p035.canvas_scene import CanvasScene
+from p035.chamber import chamber_kind_from_environment, make_chamber
+from p035.console import console, EVENTS
+from p035.profiling import HandlerProfiler, profiling_enabled
+from p035.schedule import print_schedule_summary, reset_schedule_stats
+from p035.scheduler import SessionScheduler
+from p035.session_columns import columnar_enabled, columns_file_path, \
+     write_session_columns
+from p035.session_database import database_enabled, database_path, \
+     add_to_database, ingest_session
+from p035.session_schedules import schedules_folder, next_schedule, mark_used
+from p035.session_writer import SessionWriter
+from p035.timing import SessionClock
+
+# The first variable declared is whether the program is the operant box version
+# for pigeons, or the test version for humans to view. The variable below is
+# a T/F boolean that will be referenced many times throughout the program
+# when the two options differ (for example, when the Hopper is accessed or
+# for onscreen text, etc.). It is True if the chamber is the real one
+# (pigpio), which is automatically the case if the user is "blaisdelllab"
+# (e.g., running on a rapberry pi), and False if not (see p035.chamber).
+chamber_kind = chamber_kind_from_environment()
+if chamber_kind == "pigpio":
+    operant_box_version = True
+    print("*** Running operant box version *** \n")
+else:
+    operant_box_version = False
+    print("*** Running test version (no hardware) *** \n")
+
+# Import hopper/other specific libraries from files on operant box computers
+try:
+    if operant_box_version:
+        # Import the art scripts
+        sys_path.insert(0, str(os_path.expanduser('~')+"/Desktop/Experiments/P033/"))
+        import graph
+        import polygon_fill
+
+    # Set up the chamber (the hopper and lights)...
+    chamber = make_chamber(chamber_kind)
+    # ...and map its touchscreen to the operant box monitor
+    chamber.map_touchscreen()
+
+except ModuleNotFoundError:
+    input("ERROR: Cannot find hopper hardware! Check desktop.")
+
+# Below  is just a safety measure to prevent too many recursive loops). It
+# doesn't need to be changed.
+setrecursionlimit(5000)
+
+
+## The hardware changes made over the course of a session. Each of these
+# is passed on to the chamber (which does nothing unless the program is
+# running in an operant box, or on a simulated chamber), and none of them
+# wait for the change to actually be made.
+
+def house_light_on():
+    # At the start of each trial
+    chamber.house_light_on()
+
+def hopper_up():
+    # Reinforcement: house light off, and hopper (and its light) up
+    chamber.hopper_up()
+
+def hopper_down():
+    # ITI: hopper (and its light) down, and house light off
+    chamber.hopper_down()
+
+def release_board():
+    # Lets go of the chamber hardware
+    chamber.release()
+
+def shut_down_hardware():
+    # At the end of a session: everything off, and the hopper down
+    chamber.shut_down()
+
+
+def run_program(build_control_panel):
+    # Runs a program's control panel. However it ends (closed without
+    # running a session, or an unexpected error), make sure to clean up the
+    # GPIO board, so that the hardware thread stops and the program can exit
+    # (releasing a board that a session already released does nothing).
+    try:
+        return build_control_panel()
+    finally:
+        release_board()
+
+
+"""
+A macro-level overview of each program is:
+
+    ControlPanel -----------> MainScreen ------------> PaintProgram
+         |                        |                         |
+    Collects main           Runs the actual         Gets passed subject
+    variables, passes      experiment, saves        name, but operates
+    to Mainscreen          data when exited          independently
+
+"""
+
+# The ExperimentalControlPanel (CP) exists "behind the scenes" throughout the
+# entire session, and if it is exited, the session will terminate. It is
+# passed the program's MainScreen class, and it is built from the subjects,
+# phases, etc. declared by that class.
+class ExperimenterControlPanel(object):
+    # The init function declares the inherent variables within that object
+    # (meaning that they don't require any input).
+    def __init__(self, main_screen_class):
+        self.main_screen_class = main_screen_class
+        # First, setup the data directory in "Documents"
+        self.doc_directory = str(os_path.expanduser('~'))+"/Documents/"
+        # Next up, we need to do a couple things that will be different based
+        # on whether the program is being run in the operant boxes or on a
+        # personal computer. These include setting up the hopper object so it
+        # can be referenced in the future, or the location where data files
+        # should be stored.
+        if operant_box_version:
+            # Setup the data directory in "Documents"
+            self.data_folder = "P035_data" # The folder within Documents where subject data is kept
+            self.data_folder_directory = str(os_path.expanduser('~'))+"/Desktop/Data/" + self.data_folder
+        else: # If not, just save in the current directory the program us being run in
+            self.data_folder_directory = getcwd() + "/data"
+
+        # setup the root Tkinter window
+        self.control_window = Tk()
+        self.control_window.title(f"{main_screen_class.task_code} Control Panel")
+        ##  Next, setup variables within the control panel
+        # Subject ID
+        self.pigeon_name_list = list(main_screen_class.pigeon_name_list)
+        self.pigeon_name_list.sort() # This alphabetizes the list
+        self.pigeon_name_list.insert(0, "TEST")
+
+        Label(self.control_window, text="Pigeon Name:").pack()
+        self.subject_ID_variable = StringVar(self.control_window)
+        self.subject_ID_variable.set("Subject")
+        self.subject_ID_menu = OptionMenu(self.control_window,
+                                          self.subject_ID_variable,
+                                          *self.pigeon_name_list,
+                                          command=self.set_pigeon_ID).pack()
+
+
+        # Exp phases
+        self.experimental_phase_titles = main_screen_class.experimental_phase_titles
+
+        Label(self.control_window, text="Experimental Phase:").pack()
+        self.exp_phase_variable = StringVar(self.control_window)
+        self.exp_phase_variable.set("Select")
+        self.exp_phase_menu = OptionMenu(self.control_window,
+                                          self.exp_phase_variable,
+                                          *self.experimental_phase_titles
+                                          ).pack()
+
+        # Record data variable?
+        Label(self.control_window,
+              text = "Record data in seperate data sheet?").pack()
+        self.record_data_variable = IntVar()
+        self.record_data_rad_button1 =  Radiobutton(self.control_window,
+                                   variable = self.record_data_variable, text = "Yes",
+                                   value = True).pack()
+        self.record_data_rad_button2 = Radiobutton(self.control_window,
+                                  variable = self.record_data_variable, text = "No",
+                                  value = False).pack()
+        self.record_data_variable.set(True) # Default set to True
+
+
+        # Start button
+        self.start_button = Button(self.control_window,
+                                   text = 'Start program',
+                                   bg = "green2",
+                                   command = self.build_chamber_screen).pack()
+
+        # This makes sure that the control panel remains onscreen until exited
+        self.control_window.mainloop() # This loops around the CP object
+
+
+    def set_pigeon_ID(self, pigeon_name):
+        # First, ensure the main data directory exists
+        if not os_path.isdir(self.data_folder_directory):
+            mkdir(self.data_folder_directory)
+
+        # Then check and create the subfolder for the specific pigeon
+        pigeon_path = os_path.join(self.data_folder_directory, pigeon_name)
+        if not os_path.isdir(pigeon_path):
+            mkdir(pigeon_path)
+            print(f"\n ** NEW DATA FOLDER FOR {pigeon_name.upper()} CREATED **")
+        else:
+            print(f"DATA FOLDER FOR {pigeon_name.upper()} EXISTS")
+
+    def build_chamber_screen(self):
+        # Once the green "start program" button is pressed, then the mainscreen
+        # object is created and pops up in a new window. It gets passed the
+        # important inputs from the control panel.
+        if self.subject_ID_variable.get() in self.pigeon_name_list:
+            if self.exp_phase_variable.get() != "Select":
+                print("Operant Box Screen Built")
+                self.MS = self.main_screen_class(
+                    str(self.subject_ID_variable.get()), # subject_ID
+                    self.record_data_variable.get(), # Boolean for recording data (or not)
+                    self.data_folder_directory, # directory for data folder
+                    self.exp_phase_variable.get(), # Exp phase name
+                    self.experimental_phase_titles.index(self.exp_phase_variable.get()) # Exp Phase number
+                    )
+            else:
+                print("\n ERROR: Input Stimulus Set Before Starting Session")
+        else:
+            print("\n ERROR: Input Correct Pigeon ID Before Starting Session")
+
+
+# The base class of every program's MainScreen. Everything a session does
+# that isn't part of the task itself is done here.
+class TaskScreen(object):
+    # What sets each task apart (declared by each program's MainScreen)
+    task_code = "P035" # Shown on the window and start screen, and in data file names
+    experimental_phase_titles = [] # Phases to pick from in the control panel
+    pigeon_name_list = ["Bowser", "Yoshi", "Shy Guy", "Athena",
+                        "Darwin","Cousteau",
+                        "Bon Jovi"] # Subjects ("TEST" is always added)
+    first_ITI_duration = 30000 # ms between the space bar and the first trial
+    # What the task's build_schedule() sets (its trial order, etc.), which
+    # can also be generated ahead of time (see p035.session_schedules)
+    schedule_attributes = []
+    precompiled_schedule = None # (set by load_precompiled_schedule())
+    # The console line printed for each event (see print_event())
+    event_format = "{:>30} | x: {: ^3} y: {:^3} | {:^5} | {}"
+
+    def build_screen(self, title):
+        ## Set up the visual Canvas, the session clock, and the scheduler
+        self.root = Toplevel()
+        self.root.title(title) # this is the title of the window
+        self.mainscreen_height = 768 # height of the experimental canvas screen
+        self.mainscreen_width = 1024 # width of the experimental canvas screen
+        self.root.bind("<Escape>", self.exit_program) # bind exit program to the "esc" key
+
+        # If the version is the one running in the boxes...
+        if operant_box_version:
+            # Keybind relevant keys
+            self.cursor_visible = True # Cursor starts on...
+            self.change_cursor_state() # turn off cursor UNCOMMENT
+            self.root.bind("<c>",
+                           lambda event: self.change_cursor_state()) # bind cursor on/off state to "c" key
+            # Then fullscreen (on a 1024x768p screen). Assumes that both screens
+            # that are being used have identical dimensions
+            self.root.geometry(f"{self.mainscreen_width}x{self.mainscreen_height}+1920+0")
+            self.root.attributes('-fullscreen',
+                                 True)
+            self.mastercanvas = Canvas(self.root,
+                                   bg="black")
+            self.mastercanvas.pack(fill = BOTH,
+                                   expand = True)
+        # If we want to run a "human-friendly" version
+        else:
+            # No keybinds and  1024x768p fixed window
+            self.mastercanvas = Canvas(self.root,
+                                   bg="black",
+                                   height=self.mainscreen_height,
+                                   width = self.mainscreen_width)
+            self.mastercanvas.pack()
+
+        # The background and keys are built once (the first time each is
+        # shown) and then reused for the rest of the session
+        self.scene = CanvasScene(self.mastercanvas,
+                                 self.mainscreen_width,
+                                 self.mainscreen_height,
+                                 lambda event: self.write_data(event, "background_peck"))
+        self.clock = SessionClock() # Monotonic (ns) time stamps for every event
+        self.choice_counts = {"correct_choice": 0,
+                              "incorrect_choice": 0} # For the console's status line
+        self.scheduler = SessionScheduler(self.root, self.clock) # Runs every timed transition (ITI, hopper, etc.)
+        reset_schedule_stats() # How long building the trial schedule takes (see p035.schedule)
+
+    def start_data(self, header_list):
+        # The session's trial-by-trial data, with the column headers as its
+        # first row. Every row is also handed to the session_writer, which
+        # writes it to the .csv in the background.
+        self.session_data_frame = [header_list]
+        self.session_writer = SessionWriter(self.session_data_frame)
+        # Opt-in timing of the session's handlers (see p035.profiling)
+        self.profiler = HandlerProfiler(self) if profiling_enabled else None
+
+    def is_test_session(self):
+        # Test sessions skip the wait before the first trial and show what
+        # is happening onscreen
+        return not operant_box_version or self.subject_ID == "TEST"
+
+    def schedule_phase(self):
+        # Which of the subject's precompiled schedules a session can use (or
+        # None, if its sessions always build their own)
+        return str(self.exp_phase_num)
+
+    def load_precompiled_schedule(self):
+        # Takes the subject's next unused precompiled schedule for this
+        # phase, if there is one (instead of calling build_schedule()).
+        # Returns whether there was.
+        self.precompiled_schedule = None
+        if not self.schedule_attributes:
+            return False
+        schedule = next_schedule(schedules_folder, self.task_code,
+                                 self.subject_ID, self.schedule_phase())
+        if schedule is None:
+            return False
+        for name, value in schedule.attributes.items():
+            setattr(self, name, value)
+        self.precompiled_schedule = schedule
+        console.info(f"- Precompiled schedule {schedule.session} of {schedule.n_sessions} (seed {schedule.seed})")
+        return True
+
+    def place_birds_in_box(self):
+        # This is the default screen run until the birds are placed into the
+        # box and the space bar is pressed. It then proceedes to the ITI. It only
+        # runs in the operant box version. After the space bar is pressed, the
+        # "first_ITI" function is called for the only time prior to the first trial
+        self.root.bind("<space>", self.first_ITI) # bind cursor state to "space" key
+        #shows program text (i.e., what was chosen in the control panel)
+        self.mastercanvas.create_text(512,384,
+                                      fill="white",
+                                      font="Times 26 italic bold",
+                                      text=f"{self.task_code} \n Place bird in box, then press space \n Subject: {self.subject_ID} \n Training Phase: {self.exp_phase_name}")
+
+    def first_ITI(self, event):
+        # Once the space bar is pressed, the session starts: the clock is
+        # started and, after a delay (only 1 s for tests), the first ITI
+        console.info("Spacebar pressed -- SESSION STARTED")
+        self.root.unbind("<space>") # unbind the "space" key
+        self.clear_canvas()
+        self.trial_stage = 0
+        self.start_time = datetime.now()  # This is the ACTUAL time the session starts
+        self.clock.start() # ...and start the session clock
+        if self.precompiled_schedule is not None:
+            mark_used(self.precompiled_schedule) # (only now that it's been used)
+        self.session_started()
+        if self.is_test_session(): # If test, don't worry about first ITI delay
+            self.ITI_duration = 1 * 1000
+            self.scheduler.after(1, self.end_first_ITI, "first_ITI")
+        else:
+            self.scheduler.after(self.first_ITI_duration, self.end_first_ITI, "first_ITI")
+
+    def session_started(self):
+        # Anything else a task needs to do as soon as the session starts
+        pass
+
+    def session_ended(self):
+        # Anything else a task needs to do (or stop) when the session ends
+        pass
+
+    def end_first_ITI(self):
+        self.ITI()
+
+    def print_trial_header(self):
+        # Terminal feedback "headers" for each event within the next trial
+        console.info(f"\n{'*'*30} Trial {self.current_trial_counter} begins {'*'*30}") # Terminal feedback...
+        console.info(f"{'Event Type':>30} | Xcord. Ycord. | Stage | Session Time")
+
+    def print_event(self, outcome, x, y, session_time, *extra):
+        # Called by write_data for every event. The line is only formatted
+        # (and written) by the console's background thread, and only if the
+        # console is showing events; "extra" are any columns a task adds to
+        # its event_format.
+        console.event(self.event_format, outcome, x, y, self.trial_stage,
+                      session_time, *extra)
+        if outcome in self.choice_counts:
+            self.choice_counts[outcome] += 1
+        console.set_status(trial = self.current_trial_counter,
+                           reinforced = getattr(self, "reinforced_trial_counter", 0),
+                           correct = self.choice_counts["correct_choice"],
+                           incorrect = self.choice_counts["incorrect_choice"])
+
+    def change_cursor_state(self):
+        # This function toggles the cursor state on/off.
+        # May need to update accessibility settings on your machince.
+        if self.cursor_visible: # If cursor currently on...
+            self.root.config(cursor="none") # Turn off cursor
+            console.info("### Cursor turned off ###")
+            self.cursor_visible = False
+        else: # If cursor currently off...
+            self.root.config(cursor="") # Turn on cursor
+            console.info("### Cursor turned on ###")
+            self.cursor_visible = True
+
+    def clear_canvas(self):
+         # This is by far the most called function across the program. It
+         # deletes all the objects currently on the Canvas. A finer point to
+         # note here is that objects still exist onscreen if they are covered
+         # up (rendering them invisible and inaccessible); if too many objects
+         # are stacked upon each other, it can may be too difficult to track/
+         # project at once (especially if many of the objects have functions
+         # tied to them. Therefore, its important to frequently clean up the
+         # Canvas by literally deleting every element. The only exceptions
+         # are the background and keys (the "scene"), which are simply hidden
+         # so that they can be reused.
+        try:
+            self.scene.hide()
+            self.mastercanvas.delete("!scene")
+        except TclError:
+            console.info("No screen to exit")
+
+    def exit_program(self, event):
+        # This function can be called two different ways: automatically (when
+        # time/reinforcer session constraints are reached) or manually (via the
+        # "End Program" button in the control panel or bound "esc" key).
+
+        # The program does a few different things:
+        #   1) Return hopper to down state, in case session was manually ended
+        #       during reinforcement (it shouldn't be)
+        #   2) Turn cursor back on
+        #   3) Writes compiled data matrix to a .csv file
+        #   4) Destroys the Canvas object
+        #   5) Calls the Paint object, which creates an onscreen Paint Canvas.
+        def other_exit_funcs():
+            shut_down_hardware()
+            chamber.print_summary()
+            if operant_box_version:
+                if not self.cursor_visible:
+                	self.change_cursor_state() # turn cursor back on, if applicable
+            self.write_comp_data(True) # write data for end of session
+            self.session_writer.close() # wait for the data file to be fully written
+            self.scheduler.cancel_all() # No more timed transitions
+            self.session_ended()
+            self.scheduler.print_summary()
+            print_schedule_summary()
+            if self.profiler is not None:
+                self.write_profile()
+            if columnar_enabled:
+                self.write_columns()
+            if database_enabled:
+                self.write_database()
+            if self.root.winfo_exists():  # Check if the window still exists
+                self.root.destroy()  # destroy Canvas
+            console.info("\n GUI window exited")
+
+        self.clear_canvas()
+        other_exit_funcs()
+        console.info("\n You may now exit the terminal and operater windows now.")
+        console.clear_status()
+        console.flush() # Everything is on the terminal before anything else is
+        if operant_box_version:
+            polygon_fill.main(self.subject_ID) # call paint object
+
+    def data_file_path(self):
+        # Named after the subject, the start of the session, and the phase
+        return f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_{self.task_code}_data-Phase{self.exp_phase_num}.csv"
+
+    def write_profile(self):
+        # The profiling summary is written next to the data file (if there
+        # is one)
+        self.profiler.print_summary()
+        if self.session_writer.file_path is not None:
+            profile_file_path = os_path.splitext(self.session_writer.file_path)[0] + "_profile.csv"
+            self.profiler.write_summary(profile_file_path)
+            console.info(f"- Profile written to {profile_file_path}")
+
+    def write_columns(self):
+        # The columnar copy of the session's data is written next to the
+        # data file (if there is one)
+        if self.session_writer.file_path is not None:
+            columns_path = columns_file_path(self.session_writer.file_path)
+            try:
+                write_session_columns(self.session_data_frame, columns_path)
+                console.info(f"- Columns written to {columns_path}")
+            except OSError as e:
+                console.warning(f"\n- ERROR: could not write {columns_path} ({e})")
+
+    def write_database(self):
+        # The session is added to the session database (if its data were
+        # recorded)
+        if self.session_writer.file_path is not None:
+            file_path = self.session_writer.file_path
+            try:
+                file_stat = stat(file_path)
+            except OSError:
+                return
+            n_rows = add_to_database(ingest_session, file_path, self.session_data_frame,
+                                     file_stat.st_size, file_stat.st_mtime_ns)
+            if n_rows is not None:
+                console.info(f"- {n_rows} rows added to {database_path}")
+
+    def write_comp_data(self, SessionEnded):
+        # The following function creates a .csv data document. It is either
+        # called after each trial during the ITI (SessionEnded ==False) or
+        # one the session finishes (SessionEnded). If the first time the
+        # function is called, it will produce a new .csv out of the
+        # session_data_matrix variable, named after the subject, date, and
+        # training phase. The writing itself is done by the session_writer's
+        # background thread, which appends new rows as they come in.
+        if SessionEnded:
+            self.write_data(None, "SessionEnds") # Writes end of session to df
+        if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
+            myFile_loc = self.data_file_path() # location of written .csv
+            if self.session_writer.file_path is None: # i.e., the first write
+                subject_folder = os_path.dirname(myFile_loc)
+                if not os_path.isdir(subject_folder):
+                    mkdir(subject_folder)
+
+            # Have the writer thread push any new event/trial data to the .csv
+            self.session_writer.flush(myFile_loc)
+            console.write(EVENTS, f"\n- Data file written to {myFile_loc}")
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+The fast-mapping (FM) FOILs each subject has used, and the choice of new ones.
+
+Every FM session (FOAM subphases FM.1-3) has one FOIL: an image from a
+later phase that the subject has never seen, which is never used again.
+Each subject's FOILs are logged in FM_stimuli_logs/<subject>_P035_Used_FM_
+Stimuli_Log.csv. FOAM used to read the whole log into a list, draw random
+files from the stimuli folder until one was an image of a later phase that
+wasn't anywhere in that list (going through the list for every draw, and
+never stopping once every such image had been used), and then write the
+whole log out again with the new FOIL at the end.
+
+An FMFoilRegistry reads the log once, into a set of the FOILs used so far:
+
+- choose() draws the FOIL straight from the images of a later phase that
+  aren't in the set (a single draw, however long the log gets). If there
+  are none left, it raises an FMFoilsUsedUp error that says so, instead of
+  looping forever.
+- append_fm_log_entry() adds the new FOIL's row to the end of the log (a
+  single write, flushed to disk), so the rows already in it are never
+  rewritten. A log that doesn't exist yet is written in full to a
+  temporary file first, so it is never half written.
+
+The log's columns (and the rows' format) are as before, so past logs, the
+session database (see p035.session_database), and any analysis scripts
+read it the same way.
+"""
+from csv import DictReader, DictWriter
+from io import StringIO
+from os import O_APPEND, O_WRONLY, close, fsync, open as os_open, replace, write, path as os_path
+from random import choice
+from p035.schedule import ScheduleError
+from p035.session_database import fm_log_suffix
+
+# The folder with every subject's log (relative to the P035 folder)
+fm_log_folder = "FM_stimuli_logs"
+
+# The log's columns
+fm_log_fields = ['Subject', 'Used_FM', 'Date_Used', 'FM_phase']
+
+
+class FMFoilsUsedUp(ScheduleError):
+    # Every image that could be a subject's next FOIL has been used
+    pass
+
+
+def fm_log_path(subject_ID, folder = fm_log_folder):
+    # e.g., "FM_stimuli_logs/Athena_P035_Used_FM_Stimuli_Log.csv"
+    return os_path.join(folder, f"{subject_ID}_P035{fm_log_suffix}")
+
+
+def fm_log_row(entry):
+    # One entry (a dict with the log's columns) as a line of the log
+    row_text = StringIO()
+    DictWriter(row_text, fieldnames = fm_log_fields).writerow(entry)
+    return row_text.getvalue()
+
+
+def append_fm_log_entry(log_path, entry):
+    # Adds one FOIL to the end of a subject's log (called once the session
+    # using it has started)
+    if not os_path.isfile(log_path):
+        header_text = StringIO()
+        DictWriter(header_text, fieldnames = fm_log_fields).writeheader()
+        with open(log_path + ".tmp", "w", newline = "") as log_file:
+            log_file.write(header_text.getvalue() + fm_log_row(entry))
+            log_file.flush()
+            fsync(log_file.fileno())
+        replace(log_path + ".tmp", log_path)
+        return
+    # (in case the last row was saved without a line break, e.g., by hand)
+    with open(log_path, "rb") as log_file:
+        log_file.seek(0, 2)
+        ends_with_newline = log_file.tell() == 0
+        if not ends_with_newline:
+            log_file.seek(-1, 2)
+            ends_with_newline = log_file.read(1) == b"\n"
+    row_bytes = ("" if ends_with_newline else "\r\n").encode("utf-8") + fm_log_row(entry).encode("utf-8")
+    # One write to a file opened for appending, so the row goes to the end
+    # of the log whole
+    log_fd = os_open(log_path, O_WRONLY | O_APPEND)
+    try:
+        write(log_fd, row_bytes)
+        fsync(log_fd)
+    finally:
+        close(log_fd)
+
+
+class FMFoilRegistry(object):
+    # A subject's FM log, read once (an empty log if it doesn't exist yet,
+    # i.e., the subject has never run an FM session)
+    def __init__(self, subject_ID, folder = fm_log_folder):
+        self.subject_ID = subject_ID
+        self.log_path = fm_log_path(subject_ID, folder)
+        self.used = set() # Every FOIL in the log
+        if os_path.isfile(self.log_path):
+            with open(self.log_path, 'r', encoding = 'utf-8-sig') as log_file:
+                for entry in DictReader(log_file):
+                    self.used.add(entry["Used_FM"])
+
+    def unused(self, stimuli_manifest, min_phase):
+        # The images of phase "min_phase" or later that haven't been FOILs
+        return [file_name for file_name in stimuli_manifest.names()
+                if stimuli_manifest[file_name]["phase"] is not None
+                and stimuli_manifest[file_name]["phase"] >= min_phase
+                and file_name not in self.used]
+
+    def choose(self, stimuli_manifest, min_phase):
+        # A new FOIL: one of the images of phase "min_phase" or later (so
+        # never seen in training, or in test subphases so far) that has never
+        # been one of the subject's FOILs
+        candidates = self.unused(stimuli_manifest, min_phase)
+        if not candidates:
+            raise FMFoilsUsedUp(f"Every image of Phase {min_phase} or later has already been an FM FOIL for {self.subject_ID} (see {self.log_path})")
+        return choice(candidates)
+
+    def new_entry(self, FOIL, date_used, FM_phase):
+        # The log entry of a new FOIL (see append_fm_log_entry())
+        self.used.add(FOIL)
+        return {"Subject" : self.subject_ID,
+                "Used_FM" : FOIL,
+                "Date_Used" : date_used,
+                "FM_phase" : FM_phase}
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous control of the operant box hardware (via pigpio).
+
+Every change to the hopper and lights used to be made directly on the Tk
+thread: each rpi_board.write() and set_servo_pulsewidth() is a round trip
+over a socket to the pigpiod daemon, and the end of a session even slept
+for a second (to let the hopper settle) before letting go of the board.
+The HardwareController below takes those commands instead:
+
+- Each command is put on a queue and carried out, in order, by a worker
+  thread, so a handler never waits on the daemon.
+- A write that wouldn't change anything (e.g., turning the house light off
+  when it is already off, or lowering the hopper when it is already down)
+  is skipped before it is ever queued.
+- The time each command was asked for and the time it was actually carried
+  out are both recorded (on the same perf_counter_ns() clock as the
+  session's SessionClock), so the lag can be checked at the end of a session.
+
+Pauses (e.g., letting the hopper settle before the board is released) are
+also commands, so they only ever hold up the worker thread.
+"""
+from queue import Queue
+from threading import Thread
+from time import perf_counter_ns, sleep
+from p035.console import console
+
+
+class HardwareCommand(object):
+    def __init__(self, name, method_name, args, requested_ns):
+        self.name = name # e.g., "house_light" (what is reported)
+        self.method_name = method_name # The method of the board to call
+        self.args = args
+        self.requested_ns = requested_ns
+
+
+class HardwareController(object):
+    # Built once, when the engine sets up the board (see p035.engine).
+    # "board" is a pigpio.pi(); only the worker thread uses it from then on.
+    def __init__(self, board, time_ns = perf_counter_ns):
+        self.board = board
+        self.time_ns = time_ns
+        self.commands = Queue()
+        self.levels = {} # GPIO number -> level/pulsewidth last asked for
+        self.n_skipped = 0 # Redundant writes that were never queued
+        self.actuation_log = [] # (name, requested ns, actuated ns)
+        # Not a daemon thread: if the program ends right after a session,
+        # the last commands (e.g., releasing the board) are still carried out
+        self.worker_thread = Thread(target = self._run_commands,
+                                    name = "HardwareController")
+        self.worker_thread.start()
+
+    def put(self, name, method_name, *args):
+        self.commands.put(HardwareCommand(name, method_name, args, self.time_ns()))
+
+    def write(self, gpio, level, name, force = False):
+        # Sets a GPIO pin high/low (unless it is already at that level)
+        self.set_level(gpio, bool(level), name, "write", force)
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth, name, force = False):
+        # Moves the servo (unless it was already sent to that position)
+        self.set_level(gpio, pulsewidth, name, "set_servo_pulsewidth", force)
+
+    def set_level(self, gpio, level, name, method_name, force):
+        if not force and gpio in self.levels and self.levels[gpio] == level:
+            self.n_skipped += 1
+            return
+        self.levels[gpio] = level
+        self.put(name, method_name, gpio, level)
+
+    def call(self, method_name, *args):
+        # Any other board method (always carried out)
+        self.put(method_name, method_name, *args)
+
+    def pause(self, seconds):
+        # The worker waits this long before carrying out the next command
+        self.put("pause", None, seconds)
+
+    def close(self):
+        # No more commands: the worker finishes those already queued, then
+        # stops
+        self.commands.put(None)
+
+    def wait(self, timeout = None):
+        # Waits until every queued command has been carried out (only if
+        # close() has been called)
+        self.worker_thread.join(timeout)
+
+    def _run_commands(self):
+        # The body of the worker thread
+        while True:
+            command = self.commands.get()
+            if command is None:
+                return
+            if command.method_name is None:
+                sleep(command.args[0])
+                continue
+            try:
+                getattr(self.board, command.method_name)(*command.args)
+            except Exception as error: # (e.g., pigpio.error)
+                console.warning(f"ERROR: hardware command {command.name}{command.args} failed ({error})")
+                continue
+            self.actuation_log.append((command.name, command.requested_ns, self.time_ns()))
+
+    def print_summary(self):
+        # Printed at the end of a session. Lag is how long after it was asked
+        # for each command was actually carried out.
+        actuations = list(self.actuation_log)
+        if not actuations:
+            return
+        lag_ms = [(actuated_ns - requested_ns) / 1e6
+                  for name, requested_ns, actuated_ns in actuations]
+        console.info(f"- {len(lag_ms)} hardware commands ({self.n_skipped} redundant skipped) | lag (ms): mean {sum(lag_ms)/len(lag_ms):.2f}, max {max(lag_ms):.2f}")
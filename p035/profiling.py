@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the handlers that run a P035 session.
+
+When a session is slow on one box (or on one day), the trial data don't say
+which part of the program was the slow one. With profiling turned on, every
+call of a session's main handlers (write_data, build_keys, sample_phase,
+comparison_phase, choice_task, ITI, reinforcement_phase/provide_food, and
+write_comp_data; whichever the program has) is timed, and so is the time
+the Tk loop spends between them (idle, or in something that isn't
+profiled). For each, a count and a histogram of the times are kept, so the
+memory used doesn't grow over a session.
+
+Profiling is turned on by setting the P035_PROFILE environment variable
+before starting a program, e.g.:
+
+    P035_PROFILE=1 python3 P035g_Wasserman_replication.py
+
+At the end of the session (if data are being recorded), the summary is
+written next to the data file, with the same name ending in "_profile.csv"
+instead of ".csv". Times are with each call's nested calls included (e.g.,
+choice_task includes the write_data calls it makes).
+"""
+from bisect import bisect_right
+from csv import writer
+from functools import wraps
+from os import environ
+from time import perf_counter_ns
+from p035.console import console
+
+# Whether profiling is turned on (see above)
+profiling_enabled = environ.get("P035_PROFILE", "") not in ("", "0")
+
+# The handlers that are profiled (if the program has them)
+profiled_handlers = ["write_data", "build_keys", "sample_phase",
+                     "comparison_phase", "choice_task", "ITI",
+                     "reinforcement_phase", "provide_food", "write_comp_data"]
+
+# Upper bounds (ms) of the histogram buckets. The last bucket holds
+# everything longer.
+bucket_bounds_ms = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000]
+
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.bucket_bounds_ns = [int(bound * 1e6) for bound in bucket_bounds_ms]
+        self.counts = [0] * (len(bucket_bounds_ms) + 1)
+        self.n = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, elapsed_ns):
+        self.counts[bisect_right(self.bucket_bounds_ns, elapsed_ns)] += 1
+        self.n += 1
+        self.total_ns += elapsed_ns
+        self.max_ns = max(self.max_ns, elapsed_ns)
+
+    def percentile_ms(self, fraction):
+        # The upper bound of the bucket the percentile falls in (or the
+        # longest time, if it's in the last bucket)
+        if self.n == 0:
+            return None
+        rank = max(1, round(fraction * self.n))
+        n_so_far = 0
+        for bound_ms, count in zip(bucket_bounds_ms, self.counts):
+            n_so_far += count
+            if n_so_far >= rank:
+                return min(bound_ms, self.max_ns / 1e6)
+        return self.max_ns / 1e6
+
+
+class HandlerProfiler(object):
+    # Built by TaskScreen.start_data() when profiling is turned on. The
+    # handlers are replaced (on the MainScreen object itself) by timed
+    # versions of themselves.
+    def __init__(self, main_screen, handler_names = profiled_handlers,
+                 time_ns = perf_counter_ns):
+        self.time_ns = time_ns
+        self.histograms = {} # handler name -> LatencyHistogram
+        self.idle = LatencyHistogram() # Between (outermost) handler calls
+        self.depth = 0 # How many profiled calls are running (they nest)
+        self.last_end_ns = None # When the last outermost call ended
+        for name in handler_names:
+            handler = getattr(main_screen, name, None)
+            if callable(handler):
+                self.histograms[name] = LatencyHistogram()
+                setattr(main_screen, name, self.timed(name, handler))
+
+    def timed(self, name, handler):
+        histogram = self.histograms[name]
+        @wraps(handler)
+        def timed_handler(*args, **kwargs):
+            start_ns = self.time_ns()
+            if self.depth == 0 and self.last_end_ns is not None:
+                self.idle.add(start_ns - self.last_end_ns)
+            self.depth += 1
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                end_ns = self.time_ns()
+                histogram.add(end_ns - start_ns)
+                if self.depth == 0:
+                    self.last_end_ns = end_ns
+        return timed_handler
+
+    def summary_rows(self):
+        rows = [["Handler", "Calls", "TotalMs", "MeanMs", "P50Ms", "P90Ms",
+                 "P99Ms", "MaxMs"]
+                + [f"<{bound}ms" for bound in bucket_bounds_ms]
+                + [f">={bucket_bounds_ms[-1]}ms"]]
+        for name, histogram in list(self.histograms.items()) + [("tk_idle", self.idle)]:
+            if histogram.n == 0:
+                continue
+            rows.append([name,
+                         histogram.n,
+                         round(histogram.total_ns / 1e6, 3),
+                         round(histogram.total_ns / histogram.n / 1e6, 3)]
+                        + [round(histogram.percentile_ms(fraction), 3)
+                           for fraction in (0.5, 0.9, 0.99)]
+                        + [round(histogram.max_ns / 1e6, 3)]
+                        + histogram.counts)
+        return rows
+
+    def write_summary(self, file_path):
+        with open(file_path, 'w', newline='') as csvfile:
+            writer(csvfile).writerows(self.summary_rows())
+
+    def print_summary(self):
+        # The slowest handlers (by their longest call)
+        slowest = sorted((histogram.max_ns, name)
+                         for name, histogram in self.histograms.items()
+                         if histogram.n > 0)[::-1][:3]
+        console.info("- Slowest handlers (max ms): "
+              + ", ".join(f"{name} {max_ns / 1e6:.2f}" for max_ns, name in slowest))
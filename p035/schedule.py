@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Trial schedules built from constraints, instead of by trial and error.
+
+The programs used to build their trial orders with retry loops: drawing a
+random stimulus over and over until one happened to be a usable foil
+(FOAM), putting a side back and reshuffling until the comparison hadn't
+been shown there too often (P035b, which could loop forever), flipping a
+side after the fact to break up long runs (P035d/e), or taking probes
+whenever a coin flip allowed and piling up whatever was left at the end
+(P035g). How long these took (or whether they finished) depended on luck.
+
+The functions below take the constraints themselves and build a schedule
+that meets them in one pass, with a fixed amount of work for a given size:
+
+- side_sequence(): a sequence of sides with equal counts of each side and
+  no run of the same side longer than "max_run".
+- balanced_side_rounds(): a side for each item in each round, with every
+  item shown equally often on each side and each round split evenly.
+- spaced_interleave(): training trials with probe trials spread among them,
+  with at least "min_gap" training trials between two probes.
+- StimulusIndex: a session's stimuli grouped by type, trial type, and
+  phase, to draw from in constant time (e.g., a foil that isn't the
+  sample's pair).
+- NoRepeatPool: items (e.g., foils) drawn without repeats until every one
+  has been used.
+
+If the constraints can't all be met, a ScheduleError says which, rather
+than the program looping. All randomness comes from the "random" module,
+so a session's schedule is still set by random.seed() (see p035.simulation).
+
+How long schedule building took is recorded (see print_schedule_summary()),
+and printed with the other summaries at the end of a session.
+"""
+from random import random, randrange, sample, shuffle
+from time import perf_counter_ns
+from p035.console import console
+
+# Function name -> [calls, total ns, max ns], since the last reset
+schedule_stats = {}
+
+
+class ScheduleError(ValueError):
+    # The constraints of a schedule can't all be met
+    pass
+
+
+def timed(function):
+    # Records how long each call of "function" takes (in schedule_stats)
+    def timed_function(*args, **kwargs):
+        start_ns = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed_ns = perf_counter_ns() - start_ns
+            stats = schedule_stats.setdefault(function.__qualname__, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += elapsed_ns
+            stats[2] = max(stats[2], elapsed_ns)
+    timed_function.__name__ = function.__name__
+    timed_function.__qualname__ = function.__qualname__
+    timed_function.__doc__ = function.__doc__
+    return timed_function
+
+
+def reset_schedule_stats():
+    # At the start of each session (see TaskScreen)
+    schedule_stats.clear()
+
+
+def print_schedule_summary():
+    # Printed at the end of a session
+    if not schedule_stats:
+        return
+    n_calls = sum(stats[0] for stats in schedule_stats.values())
+    total_ms = sum(stats[1] for stats in schedule_stats.values()) / 1e6
+    max_ms = max(stats[2] for stats in schedule_stats.values()) / 1e6
+    console.info(f"- Trial schedule: {n_calls} steps in {total_ms:.2f} ms (max {max_ms:.2f} ms)")
+    for name, (calls, total_ns, slowest_ns) in sorted(schedule_stats.items()):
+        console.debug(f"    {name:<30} {calls:>5} calls {total_ns/1e6:>8.2f} ms (max {slowest_ns/1e6:.2f} ms)")
+
+
+def run_fits(remaining, side, last_side, run_length, max_run):
+    # Whether the "remaining" count of each side can still be placed with no
+    # run longer than max_run, if "side" is the next one. Each side's runs
+    # must be split up by the other sides (and a run of the last side can
+    # only grow to max_run).
+    n_left = sum(remaining.values()) - 1
+    run_length = run_length + 1 if side == last_side else 1
+    for other_side, count in remaining.items():
+        if other_side == side:
+            count -= 1
+            if count > (max_run - run_length) + max_run * (n_left - count):
+                return False
+        elif count > max_run * (n_left - count + 1):
+            return False
+    return True
+
+
+@timed
+def side_sequence(n, sides = ("left", "right"), max_run = None):
+    """
+    n sides, each of "sides" equally often (any remainder goes to randomly
+    chosen sides), in random order with no more than "max_run" of the same
+    side in a row.
+    """
+    sides = list(sides)
+    remaining = {side: n // len(sides) for side in sides}
+    for side in sample(sides, n % len(sides)):
+        remaining[side] += 1
+    if max_run is None:
+        sequence = [side for side in sides for _ in range(remaining[side])]
+        shuffle(sequence)
+        return sequence
+    if max_run < 1 or any(count > max_run * (n - count + 1) for count in remaining.values()):
+        raise ScheduleError(f"{n} trials can't be split evenly across {sides} with at most {max_run} in a row")
+
+    # Each side is drawn in proportion to how many of it are left, from the
+    # sides that can come next without making an impossible ending
+    sequence = []
+    last_side = None
+    run_length = 0
+    for _ in range(n):
+        candidates = [side for side in sides
+                      if remaining[side] > 0
+                      and not (side == last_side and run_length >= max_run)
+                      and run_fits(remaining, side, last_side, run_length, max_run)]
+        if not candidates:
+            raise ScheduleError(f"{n} trials can't be split evenly across {sides} with at most {max_run} in a row")
+        pick = random() * sum(remaining[side] for side in candidates)
+        for side in candidates:
+            pick -= remaining[side]
+            if pick < 0:
+                break
+        remaining[side] -= 1
+        run_length = run_length + 1 if side == last_side else 1
+        last_side = side
+        sequence.append(side)
+    return sequence
+
+
+@timed
+def balanced_side_rounds(items, n_rounds, sides = ("left", "right")):
+    """
+    A side for each item in each of n_rounds rounds (a list of one
+    {item: side} per round). Every item is on each side in exactly half of
+    the rounds, and each round puts half of the items on each side (with an
+    odd number of items, the extra one alternates between the sides).
+    """
+    items = list(items)
+    first_side, second_side = sides
+    if n_rounds % 2:
+        raise ScheduleError(f"{n_rounds} rounds can't show each item equally often on each side")
+    # How many items go on the first side, each round
+    quotas = [len(items) // 2] * n_rounds
+    if len(items) % 2:
+        for round_index in sample(range(n_rounds), n_rounds // 2):
+            quotas[round_index] += 1
+
+    # Each round, the items that still need the first side most get it
+    # (ties broken at random), which always leaves the remaining rounds
+    # solvable
+    first_side_needed = {item: n_rounds // 2 for item in items}
+    rounds = []
+    for quota in quotas:
+        ranked = sorted(items, key = lambda item: (-first_side_needed[item], random()))
+        first_side_items = set(ranked[:quota])
+        for item in first_side_items:
+            first_side_needed[item] -= 1
+        rounds.append({item: first_side if item in first_side_items else second_side
+                       for item in items})
+    return rounds
+
+
+@timed
+def spaced_interleave(train_trials, probe_trials, min_gap = 1):
+    """
+    Both lists shuffled and combined, with the probes placed at random among
+    the training trials but at least min_gap training trials apart.
+    """
+    train = list(train_trials)
+    probes = list(probe_trials)
+    shuffle(train)
+    shuffle(probes)
+    n_free = len(train) - max(len(probes) - 1, 0) * min_gap
+    if n_free < 0:
+        raise ScheduleError(f"{len(probes)} probes can't be {min_gap} training trials apart with only {len(train)} training trials")
+
+    # The training trials that aren't needed between probes are spread over
+    # the len(probes) + 1 gaps (every way of doing so is equally likely)
+    bars = sorted(sample(range(n_free + len(probes)), len(probes)))
+    gaps = [bar - index for index, bar in enumerate(bars)]
+    out = []
+    train_index = 0
+    for probe_index, probe in enumerate(probes):
+        n_before = gaps[probe_index] - (gaps[probe_index - 1] if probe_index else 0)
+        if probe_index:
+            n_before += min_gap
+        out.extend(train[train_index:train_index + n_before])
+        train_index += n_before
+        out.append(probe)
+    out.extend(train[train_index:])
+    return out
+
+
+class StimulusIndex(object):
+    # A session's stimuli (a dict of file name -> {"type", "trial_type",
+    # "phase", "pair_num", ...}, like FOAM's stimuli_dict), grouped once by
+    # (type, trial_type, phase), and by (type, trial_type, None) across every
+    # phase, so that drawing from a group never scans every stimulus
+    def __init__(self, stimuli_dict):
+        self.groups = {} # (type, trial_type, phase) -> file names
+        self.pair_positions = {} # (type, trial_type, phase) -> {pair_num: positions in the group}
+        for file_name, entry in stimuli_dict.items():
+            for key in [(entry["type"], entry["trial_type"], entry["phase"]),
+                        (entry["type"], entry["trial_type"], None)]:
+                names = self.groups.setdefault(key, [])
+                self.pair_positions.setdefault(key, {}).setdefault(entry["pair_num"], []).append(len(names))
+                names.append(file_name)
+
+    def names(self, stim_type, trial_type, phase = None):
+        return self.groups.get((stim_type, trial_type, phase), [])
+
+    @timed
+    def choose(self, stim_type, trial_type, phase = None, excluded_pair_num = None):
+        # A random stimulus of the group, other than those of the pair
+        # "excluded_pair_num": a random position among the others, moved
+        # past the (few) excluded positions
+        key = (stim_type, trial_type, phase)
+        names = self.groups.get(key, [])
+        skipped = self.pair_positions.get(key, {}).get(excluded_pair_num, [])
+        if len(names) <= len(skipped):
+            raise ScheduleError(f"No {stim_type} {trial_type} stimuli other than pair {excluded_pair_num}")
+        index = randrange(len(names) - len(skipped))
+        for position in skipped:
+            if position > index:
+                break
+            index += 1
+        return names[index]
+
+
+class NoRepeatPool(object):
+    # Draws items (e.g., foils, or a session's samples) without repeats:
+    # every candidate is drawn once (in random order) before any is drawn
+    # again
+    def __init__(self, candidates):
+        self.candidates = list(candidates)
+        self.cycle = []
+
+    @timed
+    def draw(self, excluded = ()):
+        # The next item that isn't in "excluded". If every item left in this
+        # cycle is excluded, a new cycle is started (skipping them).
+        for _ in range(2):
+            for index in range(len(self.cycle) - 1, -1, -1):
+                if self.cycle[index] not in excluded:
+                    return self.cycle.pop(index)
+            self.cycle = list(self.candidates)
+            shuffle(self.cycle)
+        raise ScheduleError(f"Every item is excluded ({excluded})")
+
+    def draw_many(self, n, excluded = ()):
+        return [self.draw(excluded) for _ in range(n)]
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Deadline-based scheduling of a session's timed state transitions.
+
+The P035 programs used to chain root.after(ms, ...) calls: the hopper timer
+was started whenever the reinforcement function happened to run, the ITI
+timer whenever the hopper callback happened to run, and so on. Every link
+in that chain adds the latency of the Tk callback that started it, so the
+session slowly drifts over the course of 96-160 trials.
+
+The SessionScheduler below plans every transition against an absolute
+deadline on the session's (monotonic) SessionClock instead. A transition
+scheduled from inside another scheduled transition is planned from the
+deadline of that transition (when it was supposed to happen), rather than
+from when it actually ran, so lateness doesn't pile up from one link of
+the chain to the next. Only a single Tk timer is ever pending (for the
+earliest deadline), every transition can be cancelled, and the intended and
+actual onset of every transition is recorded so that timing can be checked
+at the end of a session.
+"""
+from heapq import heappush, heappop
+from itertools import count
+from p035.console import console
+
+
+class ScheduledCall(object):
+    # Returned by SessionScheduler.after(), and can be passed to cancel()
+    def __init__(self, deadline_ns, callback, name):
+        self.deadline_ns = deadline_ns # Intended onset (on the session clock)
+        self.callback = callback
+        self.name = name
+        self.cancelled = False
+
+
+class SessionScheduler(object):
+    # "early_ns" is how close to its deadline a call must be to be run;
+    # Tk timers only have ms resolution, so they may wake up a hair early.
+    def __init__(self, root, clock, early_ns = 500000):
+        self.root = root
+        self.clock = clock
+        self.early_ns = early_ns
+        self.calls = [] # heap of (deadline_ns, order scheduled, ScheduledCall)
+        self.order = count()
+        self.tk_timer = None # ID of the one pending root.after() timer
+        self.tk_timer_deadline_ns = None
+        self.running_call = None # The call being run right now (if any)
+        self.onset_log = [] # (name, intended onset ns, actual onset ns)
+
+    def after(self, delay_ms, callback, name = None, anchor_ns = None):
+        # Schedules callback() delay_ms after the anchor. By default, the
+        # anchor is the deadline of the transition currently being run (if
+        # this is called from within one) or else the present moment.
+        if anchor_ns is None:
+            if self.running_call is not None:
+                anchor_ns = self.running_call.deadline_ns
+            else:
+                anchor_ns = self.clock.now()
+        call = ScheduledCall(anchor_ns + int(delay_ms * 1000000),
+                             callback,
+                             name or getattr(callback, "__name__", "call"))
+        heappush(self.calls, (call.deadline_ns, next(self.order), call))
+        self.arm_tk_timer()
+        return call
+
+    def cancel(self, call):
+        # Cancelled calls are simply skipped once they come up
+        if call is not None:
+            call.cancelled = True
+
+    def cancel_all(self):
+        for deadline_ns, order, call in self.calls:
+            call.cancelled = True
+        self.calls = []
+        if self.tk_timer is not None:
+            self.root.after_cancel(self.tk_timer)
+            self.tk_timer = None
+            self.tk_timer_deadline_ns = None
+
+    def arm_tk_timer(self):
+        # Makes sure the one pending Tk timer goes off at the earliest
+        # (non-cancelled) deadline.
+        while self.calls and self.calls[0][2].cancelled:
+            heappop(self.calls)
+        if not self.calls:
+            return
+        next_deadline_ns = self.calls[0][0]
+        if self.tk_timer is not None:
+            if self.tk_timer_deadline_ns <= next_deadline_ns:
+                return # Already set to go off in time
+            self.root.after_cancel(self.tk_timer)
+        # Rounded up, so that the Tk timer never goes off before the deadline
+        delay_ms = max(0, -((self.clock.now() - next_deadline_ns) // 1000000))
+        self.tk_timer = self.root.after(delay_ms, self.run_due_calls)
+        self.tk_timer_deadline_ns = next_deadline_ns
+
+    def run_due_calls(self):
+        # Runs (in order) every call whose deadline has come.
+        self.tk_timer = None
+        self.tk_timer_deadline_ns = None
+        try:
+            while self.calls:
+                deadline_ns, order, call = self.calls[0]
+                if call.cancelled:
+                    heappop(self.calls)
+                    continue
+                now_ns = self.clock.now()
+                if deadline_ns - now_ns > self.early_ns:
+                    break
+                heappop(self.calls)
+                self.onset_log.append((call.name, deadline_ns, now_ns))
+                self.running_call = call
+                try:
+                    call.callback()
+                finally:
+                    self.running_call = None
+        finally:
+            # Even if a callback fails, the calls after it still need to run
+            self.arm_tk_timer()
+
+    def print_summary(self):
+        # Printed at the end of a session. Lateness is how long after its
+        # intended onset each transition actually started.
+        if not self.onset_log:
+            return
+        lateness_ms = [(actual_ns - intended_ns) / 1e6
+                       for name, intended_ns, actual_ns in self.onset_log]
+        console.info(f"- {len(lateness_ms)} scheduled transitions | lateness (ms): mean {sum(lateness_ms)/len(lateness_ms):.2f}, max {max(lateness_ms):.2f}")
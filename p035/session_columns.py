@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Optional columnar copy of a session's data, for fast bulk analysis.
+
+The .csv of a session has 22-28 columns, most of them the same few strings
+over and over (the subject, date, phase, and stimulus names are repeated on
+every row), and every value of every file has to be parsed again each time
+the data are analyzed. Alongside the .csv, a session can also be saved as
+columns, in NumPy's own .npz format:
+
+- Every column is one typed array. Columns of whole numbers are int64
+  ("NA" isn't a number, so a column with any "NA"s is float64 with NaN in
+  their place), other numbers are float64, and SessionTime (and any other
+  "H:MM:SS.ffffff" column) is float64 seconds.
+- Every other column is dictionary-encoded: a code for each row
+  ("<column>"; uint8 if there are up to 256 distinct strings, uint16 up to
+  65536, and int32 beyond that), and the distinct strings once
+  ("<column>__categories").
+- "__columns__" is the column names, in the .csv's order.
+
+The archive isn't compressed, so numpy.load() reads each column straight
+into an array, with nothing to parse. It is written at the end of a session
+(from the finished session_data_frame), next to the data file, with the same
+name ending in "_columns.npz" instead of ".csv", if the P035_COLUMNAR
+environment variable is set before starting a program:
+
+    P035_COLUMNAR=1 python3 P035g_Wasserman_replication.py
+
+Writing needs nothing but the standard library; reading it back (see
+load_session_columns()) needs NumPy. The .csv files of past sessions can be
+converted too. From the P035 folder:
+
+    python -m p035.session_columns Data/*/*.csv
+"""
+from argparse import ArgumentParser
+from array import array
+from csv import reader as csv_reader
+from os import environ, replace, path as os_path
+from re import compile as re_compile
+from sys import byteorder
+from zipfile import ZipFile, ZIP_STORED
+
+# Whether the columns are written at the end of each session (see above)
+columnar_enabled = environ.get("P035_COLUMNAR", "") not in ("", "0")
+
+# Values that mean "no value"
+missing_values = {"NA", ""}
+
+# str() of a timedelta, e.g., "0:01:02.345000" or "1 day, 0:00:01"
+time_pattern = re_compile(r"^(?:(-?\d+) days?, )?(\d+):(\d\d):(\d\d(?:\.\d+)?)$")
+int_pattern = re_compile(r"^-?(?:0|[1-9]\d{0,17})$")
+
+
+def as_text(value):
+    # The same text the .csv has for a value
+    return "" if value is None else str(value)
+
+
+def time_seconds(text):
+    days, hours, minutes, seconds = time_pattern.match(text).groups()
+    return (int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60
+            + float(seconds))
+
+
+def is_float(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return text.strip().lower() not in ("nan", "inf", "-inf", "infinity", "-infinity")
+
+
+def column_kind(values):
+    # "int", "float", "time", or "string" (for a column of .csv text)
+    present = [value for value in values if value not in missing_values]
+    if not present:
+        return "string"
+    if all(int_pattern.match(value) for value in present):
+        return "int" if len(present) == len(values) else "float"
+    if all(time_pattern.match(value) for value in present):
+        return "time"
+    if all(is_float(value) for value in present):
+        return "float"
+    return "string"
+
+
+def npy_bytes(descr, n, data):
+    # A one-dimensional .npy file (format version 1.0)
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({n},), }}"
+    # The header is padded with spaces (and ends with a newline) so that
+    # the data start at a multiple of 64 bytes
+    header_length = len(header) + 1
+    header += " " * (-(10 + header_length) % 64) + "\n"
+    return (b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little")
+            + header.encode("latin1") + data)
+
+
+def array_bytes(typecode, values):
+    # Little-endian bytes of an array.array (as "<i8", "<f8", etc. say)
+    values = array(typecode, values)
+    if byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def string_array_bytes(strings):
+    # A NumPy unicode ("<U") array: fixed width, UTF-32 (little-endian)
+    width = max([len(string) for string in strings] + [1])
+    return (f"<U{width}",
+            b"".join(string.encode("utf-32-le").ljust(width * 4, b"\0")
+                     for string in strings))
+
+
+def encode_columns(session_data_frame):
+    # Yields (array name, descr, length, bytes) for each array of the
+    # archive. The first row of session_data_frame is the column headers.
+    column_names = [as_text(name) for name in session_data_frame[0]]
+    rows = session_data_frame[1:]
+    n = len(rows)
+    descr, data = string_array_bytes(column_names)
+    yield "__columns__", descr, len(column_names), data
+    for index, column_name in enumerate(column_names):
+        values = [as_text(row[index]) if index < len(row) else "" for row in rows]
+        kind = column_kind(values)
+        if kind == "int":
+            yield column_name, "<i8", n, array_bytes("q", [int(value) for value in values])
+        elif kind == "float":
+            yield column_name, "<f8", n, array_bytes("d", [float("nan") if value in missing_values
+                                                           else float(value) for value in values])
+        elif kind == "time":
+            yield column_name, "<f8", n, array_bytes("d", [float("nan") if value in missing_values
+                                                           else time_seconds(value) for value in values])
+        else:
+            codes = {} # string -> code (in the order they first appear)
+            row_codes = [codes.setdefault(value, len(codes)) for value in values]
+            if len(codes) <= 256:
+                yield column_name, "|u1", n, array_bytes("B", row_codes)
+            elif len(codes) <= 65536:
+                yield column_name, "<u2", n, array_bytes("H", row_codes)
+            else:
+                yield column_name, "<i4", n, array_bytes("i", row_codes)
+            descr, data = string_array_bytes(list(codes))
+            yield column_name + "__categories", descr, len(codes), data
+
+
+def write_session_columns(session_data_frame, file_path):
+    # Written to a temporary file first, so an archive is never half written
+    with ZipFile(file_path + ".tmp", "w", ZIP_STORED) as archive:
+        for name, descr, n, data in encode_columns(session_data_frame):
+            archive.writestr(f"{name}.npy", npy_bytes(descr, n, data))
+    replace(file_path + ".tmp", file_path)
+
+
+def columns_file_path(data_file_path):
+    # Next to the session's .csv
+    return os_path.splitext(data_file_path)[0] + "_columns.npz"
+
+
+def load_session_columns(file_path, decode_strings = True):
+    # Returns {column name: NumPy array}, in the .csv's column order. The
+    # strings of dictionary-encoded columns are looked up, unless
+    # "decode_strings" is False (then those columns are the codes,
+    # and "<column>__categories" are the strings).
+    import numpy # (only needed to read the columns back)
+    with numpy.load(file_path) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    columns = {}
+    for column_name in arrays.pop("__columns__").tolist():
+        categories = arrays.get(column_name + "__categories")
+        if categories is not None and decode_strings:
+            columns[column_name] = categories[arrays[column_name]]
+        else:
+            columns[column_name] = arrays[column_name]
+            if categories is not None:
+                columns[column_name + "__categories"] = categories
+    return columns
+
+
+def main():
+    parser = ArgumentParser(description = "Save P035 data files (.csv) as columns (.npz)")
+    parser.add_argument("data_files", nargs = "+", help = "session .csv files")
+    args = parser.parse_args()
+    for data_file_path in args.data_files:
+        with open(data_file_path, newline = "") as data_file:
+            session_data_frame = list(csv_reader(data_file))
+        if not session_data_frame:
+            print(f"{data_file_path}: empty, skipped")
+            continue
+        file_path = columns_file_path(data_file_path)
+        write_session_columns(session_data_frame, file_path)
+        print(f"{file_path} ({len(session_data_frame) - 1} rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Optional SQLite database of every session (and the FM stimuli logs).
+
+Each session's data is its own .csv (under <data folder>/<subject>/), and
+the FM FOILs used so far are in FM_stimuli_logs/*.csv, so answering
+something like "accuracy on pair 37 for Athena across all phase 6 sessions"
+meant reading every one of those files. The database below keeps all of
+them in one SQLite file, with indexes for the usual questions:
+
+- sessions: one row per data file (its path, task code, subject, phase
+  number and start time from its name, the .csv's column names, and its
+  size/modification time when it was last taken in).
+- events: one row per .csv row, with the columns that are asked about most
+  pulled out (and indexed): subject, phase, trial type, sample stimulus,
+  and pair, as well as the session time (s), event, and trial number. The
+  whole row is kept too (as a JSON list, in the order of the session's
+  columns), so nothing is lost.
+- fm_stimuli: one row per FOIL in the FM stimuli logs.
+
+Programs name the same things differently (e.g., ExpPhase/TrainingPhase,
+SampleStimulus/SampleFile), so each pulled-out column is taken from the
+first of its possible .csv columns that a session has (see event_columns).
+A "Phase " at the start of a phase is dropped ("Phase 6" is stored as "6").
+
+Sessions are taken in one at a time: at the end of each session, if the
+P035_DATABASE environment variable is set to the database's file, e.g.:
+
+    P035_DATABASE=~/Desktop/Data/P035.sqlite python3 P035_FOAM_ExpProgram_RPi.py
+
+and in bulk, from existing folders of .csv files (files that haven't
+changed since they were last taken in are skipped, so this can be re-run
+at any time). From the P035 folder:
+
+    python -m p035.session_database P035.sqlite import Data FM_stimuli_logs
+    python -m p035.session_database P035.sqlite accuracy --subject Athena --phase 6 --pair 37
+"""
+from argparse import ArgumentParser
+from csv import reader as csv_reader
+from json import dumps
+from os import environ, stat, walk, path as os_path
+from re import compile as re_compile
+import sqlite3
+from p035.console import console
+from p035.session_columns import as_text, int_pattern, time_pattern, time_seconds
+
+# The database sessions are added to at the end of each session (if any)
+database_path = os_path.expanduser(environ.get("P035_DATABASE", "").strip())
+database_enabled = database_path != ""
+
+# The .csv columns each pulled-out column of "events" is taken from (the
+# first one a session has)
+event_columns = {"subject": ["Subject"],
+                 "phase": ["TrainingPhase", "ExpPhase"],
+                 "trial_type": ["TrialType", "SampleTrialType"],
+                 "sample": ["SampleStimulus", "SampleFile"],
+                 "pair": ["PairNum", "PairedCompFile"],
+                 "event": ["Event"]}
+
+# e.g., "Athena_2023-03-09_10.15.00_P035_data-Phase6.csv"
+data_file_pattern = re_compile(r"^(?P<subject>.+)_(?P<start_time>\d{4}-\d\d-\d\d_\d\d\.\d\d\.\d\d)_(?P<task_code>.+)_data-Phase(?P<phase_num>\d+)\.csv$")
+fm_log_suffix = "_Used_FM_Stimuli_Log.csv"
+
+schema = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id INTEGER PRIMARY KEY,
+    data_file TEXT NOT NULL UNIQUE,
+    task_code TEXT,
+    subject TEXT,
+    phase_num INTEGER,
+    start_time TEXT,
+    columns TEXT NOT NULL,
+    n_rows INTEGER NOT NULL,
+    file_size INTEGER,
+    file_mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS events (
+    session_id INTEGER NOT NULL REFERENCES sessions ON DELETE CASCADE,
+    row_num INTEGER NOT NULL,
+    session_time REAL,
+    subject TEXT,
+    phase TEXT,
+    trial_num INTEGER,
+    trial_type TEXT,
+    event TEXT,
+    sample TEXT,
+    pair TEXT,
+    row_values TEXT NOT NULL,
+    PRIMARY KEY (session_id, row_num));
+CREATE INDEX IF NOT EXISTS events_subject_phase ON events (subject, phase);
+CREATE INDEX IF NOT EXISTS events_sample ON events (sample);
+CREATE INDEX IF NOT EXISTS events_pair ON events (pair);
+CREATE INDEX IF NOT EXISTS events_trial_type ON events (trial_type);
+CREATE INDEX IF NOT EXISTS events_event ON events (event);
+CREATE TABLE IF NOT EXISTS fm_stimuli (
+    subject TEXT NOT NULL,
+    stimulus TEXT NOT NULL,
+    date_used TEXT,
+    fm_phase TEXT,
+    UNIQUE (subject, stimulus, date_used, fm_phase));
+CREATE INDEX IF NOT EXISTS fm_stimuli_stimulus ON fm_stimuli (stimulus);
+"""
+
+
+def open_database(file_path):
+    # Opens (creating it if needed) the database
+    connection = sqlite3.connect(file_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL") # Readers don't block a session
+    connection.executescript(schema)
+    return connection
+
+
+def optional(value):
+    # "NA" (or nothing) is stored as NULL
+    return None if value in ("NA", "") else value
+
+
+def phase_text(value):
+    value = optional(value)
+    if value is not None and value.startswith("Phase "):
+        value = value[len("Phase "):]
+    return value
+
+
+def ingest_session(connection, data_file_path, session_data_frame,
+                   file_size = None, file_mtime_ns = None):
+    # Adds a session (replacing it if its data file was taken in before).
+    # The first row of session_data_frame is the column headers.
+    data_file_path = os_path.abspath(data_file_path)
+    column_names = [as_text(name) for name in session_data_frame[0]]
+    column_index = {name: index for index, name in reversed(list(enumerate(column_names)))}
+    pulled_out = {}
+    for name, candidates in event_columns.items():
+        pulled_out[name] = next((column_index[c] for c in candidates if c in column_index), None)
+    time_index = column_index.get("SessionTime")
+    trial_num_index = column_index.get("TrialNum")
+    name_match = data_file_pattern.match(os_path.basename(data_file_path))
+
+    def value_at(values, index):
+        return values[index] if index is not None and index < len(values) else ""
+
+    with connection: # (one transaction)
+        connection.execute("DELETE FROM sessions WHERE data_file = ?", (data_file_path,))
+        cursor = connection.execute(
+            "INSERT INTO sessions (data_file, task_code, subject, phase_num, start_time, "
+            "columns, n_rows, file_size, file_mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (data_file_path,
+             name_match["task_code"] if name_match else None,
+             name_match["subject"] if name_match else None,
+             int(name_match["phase_num"]) if name_match else None,
+             name_match["start_time"] if name_match else None,
+             dumps(column_names),
+             len(session_data_frame) - 1,
+             file_size,
+             file_mtime_ns))
+        session_id = cursor.lastrowid
+        event_rows = []
+        for row_num, row in enumerate(session_data_frame[1:], 1):
+            values = [as_text(value) for value in row]
+            session_time = value_at(values, time_index)
+            trial_num = value_at(values, trial_num_index)
+            event_rows.append((session_id,
+                               row_num,
+                               time_seconds(session_time) if time_pattern.match(session_time) else None,
+                               optional(value_at(values, pulled_out["subject"])),
+                               phase_text(value_at(values, pulled_out["phase"])),
+                               int(trial_num) if int_pattern.match(trial_num) else None,
+                               optional(value_at(values, pulled_out["trial_type"])),
+                               optional(value_at(values, pulled_out["event"])),
+                               optional(value_at(values, pulled_out["sample"])),
+                               optional(value_at(values, pulled_out["pair"])),
+                               dumps(values)))
+        connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               event_rows)
+    return len(event_rows)
+
+
+def ingest_data_file(connection, data_file_path):
+    # Adds a session from its .csv, unless it hasn't changed since it was
+    # last taken in. Returns the number of rows added (None if skipped).
+    file_stat = stat(data_file_path)
+    already = connection.execute("SELECT file_size, file_mtime_ns FROM sessions WHERE data_file = ?",
+                                 (os_path.abspath(data_file_path),)).fetchone()
+    if already == (file_stat.st_size, file_stat.st_mtime_ns):
+        return None
+    with open(data_file_path, newline = "", encoding = "utf-8-sig") as data_file:
+        session_data_frame = list(csv_reader(data_file))
+    if not session_data_frame or "Event" not in session_data_frame[0]:
+        return None # (not session data)
+    return ingest_session(connection, data_file_path, session_data_frame,
+                          file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def ingest_fm_log(connection, log_file_path):
+    # Adds the FOILs in an FM stimuli log (those already in are skipped).
+    # Returns the number of log rows.
+    with open(log_file_path, newline = "", encoding = "utf-8-sig") as log_file:
+        rows = list(csv_reader(log_file))[1:]
+    with connection:
+        connection.executemany("INSERT OR IGNORE INTO fm_stimuli VALUES (?, ?, ?, ?)",
+                               [(row[0], row[1], optional(row[2]), optional(row[3]))
+                                for row in rows if len(row) >= 4])
+    return len(rows)
+
+
+def import_folders(connection, folder_paths):
+    # Takes in every session .csv and FM stimuli log under the folders.
+    # Returns (sessions added, sessions skipped, FM logs read).
+    n_added = n_skipped = n_logs = 0
+    for folder_path in folder_paths:
+        for parent_folder, folder_names, file_names in walk(folder_path):
+            folder_names.sort()
+            for file_name in sorted(file_names):
+                file_path = os_path.join(parent_folder, file_name)
+                if file_name.endswith(fm_log_suffix):
+                    ingest_fm_log(connection, file_path)
+                    n_logs += 1
+                elif file_name.endswith(".csv"):
+                    if ingest_data_file(connection, file_path) is None:
+                        n_skipped += 1
+                    else:
+                        n_added += 1
+    return n_added, n_skipped, n_logs
+
+
+def add_to_database(ingest, *args):
+    # Used by the programs: opens the database (P035_DATABASE), calls
+    # ingest(connection, *args) (e.g., ingest_session), and closes it
+    # again. A problem with the database is only reported, so it can never
+    # stop a session.
+    try:
+        connection = open_database(database_path)
+        try:
+            return ingest(connection, *args)
+        finally:
+            connection.close()
+    except (sqlite3.Error, OSError) as e:
+        console.warning(f"\n- ERROR: could not update the database {database_path} ({e})")
+        return None
+
+
+def choice_accuracy(connection, **filters):
+    # (correct choices, choices) for the events matching the filters, any of
+    # subject, phase, trial_type, sample, and pair (e.g., subject = "Athena",
+    # phase = "6", pair = "37")
+    unknown = set(filters) - {"subject", "phase", "trial_type", "sample", "pair"}
+    if unknown:
+        raise ValueError(f"Can't filter by {', '.join(sorted(unknown))}")
+    conditions = ["event IN ('correct_choice', 'incorrect_choice')"]
+    conditions += [f"{name} = ?" for name in filters]
+    return connection.execute(
+        "SELECT COALESCE(SUM(event = 'correct_choice'), 0), COUNT(*) FROM events WHERE "
+        + " AND ".join(conditions), list(filters.values())).fetchone()
+
+
+def main():
+    parser = ArgumentParser(description = "The P035 SQLite database of sessions")
+    parser.add_argument("database", help = "the database file (created if needed)")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    import_parser = commands.add_parser("import", help = "take in .csv files (sessions and FM logs)")
+    import_parser.add_argument("folders", nargs = "+")
+    accuracy_parser = commands.add_parser("accuracy", help = "choice accuracy")
+    for name in ["subject", "phase", "trial_type", "sample", "pair"]:
+        accuracy_parser.add_argument(f"--{name.replace('_', '-')}", dest = name)
+    args = parser.parse_args()
+
+    connection = open_database(args.database)
+    try:
+        if args.command == "import":
+            n_added, n_skipped, n_logs = import_folders(connection, args.folders)
+            print(f"{n_added} sessions added, {n_skipped} unchanged (or not session data), {n_logs} FM logs read")
+        else:
+            filters = {name: getattr(args, name)
+                       for name in ["subject", "phase", "trial_type", "sample", "pair"]
+                       if getattr(args, name) is not None}
+            n_correct, n_choices = choice_accuracy(connection, **filters)
+            accuracy = f"{n_correct / n_choices:.1%}" if n_choices else "-"
+            print(f"{accuracy} ({n_correct}/{n_choices} correct choices)")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Trial schedules generated ahead of time, for each subject and phase.
+
+Every session used to build its trial order (stimuli_assignment_dict,
+stimulus_order_dict, etc.) at random when the program was started. The
+orders of a subject's next sessions can instead be generated beforehand,
+with a tool run from the P035 folder:
+
+    python -m p035.session_schedules make P035g Bowser \\
+        "Phase 2 (Unsupervised Training)" 2 --sessions 20
+
+The arguments after the subject are the rest of the ones the program's
+control panel would pass to MainScreen() (after whether to record data and
+the data folder), as for p035.simulation. Each session's schedule is built
+by the program's own build_schedule(), with a seed of its own, so it is the
+same order a session started with that seed would have had.
+
+The schedules of a subject and phase are kept in one (compressed) file,
+session_schedules/<task code>/<subject>_phase_<phase>.zip: an index, with
+each session's seed, when it was generated, how long it took to build, and
+its counterbalancing (how often each side, trial type, stimulus, etc. comes
+up, and the longest run of the same side), and one member per session. So
+every order can be looked over before it is ever run:
+
+    python -m p035.session_schedules show P035g Bowser 2
+
+When a session starts, its MainScreen takes the next schedule that hasn't
+been used (a single member of the file, found through the small ".next" file
+beside it) instead of building one, and marks it as used once the session
+actually starts (i.e., once the space bar is pressed). Once they've all been
+used, or if there are none, sessions build their own order as before.
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dumps, loads
+from os import environ, makedirs, replace, path as os_path
+from random import SystemRandom
+from time import perf_counter_ns
+from zipfile import ZipFile, ZIP_DEFLATED
+from p035.tasks import programs_folder
+
+# Where the schedules are kept (None: sessions always build their own order)
+schedules_folder = os_path.join(programs_folder, "session_schedules")
+
+# Trial fields with up to this many different values are counted value by
+# value (e.g., sides and trial types); others (e.g., stimulus names) only
+# have how often the least and most frequent values come up
+max_counted_values = 12
+
+
+def schedule_file_path(folder, task_code, subject_ID, phase):
+    return os_path.join(folder, task_code, f"{subject_ID}_phase_{phase}.zip")
+
+
+def encode(value):
+    # JSON only has string keys, so dicts with other keys (e.g., trial
+    # numbers) are saved as a list of [key, value] pairs
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: encode(item) for key, item in value.items()}
+        return {"__items__": [[key, encode(item)] for key, item in value.items()]}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict):
+        if "__items__" in value:
+            return {key: decode(item) for key, item in value["__items__"]}
+        return {key: decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+def longest_run(values):
+    longest = run = 0
+    last_value = None
+    for value in values:
+        run = run + 1 if value == last_value else 1
+        last_value = value
+        longest = max(longest, run)
+    return longest
+
+
+def counterbalancing(attributes):
+    # For each trial order (a dict of trial number -> trial dict) in a
+    # schedule: how many trials it has, and for each field of its trials,
+    # how often each value comes up
+    statistics = {}
+    for name, trials in attributes.items():
+        if not (isinstance(trials, dict) and trials
+                and all(isinstance(trial, dict) for trial in trials.values())):
+            continue
+        fields = {}
+        for trial in trials.values():
+            for field, value in trial.items():
+                if isinstance(value, (str, int)):
+                    fields.setdefault(field, []).append(value)
+        field_statistics = {}
+        for field, values in fields.items():
+            counts = {}
+            for value in values:
+                counts[str(value)] = counts.get(str(value), 0) + 1
+            if len(counts) <= max_counted_values:
+                field_statistics[field] = dict(sorted(counts.items()))
+            else:
+                field_statistics[field] = {"distinct": len(counts),
+                                           "min": min(counts.values()),
+                                           "max": max(counts.values())}
+            if set(counts) <= {"left", "right"}:
+                field_statistics[field]["longest_run"] = longest_run(values)
+        statistics[name] = {"trials": len(trials), "fields": field_statistics}
+    return statistics
+
+
+class PrecompiledSchedule(object):
+    # One session's schedule, as loaded by next_schedule()
+    def __init__(self, file_path, session, n_sessions, seed, attributes):
+        self.file_path = file_path
+        self.session = session # (numbered from 1)
+        self.n_sessions = n_sessions # In the file
+        self.seed = seed
+        self.attributes = attributes # Attribute name -> value
+
+
+def read_next(file_path):
+    # The number of the next unused session (1 if none have been used)
+    try:
+        with open(file_path + ".next") as next_file:
+            return int(next_file.read().strip() or 1)
+    except (OSError, ValueError):
+        return 1
+
+
+def write_next(file_path, session):
+    with open(file_path + ".next.tmp", "w") as next_file:
+        next_file.write(f"{session}\n")
+    replace(file_path + ".next.tmp", file_path + ".next")
+
+
+def next_schedule(folder, task_code, subject_ID, phase):
+    # The subject's next unused schedule for a phase, or None
+    if folder is None or phase is None:
+        return None
+    file_path = schedule_file_path(folder, task_code, subject_ID, phase)
+    if not os_path.isfile(file_path):
+        return None
+    session = read_next(file_path)
+    with ZipFile(file_path) as archive:
+        try:
+            entry = loads(archive.read(f"session_{session:04d}.json"))
+        except KeyError: # (every schedule in the file has been used)
+            return None
+        n_sessions = sum(1 for name in archive.namelist() if name.startswith("session_"))
+    return PrecompiledSchedule(file_path, session, n_sessions, entry["seed"],
+                               decode(entry["attributes"]))
+
+
+def mark_used(schedule):
+    # Called once the session using "schedule" has started
+    write_next(schedule.file_path, schedule.session + 1)
+
+
+def build_schedule(task, mainscreen_args, seed):
+    # Builds the schedule of one session (headless, like a simulated
+    # session) and returns (phase, attributes, milliseconds taken)
+    from p035.simulation import SimulatedSession # (loads the program)
+    session = SimulatedSession(task, mainscreen_args, seed = seed)
+    start_ns = perf_counter_ns()
+    main_screen = session.build().main_screen
+    build_ms = (perf_counter_ns() - start_ns) / 1e6
+    attributes = {name: getattr(main_screen, name)
+                  for name in main_screen.schedule_attributes
+                  if hasattr(main_screen, name)}
+    if decode(loads(dumps(encode(attributes)))) != attributes:
+        raise ValueError(f"The schedule of {task} can't be saved as JSON")
+    return main_screen.schedule_phase(), attributes, build_ms
+
+
+def make_schedules(task, subject_ID, phase_args, n_sessions, seed = None,
+                   folder = schedules_folder):
+    # Adds n_sessions schedules to the subject's file for the phase (seeds
+    # seed, seed + 1, etc., or random ones). Returns the file's path.
+    mainscreen_args = [subject_ID, False, os_path.join(folder, "unused_data")] + list(phase_args)
+    seeds = ([seed + n for n in range(n_sessions)] if seed is not None else
+             [SystemRandom().randrange(2**31) for n in range(n_sessions)])
+    built = [build_schedule(task, mainscreen_args, session_seed) + (session_seed,)
+             for session_seed in seeds]
+    phases = {phase for phase, attributes, build_ms, session_seed in built}
+    if phases == {None}:
+        raise ValueError(f"Sessions of {task} with these arguments always build their own schedule")
+    phase = phases.pop()
+    task_code = load_task_code(task)
+    file_path = schedule_file_path(folder, task_code, subject_ID, phase)
+    makedirs(os_path.dirname(file_path), exist_ok = True)
+
+    # The sessions already in the file are kept (new ones come after them)
+    members = {}
+    index = {"task": task_code,
+             "subject": subject_ID,
+             "phase": phase,
+             "program_args": [str(arg) for arg in phase_args],
+             "sessions": []}
+    if os_path.isfile(file_path):
+        with ZipFile(file_path) as archive:
+            index = loads(archive.read("index.json"))
+            members = {name: archive.read(name) for name in archive.namelist()
+                       if name != "index.json"}
+    created = datetime.now().isoformat(timespec = "seconds")
+    for _, attributes, build_ms, session_seed in built:
+        session = len(index["sessions"]) + 1
+        index["sessions"].append({"session": session,
+                                  "seed": session_seed,
+                                  "created": created,
+                                  "build_ms": round(build_ms, 3),
+                                  "counterbalancing": counterbalancing(attributes)})
+        members[f"session_{session:04d}.json"] = dumps({"session": session,
+                                                        "seed": session_seed,
+                                                        "attributes": encode(attributes)},
+                                                       separators = (",", ":")).encode("utf-8")
+    # Written to a temporary file first, so the file is never half written
+    with ZipFile(file_path + ".tmp", "w", ZIP_DEFLATED) as archive:
+        archive.writestr("index.json", dumps(index, indent = 1))
+        for name in sorted(members):
+            archive.writestr(name, members[name])
+    replace(file_path + ".tmp", file_path)
+    return file_path
+
+
+def load_task_code(task):
+    from p035.tasks import load_task
+    return load_task(task).MainScreen.task_code
+
+
+def show_schedules(task, subject_ID, phase, folder = schedules_folder):
+    file_path = schedule_file_path(folder, load_task_code(task), subject_ID, phase)
+    with ZipFile(file_path) as archive:
+        index = loads(archive.read("index.json"))
+    next_session = read_next(file_path)
+    print(f"{file_path}: {len(index['sessions'])} sessions, "
+          f"{max(0, len(index['sessions']) - next_session + 1)} unused")
+    for entry in index["sessions"]:
+        used = "used" if entry["session"] < next_session else ""
+        print(f"\nSession {entry['session']:>3} | seed {entry['seed']:>10} | {entry['created']} | {entry['build_ms']:.1f} ms {used}")
+        for name, statistics in entry["counterbalancing"].items():
+            print(f"  {name}: {statistics['trials']} trials")
+            for field, counts in statistics["fields"].items():
+                print(f"    {field:<28} {dumps(counts)}")
+
+
+def main():
+    parser = ArgumentParser(description = "P035 trial schedules generated ahead of time")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    make_parser = commands.add_parser("make", help = "generate the next sessions' schedules")
+    make_parser.add_argument("task", help = "program name (see p035.tasks) or file")
+    make_parser.add_argument("subject")
+    make_parser.add_argument("phase_args", nargs = "*",
+                             help = "the rest of MainScreen's arguments (as for p035.simulation)")
+    make_parser.add_argument("--sessions", type = int, default = 10)
+    make_parser.add_argument("--seed", type = int, default = None,
+                             help = "seed of the first session (default: random seeds)")
+    show_parser = commands.add_parser("show", help = "print the seeds and counterbalancing of each schedule")
+    show_parser.add_argument("task")
+    show_parser.add_argument("subject")
+    show_parser.add_argument("phase", help = "as in the file's name (e.g., 2, or 3.0 for FOAM)")
+    args = parser.parse_args()
+    if args.command == "make":
+        from p035.simulation import parse_mainscreen_arg
+        # (the schedules are built without any hardware)
+        environ.setdefault("P035_CHAMBER", "none")
+        file_path = make_schedules(args.task, args.subject,
+                                   [parse_mainscreen_arg(arg) for arg in args.phase_args],
+                                   args.sessions, args.seed)
+        print(f"{args.sessions} schedules added to {file_path}")
+    else:
+        show_schedules(args.task, args.subject, args.phase)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Background .csv writer for P035 session data.
+
+Every P035 program keeps its trial-by-trial data in a "session_data_frame"
+(a list of rows, with the column headers as the first row). Previously, the
+whole matrix was re-written to the .csv at the end of every trial from
+inside the Tk main loop, so a slow SD card could hold up a peck handler or a
+hopper timer.
+
+The SessionWriter below keeps the in-memory session_data_frame exactly as
+before, but every new row is also put on a queue. A background thread owns
+the .csv file: it appends the queued rows as they arrive and flushes them to
+the disk at least every "max_latency" seconds, whenever "max_rows" rows are
+waiting (if given), and at every trial boundary. A "durable" writer also
+fsyncs the file at every trial boundary, so a power cut loses at most the
+current trial.
+Nothing on the Tk thread ever waits on the disk, except for the final
+drain-and-join when the program exits. The rows are written with the exact
+same csv.writer settings as before, so the finished file is byte-for-byte
+identical to the old output.
+"""
+from csv import writer, QUOTE_MINIMAL
+from os import fsync
+from queue import Queue, Empty
+from threading import Thread
+from time import monotonic
+from p035.console import console
+
+# Markers that can be put on the queue alongside the data rows
+_FLUSH = object() # Push everything written so far to the disk
+_CLOSE = object() # Write what is left, then close the file and stop
+
+
+class SessionWriter(object):
+    # The writer is handed the (live) session_data_frame list when the
+    # MainScreen is built, after the header row has been added to it. Any
+    # rows already in the list are queued up to be written first.
+    def __init__(self, session_data_frame, max_latency=0.5, max_rows=None,
+                 durable=False):
+        self.session_data_frame = session_data_frame
+        self.max_latency = max_latency # Max seconds a row can wait to hit the disk
+        self.max_rows = max_rows # Max rows that can wait to hit the disk (None: no max)
+        self.durable = durable # fsync at every trial boundary?
+        self.file_path = None
+        self.rows_written = 0 # Number of rows already written by the thread
+        self.row_queue = Queue()
+        self.writer_thread = None
+        self.closing = False
+        for row in session_data_frame:
+            self.row_queue.put(row)
+
+    def write_row(self, row):
+        # Called from write_data on the Tk thread. This only adds the row to
+        # the data frame and hands it off to the writer thread.
+        self.session_data_frame.append(row)
+        self.row_queue.put(row)
+
+    def flush(self, file_path):
+        # Called at trial boundaries (e.g., the ITI) and at the end of the
+        # session. The first call starts the writer thread (we don't know
+        # the file name until the session has started); afterwards it just
+        # asks the thread to push what it has to the disk. Never blocks.
+        if self.writer_thread is None:
+            self.file_path = file_path
+            self._start_writer_thread()
+        elif self.closing and not self.writer_thread.is_alive():
+            # The thread that was closed has exited since, so a new one can
+            # append whatever was written after it
+            self._start_writer_thread()
+        # (If a closed thread is still writing, the rows wait in the queue
+        # until it has exited, so two threads never write the file at once)
+        self.row_queue.put(_FLUSH)
+
+    def close(self, timeout=10):
+        # Called from exit_program. Waits for every queued row to be written
+        # and the file to be closed. If anything is written after this (e.g.,
+        # a stray ITI), the next flush re-opens the file and appends to it.
+        if self.writer_thread is None:
+            return
+        if self.closing and not self.writer_thread.is_alive():
+            # Closed earlier (after a timeout); anything queued since still
+            # has to be written
+            if self.row_queue.empty():
+                self.writer_thread = None
+                return
+            self._start_writer_thread()
+        if not self.closing:
+            self.row_queue.put(_CLOSE)
+            self.closing = True
+        self.writer_thread.join(timeout)
+        if self.writer_thread.is_alive():
+            # The thread is kept until it has exited (see flush)
+            console.warning(f"\n- WARNING: data file {self.file_path} is still being written")
+            return
+        self.writer_thread = None
+
+    def _start_writer_thread(self):
+        self.closing = False # Has the thread been asked to close?
+        self.writer_thread = Thread(target=self._write_rows,
+                                    name="SessionWriter",
+                                    daemon=True)
+        self.writer_thread.start()
+
+    def _write_rows(self):
+        # The body of the writer thread. The .csv is created the first time
+        # the thread runs; if it is ever restarted after being closed, we
+        # append to the existing file instead of clobbering it.
+        mode = "w" if self.rows_written == 0 else "a"
+        try:
+            data_file = open(self.file_path, mode, newline="")
+        except OSError as e:
+            console.warning(f"\n- ERROR: could not open data file {self.file_path} ({e})")
+            return
+        with data_file:
+            csv_writer = writer(data_file, quoting=QUOTE_MINIMAL)
+            unflushed = 0 # Rows written since the last flush to disk
+            unsynced = 0 # Rows written since the last fsync
+            last_flush = monotonic()
+            while True:
+                try:
+                    item = self.row_queue.get(timeout=self.max_latency)
+                except Empty:
+                    item = _FLUSH
+                if item is _CLOSE:
+                    break
+                if item is not _FLUSH:
+                    csv_writer.writerow(item)
+                    self.rows_written += 1
+                    unflushed += 1
+                    unsynced += 1
+                if unflushed and (item is _FLUSH or \
+                                  monotonic() - last_flush >= self.max_latency or \
+                                  (self.max_rows is not None and unflushed >= self.max_rows)):
+                    data_file.flush()
+                    unflushed = 0
+                    last_flush = monotonic()
+                # A trial boundary: fsync whatever hasn't been yet, even if
+                # the latency or row budget already flushed it (without
+                # an fsync) just before
+                if self.durable and item is _FLUSH and unsynced:
+                    try:
+                        fsync(data_file.fileno())
+                    except OSError:
+                        pass
+                    unsynced = 0
+            # Make sure everything is physically on the disk (SD card)
+            # before the file is closed at the end of the session.
+            data_file.flush()
+            try:
+                fsync(data_file.fileno())
+            except OSError:
+                pass
@@ -0,0 +1,627 @@
+# -*- coding: utf-8 -*-
+"""
+Headless simulation of whole P035 sessions on a virtual clock.
+
+A simulated session runs the very same MainScreen class as a real session
+(trial generation, FR counting, probe interleaving, correction trials,
+write_data(), etc.); only the things around it are swapped out:
+
+- The Toplevel window and its Canvas are replaced by headless versions that
+  keep track of every item (and its tags, state, and bindings) without ever
+  drawing anything. A peck at (x, y) goes to the topmost item there, just
+  like a touch on the real Canvas does.
+- All timers (root.after(), the SessionScheduler, the SessionClock, and
+  datetime.now()/date.today()) run on a virtual timeline. Nothing ever
+  waits, so a 90 minute session takes a fraction of a second.
+- Stimuli are never decoded; only their size (for hit testing) is read.
+- The chamber is a SimulatedChamber (see p035.chamber), so every hopper and
+  light change is made and timed on the virtual timeline, and the pecks
+  arrive as touches on its screen.
+- Pecks come from a synthetic subject (RandomPecker below, or any object
+  with the same two methods).
+- Nothing outside the data folder is changed: FM sessions (FOAM) choose
+  their FOIL from, and add it to, a temporary copy of the subject's FM
+  log, and no session is added to the session database.
+
+Since the rows are still built by each program's own write_data(), a
+simulated session writes exactly the .csv a real session with the same
+trial order and peck times would. Two simulations with the same seed and
+start time give byte-identical files.
+
+Simulations must NOT be run with the real chamber (the programs would
+connect to its hardware when they're loaded), i.e., on an operant box
+computer, unless P035_CHAMBER is set to "simulated" or "none" there. From the P035 folder:
+
+    python -m p035.simulation P035g \\
+        TEST True sim_data "Phase 2 (Unsupervised Training)" 2 \\
+        --sessions 1000 --workers 8
+
+The program is given by its name (see p035.tasks) or its file. The arguments
+after it are the ones its control panel would pass to MainScreen() (in the
+same order), written as Python literals where they aren't just strings. For every program, the first three are the subject,
+whether to record data, and the data folder. Each session is independent
+(session n starts n days after the first), so they can be spread across
+several processes with --workers.
+"""
+from argparse import ArgumentParser
+from ast import literal_eval
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from datetime import datetime as real_datetime, date as real_date, timedelta
+from heapq import heappush, heappop
+from itertools import count
+from os import devnull, makedirs, path as os_path
+from random import Random, seed as seed_global_random
+from shutil import copyfile
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from traceback import print_exc
+from PIL import Image
+
+from p035.chamber import SimulatedChamber, chamber_kind_from_environment
+from p035.console import console
+from p035.fm_foils import FMFoilRegistry, fm_log_path
+from p035.stimulus_cache import StimulusCache
+from p035.stimulus_prefetch import StimulusPrefetcher
+from p035.tasks import load_task
+from p035.timing import SessionClock
+
+
+class VirtualTimeline(object):
+    # The simulated passage of time. Timers are run in deadline order, and
+    # "now" jumps straight to each one as it comes up.
+    def __init__(self):
+        self.now_ns = 0
+        self.timers = [] # heap of (due time ns, timer ID)
+        self.callbacks = {} # timer ID -> function (removed if cancelled)
+        self.timer_ids = count(1)
+        self.callback_errors = 0
+
+    def time_ns(self):
+        return self.now_ns
+
+    def after(self, delay_ms, callback):
+        timer_id = next(self.timer_ids)
+        heappush(self.timers, (self.now_ns + int(delay_ms) * 1000000, timer_id))
+        self.callbacks[timer_id] = callback
+        return timer_id
+
+    def cancel(self, timer_id):
+        self.callbacks.pop(timer_id, None)
+
+    def run_next(self):
+        # Moves on to the next timer and runs it. Returns False once there
+        # is nothing left to run.
+        while self.timers:
+            due_ns, timer_id = heappop(self.timers)
+            callback = self.callbacks.pop(timer_id, None)
+            if callback is None: # cancelled
+                continue
+            self.now_ns = max(self.now_ns, due_ns)
+            self.run_callback(callback)
+            return True
+        return False
+
+    def run_callback(self, callback):
+        # Like Tk, an exception in a callback is printed and the session
+        # carries on
+        try:
+            callback()
+        except Exception:
+            self.callback_errors += 1
+            print("Exception in Tkinter callback", file = sys.stderr) # (so it can be redirected)
+            print_exc()
+
+
+class HeadlessEvent(object):
+    # Stands in for a Tk event (only the fields the programs use)
+    def __init__(self, x = 0, y = 0, time = 0, keysym = "??"):
+        self.x = x
+        self.y = y
+        self.time = time # ms, like the X server's event.time
+        self.keysym = keysym
+        self.widget = None
+
+
+class HeadlessRoot(object):
+    # Stands in for the MainScreen's Toplevel window
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.bindings = {} # event sequence (e.g., "<space>") -> function
+        self.destroyed = False
+
+    def after(self, delay_ms, func, *args):
+        return self.timeline.after(delay_ms, lambda: func(*args))
+
+    def after_cancel(self, timer_id):
+        self.timeline.cancel(timer_id)
+
+    def bind(self, sequence, func, add = None):
+        self.bindings[sequence] = func
+
+    def unbind(self, sequence, funcid = None):
+        self.bindings.pop(sequence, None)
+
+    def key_press(self, sequence):
+        # e.g., key_press("<space>") for the experimenter starting a session
+        func = self.bindings.get(sequence)
+        if func is not None:
+            func(HeadlessEvent(time = self.timeline.now_ns // 1000000,
+                               keysym = sequence.strip("<>")))
+
+    def destroy(self):
+        self.destroyed = True
+
+    def winfo_exists(self):
+        return not self.destroyed
+
+    # Window manager settings don't mean anything without a window
+    def title(self, *args, **kwargs):
+        pass
+    geometry = attributes = config = configure = title
+    mainloop = update = update_idletasks = title
+
+
+class HeadlessImage(object):
+    # Stands in for a stimulus PhotoImage. The image itself is never
+    # decoded; its size (read from the file's header) is all that's needed.
+    sizes = {} # file path -> (width, height), shared by all sessions
+
+    def __init__(self, stimulus_path):
+        self.path = stimulus_path
+        if stimulus_path not in HeadlessImage.sizes:
+            with Image.open(stimulus_path) as image:
+                HeadlessImage.sizes[stimulus_path] = image.size
+        self.width, self.height = HeadlessImage.sizes[stimulus_path]
+
+
+class HeadlessStimulusCache(StimulusCache):
+    def load_image(self, stimulus_path):
+        return HeadlessImage(stimulus_path)
+
+
+class HeadlessStimulusPrefetcher(StimulusPrefetcher):
+    # Nothing is decoded (and no threads are used): each stimulus is
+    # "decoded" as soon as it's queued. The look-ahead window and the limit
+    # on images kept work just like they do in a real session.
+    def decode(self, file_name):
+        return HeadlessImage(os_path.join(self.folder_path, file_name))
+
+    def start_decoding(self, file_name):
+        decoded = Future()
+        decoded.set_result(self.decode(file_name))
+        return decoded
+
+    def make_image(self, decoded_image):
+        return decoded_image
+
+
+class CanvasItem(object):
+    def __init__(self, kind, coords, tags, options):
+        self.kind = kind # "rectangle", "oval", "image", "text", ...
+        self.coords = coords
+        self.tags = tags
+        self.options = options
+
+    def bbox(self):
+        if self.kind == "image":
+            image = self.options.get("image")
+            width = getattr(image, "width", 0)
+            height = getattr(image, "height", 0)
+            x, y = self.coords[0], self.coords[1]
+            return (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+        if len(self.coords) < 4:
+            return (self.coords[0], self.coords[1], self.coords[0], self.coords[1])
+        return tuple(self.coords[:4])
+
+    def contains(self, x, y):
+        # Whether a peck at (x, y) lands on this item. As on a real Canvas,
+        # the inside of an unfilled shape doesn't catch pecks. Text items
+        # are treated as if they never do (their size depends on the font).
+        if self.options.get("state", "normal") == "hidden":
+            return False
+        if self.kind == "text":
+            return False
+        if self.kind in ("rectangle", "oval") and not self.options.get("fill"):
+            return False
+        x0, y0, x1, y1 = self.bbox()
+        if not (x0 <= x <= x1 and y0 <= y <= y1):
+            return False
+        if self.kind == "oval":
+            rx, ry = (x1 - x0) / 2, (y1 - y0) / 2
+            if rx <= 0 or ry <= 0:
+                return False
+            return ((x - x0 - rx) / rx) ** 2 + ((y - y0 - ry) / ry) ** 2 <= 1
+        return True
+
+
+class HeadlessCanvas(object):
+    # Stands in for the MainScreen's Canvas. Items are kept in stacking
+    # order (last is on top).
+    def __init__(self, root, width = 1024, height = 768, **options):
+        self.root = root
+        self.width = int(width)
+        self.height = int(height)
+        self.items = {} # item ID -> CanvasItem
+        self.item_ids = count(1)
+        self.bindings = {} # (tag or ID, sequence) -> function
+        self.current_item = None # The item the last peck landed on
+
+    def create(self, kind, coords, options):
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        tags = options.pop("tags", options.pop("tag", ()))
+        if isinstance(tags, str):
+            tags = tags.split()
+        item_id = next(self.item_ids)
+        self.items[item_id] = CanvasItem(kind, [float(c) for c in coords],
+                                         tuple(tags), options)
+        return item_id
+
+    def create_rectangle(self, *coords, **options):
+        return self.create("rectangle", coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self.create("oval", coords, options)
+
+    def create_image(self, *coords, **options):
+        return self.create("image", coords, options)
+
+    def create_text(self, *coords, **options):
+        return self.create("text", coords, options)
+
+    def create_line(self, *coords, **options):
+        return self.create("line", coords, options)
+
+    def find(self, tag_or_id):
+        # IDs of the matching items, bottom to top. Handles an item ID,
+        # "all", a tag, or "!tag" (every item NOT tagged with "tag").
+        if isinstance(tag_or_id, int):
+            return [tag_or_id] if tag_or_id in self.items else []
+        if tag_or_id == "all":
+            return list(self.items)
+        if tag_or_id == "current":
+            return [self.current_item] if self.current_item in self.items else []
+        if tag_or_id.startswith("!"):
+            return [i for i, item in self.items.items() if tag_or_id[1:] not in item.tags]
+        return [i for i, item in self.items.items() if tag_or_id in item.tags]
+
+    def delete(self, *tags_or_ids):
+        for tag_or_id in tags_or_ids:
+            for item_id in self.find(tag_or_id):
+                del self.items[item_id]
+
+    def itemconfigure(self, tag_or_id, **options):
+        for item_id in self.find(tag_or_id):
+            self.items[item_id].options.update(options)
+    itemconfig = itemconfigure
+
+    def coords(self, tag_or_id, *coords):
+        item_ids = self.find(tag_or_id)
+        if not item_ids:
+            return []
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        if coords:
+            self.items[item_ids[0]].coords = [float(c) for c in coords]
+        return list(self.items[item_ids[0]].coords)
+
+    def gettags(self, tag_or_id):
+        item_ids = self.find(tag_or_id)
+        return self.items[item_ids[0]].tags if item_ids else ()
+
+    def tag_bind(self, tag_or_id, sequence, func, add = None):
+        self.bindings[(tag_or_id, sequence)] = func
+
+    def tag_raise(self, tag_or_id, above = None):
+        # Moves the items to just above "above" (or to the very top)
+        moving = self.find(tag_or_id)
+        if not moving:
+            return
+        items = [(i, item) for i, item in self.items.items() if i not in moving]
+        if above is None:
+            insert_at = len(items)
+        else:
+            above_ids = self.find(above)
+            insert_at = max([n for n, (i, item) in enumerate(items) if i in above_ids],
+                            default = len(items) - 1) + 1
+        items[insert_at:insert_at] = [(i, self.items[i]) for i in moving]
+        self.items = dict(items)
+    lift = tag_raise
+
+    def item_at(self, x, y):
+        for item_id in reversed(list(self.items)):
+            if self.items[item_id].contains(x, y):
+                return item_id
+        return None
+
+    def peck(self, x, y, time_ms):
+        # A touch at (x, y): every binding of the topmost item there (for
+        # each of its tags, then its ID) is called with the event.
+        item_id = self.item_at(x, y)
+        self.current_item = item_id
+        if item_id is None:
+            return
+        event = HeadlessEvent(x, y, time_ms)
+        for tag_or_id in self.items[item_id].tags + (item_id,):
+            func = self.bindings.get((tag_or_id, "<Button-1>"))
+            if func is not None:
+                func(event)
+
+    def peck_targets(self):
+        # The bounding boxes of everything that can currently be pecked
+        # (i.e., has a binding), apart from full-screen backgrounds. Items
+        # that share their first tag (e.g., a key's circle and image) make
+        # up a single target.
+        targets = {}
+        screen_area = self.width * self.height
+        for item_id, item in self.items.items():
+            if item.options.get("state", "normal") == "hidden" or item.kind == "text":
+                continue
+            if not any((tag, "<Button-1>") in self.bindings for tag in item.tags + (item_id,)):
+                continue
+            x0, y0, x1, y1 = item.bbox()
+            if x1 <= x0 or y1 <= y0 or (x1 - x0) * (y1 - y0) >= screen_area / 2:
+                continue
+            key = item.tags[0] if item.tags else item_id
+            if key in targets:
+                bx0, by0, bx1, by1 = targets[key]
+                targets[key] = (min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1))
+            else:
+                targets[key] = (x0, y0, x1, y1)
+        return list(targets.values())
+
+    # Layout calls don't mean anything without a window
+    def pack(self, *args, **kwargs):
+        pass
+    grid = place = config = configure = destroy = pack
+
+
+class RandomPecker(object):
+    # A synthetic subject that pecks every "mean_interval_ms" on average
+    # (exponentially distributed). Most pecks land on the center of
+    # something peckable; the rest land anywhere on the screen.
+    def __init__(self, seed = 0, mean_interval_ms = 750, target_peck_prob = 0.9):
+        self.random = Random(seed)
+        self.mean_interval_ms = mean_interval_ms
+        self.target_peck_prob = target_peck_prob
+
+    def next_interval_ms(self):
+        return max(1, int(self.random.expovariate(1 / self.mean_interval_ms)))
+
+    def choose_point(self, canvas):
+        if self.random.random() < self.target_peck_prob:
+            targets = canvas.peck_targets()
+            if targets:
+                x0, y0, x1, y1 = self.random.choice(targets)
+                return int((x0 + x1) // 2), int((y0 + y1) // 2)
+        return self.random.randrange(canvas.width), self.random.randrange(canvas.height)
+
+
+# Each program is loaded (once) as a module of its own
+def load_task_module(task):
+    # Same check as the engine's (which would start up the chamber hardware
+    # as soon as the program is loaded)
+    if chamber_kind_from_environment() == "pigpio":
+        raise RuntimeError("Simulated sessions can't be run with the real chamber (set P035_CHAMBER=simulated)")
+    return load_task(task)
+
+
+def make_virtual_datetimes(timeline, start_datetime):
+    # datetime/date classes whose now()/today() follow the virtual timeline
+    class VirtualDateTime(real_datetime):
+        @classmethod
+        def now(cls, tz = None):
+            return start_datetime + timedelta(microseconds = timeline.now_ns // 1000)
+
+    class VirtualDate(real_date):
+        @classmethod
+        def today(cls):
+            return VirtualDateTime.now().date()
+
+    return VirtualDateTime, VirtualDate
+
+
+class SimulatedSession(object):
+    # One session of a program, e.g.:
+    #   SimulatedSession("P035g_Wasserman_replication.py",
+    #                    ["TEST", True, "sim_data", "Phase 4 (Supervised Training)", 4],
+    #                    seed = 1).run()
+    # "seed" sets both the program's own randomization (trial orders, etc.)
+    # and the default RandomPecker. Sessions longer than
+    # max_session_minutes (virtual) are ended as if "Esc" was pressed.
+
+    # The stand-ins used (subclasses can swap in their own)
+    timeline_class = VirtualTimeline
+    canvas_class = HeadlessCanvas
+    stimulus_cache_class = HeadlessStimulusCache
+    stimulus_prefetcher_class = HeadlessStimulusPrefetcher
+    chamber_class = SimulatedChamber
+
+    def __init__(self, script_path, mainscreen_args, seed = 0, pecker = None,
+                 start_datetime = None, max_session_minutes = 240, quiet = True):
+        self.script_path = script_path
+        self.mainscreen_args = list(mainscreen_args)
+        self.seed = seed
+        self.pecker = pecker if pecker is not None else RandomPecker(seed)
+        self.start_datetime = start_datetime or real_datetime(2000, 1, 1, 9, 0, 0)
+        self.max_session_ns = int(max_session_minutes * 60e9)
+        self.quiet = quiet
+        self.timeline = self.timeline_class()
+        self.chamber = self.chamber_class(time_ns = self.timeline.time_ns)
+        self.main_screen = None
+
+    def build_main_screen(self, module):
+        return module.MainScreen(*self.mainscreen_args)
+
+    def start_session(self):
+        self.main_screen.root.key_press("<space>") # The bird is in the box
+
+    @contextmanager
+    def headless(self, module):
+        # Everything the program does inside this is done headless, on the
+        # virtual timeline
+        timeline = self.timeline
+        virtual_datetime, virtual_date = make_virtual_datetimes(timeline,
+                                                                self.start_datetime)
+        subject_ID, record_data, data_folder_directory = self.mainscreen_args[:3]
+        # FM sessions (FOAM) read the subject's FM log and add their FOIL to
+        # it. A simulated session works on a copy of the log in a temporary
+        # folder, so it never uses up the subject's real FOILs.
+        fm_log_folder = TemporaryDirectory(prefix = "p035_simulated_fm_logs_")
+        real_fm_log_path = fm_log_path(subject_ID)
+        if os_path.isfile(real_fm_log_path):
+            copyfile(real_fm_log_path, fm_log_path(subject_ID, fm_log_folder.name))
+        headless = {"Toplevel": lambda *args, **kwargs: HeadlessRoot(timeline),
+                    "Canvas": self.canvas_class,
+                    "SessionClock": lambda *args, **kwargs: SessionClock(*args, time_ns = timeline.time_ns, **kwargs),
+                    "StimulusCache": self.stimulus_cache_class,
+                    "StimulusPrefetcher": self.stimulus_prefetcher_class,
+                    "chamber": self.chamber,
+                    "datetime": virtual_datetime,
+                    "date": virtual_date,
+                    # Simulated sessions always build their own schedule
+                    # (and never use up a subject's precompiled ones)
+                    "schedules_folder": None,
+                    "FMFoilRegistry": lambda subject_ID: FMFoilRegistry(subject_ID, fm_log_folder.name),
+                    # ...and are never added to the session database
+                    "database_enabled": False}
+        # The headless versions are swapped into the program itself and into
+        # the shared engine (if the program uses it), and are always swapped
+        # back out afterwards
+        namespaces = [vars(module)]
+        if "p035.engine" in sys.modules:
+            namespaces.append(vars(sys.modules["p035.engine"]))
+        originals = [{name: namespace[name] for name in headless if name in namespace}
+                     for namespace in namespaces]
+        if record_data:
+            makedirs(os_path.join(data_folder_directory, subject_ID), exist_ok = True)
+
+        with fm_log_folder, open(devnull, "w") as sink, (redirect_stdout(sink) if self.quiet else nullcontext()):
+            try:
+                for namespace, namespace_originals in zip(namespaces, originals):
+                    namespace.update({name: headless[name] for name in namespace_originals})
+                seed_global_random(self.seed) # The programs use the "random" module
+                yield
+            finally:
+                # Whatever the session printed is written (to where stdout
+                # is redirected) before the redirect ends
+                console.flush()
+                for namespace, namespace_originals in zip(namespaces, originals):
+                    namespace.update(namespace_originals)
+
+    def build(self):
+        # Only builds the MainScreen (and with it, the session's trial
+        # schedule), without running the session
+        module = load_task_module(self.script_path)
+        with self.headless(module):
+            self.main_screen = self.build_main_screen(module)
+        return self
+
+    def run(self):
+        # Runs the whole session and returns itself (see SessionResult)
+        module = load_task_module(self.script_path)
+        timeline = self.timeline
+        with self.headless(module):
+            self.main_screen = self.build_main_screen(module)
+            root = self.main_screen.root
+            canvas = self.main_screen.mastercanvas
+
+            def peck():
+                if root.destroyed:
+                    return
+                timeline.after(self.pecker.next_interval_ms(), peck)
+                x, y = self.pecker.choose_point(canvas)
+                self.chamber.touch(canvas, x, y)
+
+            self.start_session()
+            timeline.after(self.pecker.next_interval_ms(), peck)
+            while not root.destroyed and timeline.run_next():
+                if timeline.now_ns > self.max_session_ns and not root.destroyed:
+                    self.main_screen.exit_program(None)
+        return self
+
+
+class SessionResult(object):
+    # What is sent back from each simulated session (which, unlike the
+    # session itself, can be passed between processes)
+    def __init__(self, session):
+        self.seed = session.seed
+        self.start_datetime = session.start_datetime
+        self.session_data_frame = session.main_screen.session_data_frame
+        self.virtual_ns = session.timeline.now_ns
+        self.callback_errors = session.timeline.callback_errors
+        self.hopper_durations_ns = session.chamber.hopper_durations_ns
+
+
+def run_simulated_session(session_arguments):
+    script_path, mainscreen_args, session_options = session_arguments
+    return SessionResult(SimulatedSession(script_path, mainscreen_args,
+                                          **session_options).run())
+
+
+def simulate_sessions(script_path, mainscreen_args, n_sessions, seed = 0,
+                      start_datetime = None, workers = 1, mean_interval_ms = 750,
+                      **session_options):
+    # Runs n_sessions sessions with seeds seed, seed + 1, etc. Session n
+    # starts n days after the first one (at the same time of day), so that
+    # every session is independent of the others and they can be run in
+    # parallel across "workers" processes. Returns a SessionResult for each
+    # session, in order.
+    start_datetime = start_datetime or real_datetime(2000, 1, 1, 9, 0, 0)
+    all_session_arguments = []
+    for n in range(n_sessions):
+        options = dict(session_options,
+                       seed = seed + n,
+                       pecker = RandomPecker(seed + n, mean_interval_ms),
+                       start_datetime = start_datetime + timedelta(days = n))
+        all_session_arguments.append((script_path, mainscreen_args, options))
+    if workers <= 1:
+        return [run_simulated_session(a) for a in all_session_arguments]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(run_simulated_session, all_session_arguments,
+                                 chunksize = max(1, n_sessions // (workers * 8))))
+
+
+def parse_mainscreen_arg(text):
+    try:
+        return literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def main():
+    parser = ArgumentParser(description = "Run P035 sessions headless, on a virtual clock")
+    parser.add_argument("script", help = "e.g., P035g (or P035g_Wasserman_replication.py)")
+    parser.add_argument("mainscreen_args", nargs = "+",
+                        help = "the program's MainScreen() arguments, in order")
+    parser.add_argument("--sessions", type = int, default = 1)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "number of processes to run sessions in")
+    parser.add_argument("--peck-interval", type = float, default = 750,
+                        help = "mean ms between synthetic pecks")
+    parser.add_argument("--verbose", action = "store_true",
+                        help = "show each program's own console output")
+    args = parser.parse_args()
+    mainscreen_args = [parse_mainscreen_arg(a) for a in args.mainscreen_args]
+
+    start = perf_counter()
+    results = simulate_sessions(args.script, mainscreen_args, args.sessions,
+                                seed = args.seed,
+                                workers = args.workers,
+                                mean_interval_ms = args.peck_interval,
+                                quiet = not args.verbose)
+    elapsed = perf_counter() - start
+    for n, result in enumerate(results):
+        print(f"Session {n + 1:>4} (seed {result.seed}) | "
+              f"{len(result.session_data_frame) - 1:>6} events | "
+              f"{result.virtual_ns / 60e9:6.1f} virtual min | "
+              f"{len(result.hopper_durations_ns):>4} reinforcements | "
+              f"{result.callback_errors} callback errors")
+    print(f"\n{len(results)} sessions in {elapsed:.2f} s ({len(results) / elapsed * 60:.0f} sessions/min)")
+
+
+if __name__ == '__main__':
+    main()
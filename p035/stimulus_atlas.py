@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Packed stimulus atlases: every image in a stimulus folder in one file.
+
+Each stimulus is its own ~67 KB .bmp, so loading a session's stimuli meant
+opening and parsing hundreds of files (640 for FOAM's 192 pair phase). An
+atlas holds the raw pixels of every image in a folder, one after another,
+with a small index at the start:
+
+    b"P035ATL1" | index length (4 bytes, little endian) | index (JSON) |
+    padding (to a multiple of 16 bytes) | pixel data
+
+The index has, for each file name, the image's mode ("RGB"), size, content
+hash, and the offset and length of its pixels in the pixel data (identical
+images are only stored once). The atlas is opened with mmap, so an image is
+made straight from the mapped pixels (no file is opened or parsed), and the
+whole file is read ahead in one sequential read as soon as it is opened.
+
+Atlases are a build step, saved beside each folder as ".<folder>.atlas"
+(ignored by git). From the P035 folder:
+
+    python -m p035.stimulus_atlas              # every stimulus folder
+    python -m p035.stimulus_atlas stimuli      # ...or just some
+
+An image is only ever taken from an atlas if its content hash still matches
+the folder's manifest (see p035.stimulus_manifest), and the file's size and
+modification time still match the ones recorded in the atlas (checked each
+time it is loaded); any image that was added or changed since the atlas
+was built is loaded from its file instead.
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+try:
+    from mmap import MADV_SEQUENTIAL, MADV_WILLNEED
+except ImportError: # (only on some platforms)
+    MADV_SEQUENTIAL = MADV_WILLNEED = None
+from os import replace, stat, path as os_path
+from struct import pack, unpack_from
+from threading import Lock
+from time import perf_counter
+from PIL import Image
+
+from p035.console import console
+from p035.stimulus_manifest import load_manifest
+from p035.stimulus_store import stimulus_folders
+
+atlas_magic = b"P035ATL1"
+
+# Atlases opened so far (by the folder's absolute path): (atlas file's
+# mtime, StimulusAtlas or None)
+atlases = {}
+atlases_lock = Lock() # (stimuli are loaded from several threads at once)
+
+
+def atlas_file_path(folder_path):
+    # Beside the folder, like its manifest
+    parent_folder, folder_name = os_path.split(os_path.abspath(folder_path.rstrip("/\\") or folder_path))
+    return os_path.join(parent_folder, f".{folder_name}.atlas")
+
+
+def build_atlas(folder_path):
+    # Packs every image in a folder into its atlas. Returns the number of
+    # images and the size of the atlas (bytes).
+    manifest = load_manifest(folder_path)
+    index = {}
+    pixel_chunks = []
+    data_length = 0
+    offsets_by_hash = {} # Identical images are stored once
+    for file_name in manifest.names():
+        entry = manifest[file_name]
+        if entry["sha256"] not in offsets_by_hash:
+            with Image.open(os_path.join(manifest.folder_path, file_name)) as image:
+                if image.mode not in ("RGB", "RGBA", "L"):
+                    image = image.convert("RGB")
+                pixels = image.tobytes()
+                offsets_by_hash[entry["sha256"]] = (data_length, len(pixels),
+                                                    image.mode, image.size)
+            pixel_chunks.append(pixels)
+            data_length += len(pixels)
+        offset, length, mode, size = offsets_by_hash[entry["sha256"]]
+        index[file_name] = {"offset": offset,
+                            "length": length,
+                            "mode": mode,
+                            "width": size[0],
+                            "height": size[1],
+                            "sha256": entry["sha256"],
+                            # (the source file's, to check it against)
+                            "size": entry["size"],
+                            "mtime_ns": entry["mtime_ns"]}
+
+    index_bytes = dumps(index).encode("utf-8")
+    header_length = len(atlas_magic) + 4 + len(index_bytes)
+    padding = b"\0" * (-header_length % 16)
+    file_path = atlas_file_path(folder_path)
+    # Written to a temporary file first, so an atlas is never half written
+    with open(file_path + ".tmp", "wb") as atlas_file:
+        atlas_file.write(atlas_magic)
+        atlas_file.write(pack("<I", len(index_bytes)))
+        atlas_file.write(index_bytes)
+        atlas_file.write(padding)
+        for pixels in pixel_chunks:
+            atlas_file.write(pixels)
+    replace(file_path + ".tmp", file_path)
+    atlases.pop(os_path.abspath(folder_path), None)
+    return len(index), header_length + len(padding) + data_length
+
+
+class StimulusAtlas(object):
+    # Opened by open_atlas() below (rather than directly)
+    def __init__(self, file_path, manifest):
+        with open(file_path, "rb") as atlas_file:
+            self.buffer = mmap(atlas_file.fileno(), 0, access = ACCESS_READ)
+        if self.buffer[:len(atlas_magic)] != atlas_magic:
+            raise ValueError(f"Not a stimulus atlas: {file_path}")
+        index_length = unpack_from("<I", self.buffer, len(atlas_magic))[0]
+        index_start = len(atlas_magic) + 4
+        index = loads(self.buffer[index_start:index_start + index_length].decode("utf-8"))
+        header_length = index_start + index_length
+        self.data_start = header_length + (-header_length % 16)
+        self.pixels = memoryview(self.buffer)
+
+        # Only images that haven't changed since the atlas was built (atlases
+        # built before the source files' size and mtime were recorded can't
+        # be checked against them, so none of their images are used)
+        self.index = {}
+        for file_name, atlas_entry in index.items():
+            entry = manifest.entries.get(file_name)
+            if (entry is not None and entry["sha256"] == atlas_entry["sha256"]
+                and "mtime_ns" in atlas_entry):
+                self.index[file_name] = atlas_entry
+
+        # Read the whole atlas ahead (a single sequential read), rather than
+        # page by page as each image is first used
+        if MADV_WILLNEED is not None:
+            self.buffer.madvise(MADV_SEQUENTIAL)
+            self.buffer.madvise(MADV_WILLNEED)
+
+    def __contains__(self, file_name):
+        return file_name in self.index
+
+    def is_current(self, file_name, file_stat):
+        # Whether the file on disk is still the one the image was built from
+        # (it can be overwritten in place after the manifest was loaded)
+        atlas_entry = self.index[file_name]
+        return (atlas_entry["size"] == file_stat.st_size
+                and atlas_entry["mtime_ns"] == file_stat.st_mtime_ns)
+
+    def image(self, file_name):
+        # A PIL image made directly from the atlas' mapped pixels (no file
+        # is opened or parsed)
+        atlas_entry = self.index[file_name]
+        start = self.data_start + atlas_entry["offset"]
+        return Image.frombuffer(atlas_entry["mode"],
+                                (atlas_entry["width"], atlas_entry["height"]),
+                                self.pixels[start:start + atlas_entry["length"]],
+                                "raw", atlas_entry["mode"], 0, 1)
+
+
+def open_atlas(folder_path):
+    # Returns the folder's StimulusAtlas, or None if it has none (or it
+    # can't be read)
+    folder_path = os_path.abspath(folder_path.rstrip("/\\") or folder_path)
+    file_path = atlas_file_path(folder_path)
+    try:
+        atlas_mtime_ns = stat(file_path).st_mtime_ns
+    except OSError:
+        return None
+    with atlases_lock:
+        opened = atlases.get(folder_path)
+        if opened is None or opened[0] != atlas_mtime_ns:
+            try:
+                atlas = StimulusAtlas(file_path, load_manifest(folder_path))
+            except (OSError, ValueError) as error:
+                console.warning(f"Note: could not read the stimulus atlas {file_path} ({error})")
+                atlas = None
+            opened = (atlas_mtime_ns, atlas)
+            atlases[folder_path] = opened
+    return opened[1]
+
+
+def load_stimulus(stimulus_path):
+    # A stimulus as a PIL image: from its folder's atlas if it's in it (and
+    # the file hasn't changed since), otherwise read (and decoded) from its
+    # own file
+    folder_path, file_name = os_path.split(stimulus_path)
+    atlas = open_atlas(folder_path or ".")
+    if atlas is not None and file_name in atlas:
+        if atlas.is_current(file_name, stat(stimulus_path)):
+            return atlas.image(file_name)
+        console.warning(f"Note: {stimulus_path} changed since its atlas was built (loaded from the file)")
+    image = Image.open(stimulus_path)
+    image.load()
+    return image
+
+
+def main():
+    parser = ArgumentParser(description = "Pack P035 stimulus folders into atlases")
+    parser.add_argument("folders", nargs = "*",
+                        help = "stimulus folders (default: every one in the P035 folder)")
+    args = parser.parse_args()
+    for folder_path in args.folders or stimulus_folders():
+        start = perf_counter()
+        n_images, n_bytes = build_atlas(folder_path)
+        print(f"{os_path.basename(os_path.abspath(folder_path)):<40} {n_images:>4} images "
+              f"{n_bytes/1e6:>6.1f} MB ({perf_counter() - start:.2f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Per-session cache of decoded stimulus images.
+
+Most of the P035 programs used to call Image.open() and ImageTk.PhotoImage()
+every time a stimulus was drawn. Because the sample is redrawn after every
+peck of its FR requirement, the same .bmp was decoded from the disk again
+and again within a single trial. The StimulusCache below decodes each image
+once per session (keyed by its full path) and hands back the same PhotoImage
+object every time that stimulus is drawn afterwards.
+
+Many of the stimulus folders hold byte-identical copies of the same image
+under different names (see p035.stimulus_store). Files are therefore also
+matched up by the content hash in their folder's manifest: identical files
+are read and decoded only once, and share one PhotoImage.
+"""
+from os import listdir, path as os_path
+from PIL import ImageTk
+from p035.console import console
+from p035.stimulus_atlas import load_stimulus
+from p035.stimulus_manifest import current_entry
+
+
+class StimulusCache(object):
+    # One cache is built in each MainScreen. Note that a Tk root window must
+    # already exist before any PhotoImage objects can be made.
+    def __init__(self):
+        self.images = {} # full file path -> PhotoImage
+        self.images_by_hash = {} # content hash -> PhotoImage
+
+    def get(self, stimulus_path):
+        # Returns the PhotoImage for a stimulus, decoding it the first time
+        # it (or an identical file) is asked for (e.g., a stimulus that
+        # wasn't preloaded).
+        try:
+            return self.images[stimulus_path]
+        except KeyError:
+            pass
+        content_hash = stimulus_content_hash(stimulus_path)
+        image = self.images_by_hash.get(content_hash)
+        if image is None:
+            image = self.load_image(stimulus_path)
+            if content_hash is not None:
+                self.images_by_hash[content_hash] = image
+        self.images[stimulus_path] = image
+        return image
+
+    def load_image(self, stimulus_path):
+        # (From the folder's atlas, if it has one; see p035.stimulus_atlas)
+        return ImageTk.PhotoImage(load_stimulus(stimulus_path))
+
+    def preload(self, folder_paths, *assignment_dicts):
+        # Called once the trial order dictionaries (e.g.,
+        # stimuli_assignment_dict) have been built. Every file name that
+        # appears as a value in a trial's dictionary and that exists in one
+        # of the given stimulus folders is decoded ahead of time, so nothing
+        # has to be read from the disk once the session is running.
+        for folder_path in folder_paths:
+            if not folder_path or not os_path.isdir(folder_path):
+                continue
+            folder_files = set(listdir(folder_path))
+            for assignment_dict in assignment_dicts:
+                for trial_dict in assignment_dict.values():
+                    for value in trial_dict.values():
+                        if isinstance(value, str) and value in folder_files:
+                            self.get(os_path.join(folder_path, value))
+        console.info(f"- {len(self.images)} stimuli loaded ({len(self.images_by_hash)} unique images)")
+
+
+def stimulus_content_hash(stimulus_path):
+    # The file's content hash from its folder's manifest (None if the file
+    # isn't an indexed image)
+    try:
+        entry = current_entry(stimulus_path)
+    except OSError:
+        return None
+    return entry["sha256"] if entry is not None else None
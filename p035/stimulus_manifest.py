@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Cached index (manifest) of the files in each stimulus folder.
+
+The programs used to listdir() their stimulus folders at the start of every
+session, and FOAM then worked out each file's type, pair number, and phase
+by splitting its name again and again (e.g., int(i.split(".")[0][-1]) for
+the phase) across hundreds of files. A StimulusManifest does that once:
+
+- Every file in the folder is listed (in the same order listdir() gives),
+  and for each image its type ("S", "C", "SD", ...), pair number, and phase
+  are parsed from its name (e.g., "S10_Phase3.bmp" is type "S", pair 10,
+  phase 3; "C01.bmp" is type "C", pair 1, no phase). Its dimensions, size,
+  modification time, and a SHA-256 hash of its contents are stored too.
+- Images can then be looked up by type/phase/pair in O(1) (see names() and
+  find()), without touching the disk.
+- The manifest is saved next to the folder (as ".<folder>.manifest.json")
+  and reused: the folder is only listed again if its modification time
+  has changed (which changes whenever a file is added, removed, or
+  renamed), and every image is stat()-ed each time it is loaded, so only
+  the files that are new or whose size/modification time changed (e.g.,
+  an image overwritten in place) are read and hashed again.
+"""
+from hashlib import sha256
+from json import dump, load
+from os import listdir, replace, stat, path as os_path
+from re import match
+from PIL import Image
+from p035.console import console
+
+# Files that are indexed as stimuli (everything else is only listed)
+image_extensions = (".bmp", ".png", ".gif", ".jpg", ".jpeg")
+
+# Bump this if the fields stored for each file change
+manifest_version = 1
+
+# Manifests loaded so far (by the folder's absolute path)
+manifests = {}
+
+
+def parse_stimulus_name(file_name):
+    # "S10_Phase3.bmp" -> ("S", 10, 3), "SD_01.bmp" -> ("SD", 1, None),
+    # "C01.bmp" -> ("C", 1, None). Names that don't follow the
+    # <type><pair number>[_Phase<phase>] pattern give (None, None, None).
+    stem = os_path.splitext(file_name)[0]
+    name_match = match(r"([A-Za-z]+)_?(\d+)(?:_Phase(\d+))?$", stem)
+    if name_match is None:
+        return None, None, None
+    stimulus_type, pair_num, phase = name_match.groups()
+    return (stimulus_type.upper(),
+            int(pair_num),
+            int(phase) if phase is not None else None)
+
+
+def read_stimulus_entry(file_path, file_stat):
+    # Everything stored about one image (only reads the whole file to hash
+    # it; PIL only reads the header to get the dimensions)
+    stimulus_type, pair_num, phase = parse_stimulus_name(os_path.basename(file_path))
+    with open(file_path, "rb") as stimulus_file:
+        content_hash = sha256(stimulus_file.read()).hexdigest()
+    with Image.open(file_path) as image:
+        width, height = image.size
+    return {"type": stimulus_type,
+            "pair_num": pair_num,
+            "phase": phase,
+            "width": width,
+            "height": height,
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "sha256": content_hash}
+
+
+class StimulusManifest(object):
+    # Built by load_manifest() below (rather than directly)
+    def __init__(self, folder_path, folder_mtime_ns, file_names, entries):
+        self.folder_path = folder_path
+        self.folder_mtime_ns = folder_mtime_ns
+        self.file_names = file_names # Every file, in listdir() order
+        self.entries = entries # image file name -> its entry (see above)
+
+        # Indices for the lookups below, each in file_names order
+        self.names_by_type_phase = {} # (type, phase) -> list of file names
+        self.name_by_pair = {} # (type, pair number, phase) -> file name
+        for file_name in file_names:
+            entry = entries.get(file_name)
+            if entry is None:
+                continue
+            # (a set, since these overlap for images without a phase)
+            for key in {(None, None),
+                        (entry["type"], None),
+                        (None, entry["phase"]),
+                        (entry["type"], entry["phase"])}:
+                self.names_by_type_phase.setdefault(key, []).append(file_name)
+            self.name_by_pair.setdefault((entry["type"], entry["pair_num"], entry["phase"]),
+                                         file_name)
+
+    def __contains__(self, file_name):
+        return file_name in self.entries
+
+    def __getitem__(self, file_name):
+        return self.entries[file_name]
+
+    def names(self, stimulus_type = None, phase = None):
+        # The images of a type and/or phase (all of them if neither is given)
+        return list(self.names_by_type_phase.get((stimulus_type, phase), []))
+
+    def find(self, stimulus_type, pair_num, phase = None):
+        # e.g., find("C", 10, 3) -> "C10_Phase3.bmp" (or None)
+        return self.name_by_pair.get((stimulus_type, pair_num, phase))
+
+    def to_dict(self):
+        return {"version": manifest_version,
+                "folder_mtime_ns": self.folder_mtime_ns,
+                "file_names": self.file_names,
+                "entries": self.entries}
+
+
+def manifest_file_path(folder_path):
+    # Saved beside the folder (not in it), so the folder's own listing and
+    # modification time aren't changed by saving it
+    parent_folder, folder_name = os_path.split(folder_path)
+    return os_path.join(parent_folder, f".{folder_name}.manifest.json")
+
+
+def read_saved_manifest(folder_path):
+    try:
+        with open(manifest_file_path(folder_path)) as manifest_file:
+            saved = load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if saved.get("version") != manifest_version:
+        return None
+    return saved
+
+
+def save_manifest(manifest):
+    # Written to a temporary file first, so that a manifest is never left
+    # half written. If the folder can't be written to, the manifest is
+    # simply rebuilt the next time.
+    file_path = manifest_file_path(manifest.folder_path)
+    try:
+        with open(file_path + ".tmp", "w") as manifest_file:
+            dump(manifest.to_dict(), manifest_file)
+        replace(file_path + ".tmp", file_path)
+    except OSError:
+        console.warning(f"Note: could not save the stimulus manifest {file_path}")
+
+
+def load_manifest(folder_path):
+    # Returns the (up-to-date) manifest of a stimulus folder
+    folder_path = os_path.abspath(folder_path.rstrip("/\\") or folder_path)
+    folder_mtime_ns = stat(folder_path).st_mtime_ns
+
+    # Already loaded this run, or saved by an earlier run? Its list of files
+    # is still right as long as the folder hasn't changed (no file was
+    # added, removed, or renamed)
+    manifest = manifests.get(folder_path)
+    if manifest is not None:
+        listed_mtime_ns, file_names, old_entries = (manifest.folder_mtime_ns,
+                                                    manifest.file_names,
+                                                    manifest.entries)
+    else:
+        saved = read_saved_manifest(folder_path)
+        if saved is not None:
+            listed_mtime_ns, file_names, old_entries = (saved["folder_mtime_ns"],
+                                                        saved["file_names"],
+                                                        saved["entries"])
+        else:
+            listed_mtime_ns, file_names, old_entries = None, None, {}
+    changed = listed_mtime_ns != folder_mtime_ns
+    if changed:
+        file_names = listdir(folder_path)
+
+    # A file can be overwritten in place (e.g., "cp new.bmp S01.bmp")
+    # without changing the folder, so every image is checked against its
+    # entry either way. Entries of files that haven't changed are kept as
+    # they are (so they aren't hashed again).
+    entries = {}
+    for file_name in file_names:
+        if not file_name.lower().endswith(image_extensions):
+            continue
+        file_path = os_path.join(folder_path, file_name)
+        file_stat = stat(file_path)
+        old_entry = old_entries.get(file_name)
+        if (old_entry is not None
+            and old_entry["size"] == file_stat.st_size
+            and old_entry["mtime_ns"] == file_stat.st_mtime_ns):
+            entries[file_name] = old_entry
+        else:
+            entries[file_name] = read_stimulus_entry(file_path, file_stat)
+            changed = True
+    if not changed and manifest is not None:
+        return manifest
+    manifest = StimulusManifest(folder_path, folder_mtime_ns, file_names, entries)
+    if changed:
+        save_manifest(manifest)
+    manifests[folder_path] = manifest
+    return manifest
+
+
+def current_entry(file_path):
+    # The manifest entry of one image (None if it isn't an indexed image),
+    # checked against the file itself. Cheaper than load_manifest() when the
+    # folder's manifest was already loaded this run and the file hasn't
+    # changed, since only that one file is stat()-ed.
+    folder_path, file_name = os_path.split(os_path.abspath(file_path))
+    manifest = manifests.get(folder_path)
+    if manifest is not None:
+        entry = manifest.entries.get(file_name)
+        if entry is not None:
+            file_stat = stat(file_path)
+            if (entry["size"] == file_stat.st_size
+                and entry["mtime_ns"] == file_stat.st_mtime_ns):
+                return entry
+    return load_manifest(folder_path).entries.get(file_name)
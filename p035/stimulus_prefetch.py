@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Background loading of the stimuli used in a FOAM session.
+
+The FOAM program used to open every qualifying .bmp in the stimuli folder and
+turn it into a PhotoImage inside the spacebar callback, which froze the GUI
+for several seconds in the later (192 pair) phases. The StimulusPrefetcher
+below is handed only the stimuli that appear in the session's trial order.
+It decodes them with PIL on a small pool of worker threads, in trial order,
+while the only work left on the Tk thread is the (cheap) wrapping of each
+decoded image into a PhotoImage. Tkinter objects must only ever be touched
+from the Tk thread, which is why that last step isn't done by the workers.
+
+By default every stimulus in the session is loaded up front and kept until
+the end. A 96 or 192 pair session uses hundreds of different stimuli, which
+is a lot of image memory on a 1 GB Pi, so the prefetcher can instead be
+given a look-ahead window and a limit on the number of images it keeps:
+
+- Only the stimuli of the next "look_ahead" uses (from wherever the session
+  has got to; see advance()) are loaded ahead of time. Any other stimulus
+  is only loaded when it is first asked for.
+- At most "max_images" PhotoImages are kept. Once there are more, the least
+  recently used are dropped (and loaded again if they're ever needed
+  again), except for those in the look-ahead window, which are always kept.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import path as os_path
+from PIL import ImageTk
+from p035.console import console
+from p035.stimulus_atlas import load_stimulus
+
+
+def decode_stimulus(stimulus_path):
+    # Run on a worker thread. The image is taken from the folder's atlas if
+    # it has one (see p035.stimulus_atlas); otherwise it is read and decoded
+    # from its own file.
+    return load_stimulus(stimulus_path)
+
+
+class StimulusPrefetcher(object):
+    # Loading starts as soon as the object is built. "file_names" are the
+    # stimuli in the order they will be used (repeats included). The
+    # "progress_callback" (if given) is called on the Tk thread as
+    # progress_callback(n_loaded, n_total) every time more of the stimuli
+    # loaded up front are ready to be drawn.
+    def __init__(self, root, folder_path, file_names, progress_callback=None,
+                 max_workers=4, poll_interval=20, wraps_per_poll=8,
+                 look_ahead=None, max_images=None):
+        self.root = root
+        self.folder_path = folder_path
+        self.file_names = list(file_names)
+        self.progress_callback = progress_callback
+        self.poll_interval = poll_interval # ms between checks for decoded images
+        self.wraps_per_poll = wraps_per_poll # Keeps each check short
+        self.look_ahead = look_ahead if look_ahead is not None else len(self.file_names)
+        self.max_images = max_images # None: every image is kept
+        self.images = OrderedDict() # file name -> PhotoImage (least recently used first)
+        self.decoded = {} # file name -> Future of the decoded PIL image (until it's wrapped)
+        self.load_order = [] # File names in the order they were queued for decoding
+        self.next_to_wrap = 0 # Index in load_order of the next image to wrap
+        self.position = 0 # Index in file_names of the next stimulus to be used
+        self.polling = False # Whether wrap_decoded() is scheduled
+        # The worker threads are only started once there is something to
+        # decode, and sit idle in between.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="StimulusPrefetch")
+        self.queue_window()
+        self.n_total = len(self.load_order) # (the stimuli loaded up front)
+        if self.look_ahead >= len(self.file_names):
+            # Everything is queued already. Shutting the executor down still
+            # lets every queued image be decoded, but means the worker
+            # threads exit on their own as soon as they're done.
+            self.executor.shutdown(wait=False)
+        self.wrap_decoded()
+
+    def decode(self, file_name):
+        return decode_stimulus(os_path.join(self.folder_path, file_name))
+
+    def start_decoding(self, file_name):
+        # Returns a Future of the decoded PIL image
+        return self.executor.submit(self.decode, file_name)
+
+    def make_image(self, decoded_image):
+        # Run on the Tk thread
+        return ImageTk.PhotoImage(decoded_image)
+
+    def window(self):
+        # The stimuli of the next look_ahead uses
+        return self.file_names[self.position:self.position + self.look_ahead]
+
+    def queue_window(self):
+        # Queues every stimulus in the window that isn't loaded (or being
+        # loaded) yet for decoding, in the order they'll be used
+        for file_name in self.window():
+            if file_name not in self.images and file_name not in self.decoded:
+                self.decoded[file_name] = self.start_decoding(file_name)
+                self.load_order.append(file_name)
+
+    def advance(self, position):
+        # Called as the session moves on: "position" is the index in
+        # file_names of the next stimulus to be used. The stimuli in the
+        # new window start loading, and those that have fallen out of it
+        # may be dropped.
+        self.position = position
+        self.queue_window()
+        self.drop_least_recently_used()
+        if not self.polling:
+            self.wrap_decoded()
+
+    def add_image(self, file_name, image):
+        self.images[file_name] = image
+        self.drop_least_recently_used()
+
+    def drop_least_recently_used(self):
+        if self.max_images is None or len(self.images) <= self.max_images:
+            return
+        window = set(self.window())
+        for file_name in list(self.images):
+            if len(self.images) <= self.max_images:
+                break
+            if file_name not in window:
+                del self.images[file_name]
+
+    def wrap(self, file_name):
+        # Turns a decoded image into a PhotoImage (on the Tk thread). If the
+        # image hasn't been decoded yet, this waits for the worker to finish
+        # it; any error raised while decoding is raised here. The PIL copy
+        # is no longer needed afterwards.
+        self.add_image(file_name, self.make_image(self.decoded.pop(file_name).result()))
+
+    def wrap_decoded(self):
+        # Called repeatedly via root.after() until every queued stimulus is
+        # ready. Only a handful of images are wrapped each time, so that the
+        # GUI stays responsive while the stimuli are loading. A stimulus that
+        # can't be loaded is reported and skipped (it is tried again, and
+        # its error raised, if it is ever asked for), and polling always
+        # goes on while there is anything left to wrap.
+        try:
+            n_wrapped = 0
+            while self.next_to_wrap < len(self.load_order) and n_wrapped < self.wraps_per_poll:
+                file_name = self.load_order[self.next_to_wrap]
+                if file_name in self.decoded: # (i.e., not already wrapped by get())
+                    if not self.decoded[file_name].done():
+                        break
+                    try:
+                        self.wrap(file_name)
+                    except Exception as error:
+                        console.warning(f"ERROR: could not load stimulus {os_path.join(self.folder_path, file_name)} ({error})")
+                    n_wrapped += 1
+                self.next_to_wrap += 1
+            finished = self.next_to_wrap == len(self.load_order)
+            if (n_wrapped > 0 or finished) and self.progress_callback is not None:
+                n_loaded = min(self.next_to_wrap, self.n_total)
+                self.progress_callback(n_loaded, self.n_total)
+                if n_loaded == self.n_total:
+                    self.progress_callback = None # Only the first load is reported
+        finally:
+            self.polling = self.next_to_wrap < len(self.load_order)
+            if self.polling:
+                self.root.after(self.poll_interval, self.wrap_decoded)
+
+    def get(self, file_name):
+        # Returns the PhotoImage for a stimulus, waiting for it if it still
+        # hasn't been loaded (this should only ever happen early on), or
+        # loading it right away if it was never queued (or was dropped).
+        if file_name in self.images:
+            self.images.move_to_end(file_name)
+        elif file_name in self.decoded:
+            self.wrap(file_name)
+        else:
+            self.add_image(file_name, self.make_image(self.decode(file_name)))
+        return self.images[file_name]
+
+    def wait_for(self, file_names):
+        # Makes sure each of the given stimuli is ready to be drawn.
+        for file_name in file_names:
+            self.get(file_name)
+
+    def close(self):
+        # At the end of the session: any stimuli still queued are never
+        # decoded, and the worker threads exit
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed store for the stimulus images shared by the P035 programs.
+
+Every task has its own stimulus folder(s) (P035b_Stimuli, P035d_stimuli,
+P035g_stimuli, etc.), but nearly all of their images are byte-identical
+copies of the images in "stimuli/", just under other names. Across all the
+folders there are over a thousand .bmp files but only 640 different images.
+
+Each folder's manifest (see p035.stimulus_manifest) already maps every file
+name in it to the SHA-256 hash of its contents. That is used in two ways:
+
+- At run time, StimulusCache reads and decodes identical files only once per
+  session, whichever folders and names they're used under.
+- On disk, this module keeps one copy of each image in a store folder (named
+  after its hash) and replaces every copy in the stimulus folders with a
+  hard link to it. The folders keep the same file names (so the programs
+  and their hard-coded paths are unchanged), but each image only takes up
+  space (and space in the SD card's page cache) once.
+
+Git doesn't keep hard links, so the store is built on each computer after
+the stimuli are checked out, from the P035 folder:
+
+    python -m p035.stimulus_store          # report how much would be saved
+    python -m p035.stimulus_store --link   # build the store and link to it
+
+The images in the store are made read-only, since editing one in place
+would change it in every folder that links to it.
+"""
+from argparse import ArgumentParser
+from hashlib import sha256
+from os import chmod, link, listdir, makedirs, replace, stat, unlink, path as os_path
+from shutil import copy2
+from stat import S_IRUSR, S_IRGRP, S_IROTH
+
+from p035.console import console
+from p035.stimulus_manifest import image_extensions, load_manifest
+from p035.tasks import programs_folder
+
+# Where the store is kept by default (ignored by git)
+default_store_folder = os_path.join(programs_folder, "stimulus_store")
+
+
+class StimulusStore(object):
+    # One image per content hash, as <store folder>/<hash><extension>
+    def __init__(self, store_folder = default_store_folder):
+        self.store_folder = store_folder
+
+    def object_path(self, content_hash, extension):
+        return os_path.join(self.store_folder, content_hash + extension.lower())
+
+    def folder_mapping(self, folder_path):
+        # The folder as a file name -> content hash mapping
+        manifest = load_manifest(folder_path)
+        return {file_name: entry["sha256"] for file_name, entry in manifest.entries.items()}
+
+    def add_folder(self, folder_path):
+        # Adds every image in a folder to the store (if it isn't there yet),
+        # and replaces each image in the folder with a hard link to its copy
+        # in the store. Returns the number of images in the folder, and how
+        # many bytes were freed.
+        makedirs(self.store_folder, exist_ok = True)
+        n_images = 0
+        bytes_freed = 0
+        for file_name, content_hash in self.folder_mapping(folder_path).items():
+            n_images += 1
+            file_path = os_path.join(folder_path, file_name)
+            # A file is only ever replaced by an object with exactly its
+            # contents, so the hash is taken from the file on disk (in case
+            # it changed since the manifest was loaded)
+            disk_hash = file_hash(file_path)
+            if disk_hash != content_hash:
+                console.warning(f"Note: {file_path} changed since its manifest was loaded")
+                content_hash = disk_hash
+            object_path = self.object_path(content_hash, os_path.splitext(file_name)[1])
+            if not os_path.exists(object_path):
+                add_object(file_path, object_path)
+            elif not os_path.samefile(file_path, object_path):
+                if file_hash(object_path) != content_hash:
+                    console.warning(f"Note: {object_path} doesn't match its hash, so {file_path} was left as it is")
+                    continue
+                bytes_freed += stat(file_path).st_size
+                # Linked under a temporary name first, so the stimulus is
+                # never missing from the folder
+                temporary_path = file_path + ".linking"
+                if os_path.exists(temporary_path):
+                    unlink(temporary_path)
+                link(object_path, temporary_path)
+                replace(temporary_path, file_path)
+        return n_images, bytes_freed
+
+
+def duplicate_bytes(folder_path, seen_files):
+    # How many bytes linking a folder to the store would free: the size of
+    # every image already seen (by content hash) in an earlier folder,
+    # unless it is already the same file (i.e., already linked).
+    # "seen_files" maps content hash -> (device, inode) of its first copy.
+    manifest = load_manifest(folder_path)
+    n_bytes = 0
+    for file_name, entry in manifest.entries.items():
+        file_stat = stat(os_path.join(manifest.folder_path, file_name))
+        file_id = (file_stat.st_dev, file_stat.st_ino)
+        if entry["sha256"] not in seen_files:
+            seen_files[entry["sha256"]] = file_id
+        elif seen_files[entry["sha256"]] != file_id:
+            n_bytes += entry["size"]
+    return len(manifest.entries), n_bytes
+
+
+def file_hash(file_path):
+    # SHA-256 of the file's contents, as it is on disk now
+    with open(file_path, "rb") as stimulus_file:
+        return sha256(stimulus_file.read()).hexdigest()
+
+
+def add_object(file_path, object_path):
+    # Hard links the file into the store (or copies it, if the store is on
+    # another file system), then makes the stored image read-only
+    try:
+        link(file_path, object_path)
+    except OSError:
+        copy2(file_path, object_path)
+    chmod(object_path, S_IRUSR | S_IRGRP | S_IROTH)
+
+
+def stimulus_folders(parent_folder = programs_folder):
+    # Every folder (directly) within the P035 folder that holds images,
+    # with "stimuli" first so that its names are the ones the store is
+    # built from
+    folders = []
+    for folder_name in sorted(listdir(parent_folder)):
+        folder_path = os_path.join(parent_folder, folder_name)
+        if (folder_name.startswith((".", "_"))
+            or not os_path.isdir(folder_path)
+            or os_path.abspath(folder_path) == os_path.abspath(default_store_folder)):
+            continue
+        if any(file_name.lower().endswith(image_extensions)
+               for file_name in listdir(folder_path)):
+            folders.append(folder_path)
+    folders.sort(key = lambda folder_path: os_path.basename(folder_path) != "stimuli")
+    return folders
+
+
+def main():
+    parser = ArgumentParser(description = "Share identical stimulus images across the P035 stimulus folders")
+    parser.add_argument("folders", nargs = "*",
+                        help = "stimulus folders (default: every one in the P035 folder)")
+    parser.add_argument("--store", default = default_store_folder,
+                        help = "where the store is kept")
+    parser.add_argument("--link", action = "store_true",
+                        help = "build the store and replace copies with hard links to it")
+    args = parser.parse_args()
+
+    store = StimulusStore(args.store)
+    seen_files = {} # (only for reports)
+    total_images = 0
+    total_bytes = 0
+    for folder_path in args.folders or stimulus_folders():
+        if args.link:
+            n_images, n_bytes = store.add_folder(folder_path)
+        else:
+            n_images, n_bytes = duplicate_bytes(folder_path, seen_files)
+        total_images += n_images
+        total_bytes += n_bytes
+        print(f"{os_path.basename(folder_path):<40} {n_images:>4} images {n_bytes/1e6:>6.1f} MB")
+    if args.link:
+        print(f"\n{total_images} images: {total_bytes/1e6:.1f} MB freed")
+    else:
+        print(f"\n{total_images} images: {total_bytes/1e6:.1f} MB would be freed (use --link)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+The P035 programs, by name.
+
+Each program is still its own file in the folder above this package (so that
+it can be run directly, as before), but they can also be started by name:
+
+    python -m p035          # lists the programs
+    python -m p035 P035g    # starts P035g_Wasserman_replication.py
+
+Only the program that is asked for is loaded. Loading a program runs nothing
+but its own file (and p035.engine, which it imports); the control panel isn't
+built until its main() is called.
+"""
+from importlib.util import spec_from_file_location, module_from_spec
+from os import path as os_path
+from re import sub
+
+# The folder the programs are in (i.e., the one above this package)
+programs_folder = os_path.dirname(os_path.dirname(os_path.abspath(__file__)))
+
+# Every program, by the name it is started with
+task_files = {"FOAM": "P035_FOAM_ExpProgram_RPi.py",
+              "FOAM-TESTING": "TESTING_P035_FOAM_ExpProgram_RPi.py",
+              "P035b": "P035b_miniproject.py",
+              "P035c": "P035c_choicetask.py",
+              "P035d": "P035d_association_task.py",
+              "P035e": "P035e_association2.py",
+              "P035e.ii": "P035e.ii_association3.py",
+              "P035e.iii": "P035e.iii_Darwin.py",
+              "P035f": "P035f_choicetask2.py",
+              "P035g": "P035g_Wasserman_replication.py"}
+
+# Programs that have been loaded so far (by file path)
+loaded_tasks = {}
+
+
+def task_file_path(task):
+    # "task" is either one of the names above or the path of a program file
+    if task in task_files:
+        return os_path.join(programs_folder, task_files[task])
+    if os_path.isfile(task):
+        return os_path.abspath(task)
+    raise ValueError(f"Unknown P035 program: {task} (the programs are: {', '.join(task_files)})")
+
+
+def load_task(task):
+    # Loads a program (only once) and returns it as a module
+    file_path = task_file_path(task)
+    if file_path not in loaded_tasks:
+        module_name = "p035_task_" + sub(r"\W", "_", os_path.basename(file_path)[:-3])
+        spec = spec_from_file_location(module_name, file_path)
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+        loaded_tasks[file_path] = module
+    return loaded_tasks[file_path]
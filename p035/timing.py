@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Monotonic, high-resolution session timing.
+
+The P035 programs used to time everything with datetime.now() and time(),
+both read whenever a handler happened to run. Those are wall-clock times (so
+an NTP adjustment of the Pi's clock mid-session shifts every time after it),
+and they include however long the Tk loop was busy before it got around to
+the peck. The SessionClock below uses time.perf_counter_ns() instead, and
+stamps each peck with the time it actually came in:
+
+- Every Tk event carries event.time, the (ms) time the X server received the
+  input. The clock learns the offset between that time and perf_counter_ns()
+  from the pecks themselves (the smallest offset seen belongs to the peck
+  that was handled the fastest), so the stamp of a peck that waited behind
+  other work in the Tk loop is moved back to when it actually arrived.
+- An event is only stamped once. Every row written for the same peck (e.g.,
+  a "key_press" row followed by a "correct_choice" row) gets the same time.
+
+All the stamps are integer nanoseconds. Intervals (e.g., TrialTime,
+ChoiceLatency, ChoiceDuration) are just the difference between two stamps.
+"""
+from datetime import timedelta
+from time import perf_counter_ns
+
+
+class SessionClock(object):
+    # One clock is built in each MainScreen, and start() is called when the
+    # session actually starts (i.e., at the same point start_time is set).
+    # "time_ns" is what the clock reads the time from; it is only ever
+    # changed for simulated sessions (see p035.simulation).
+    def __init__(self, max_input_lag = 1.0, time_ns = perf_counter_ns):
+        self.time_ns = time_ns
+        self.start_ns = time_ns()
+        # If an event seems to have come in more than max_input_lag (s)
+        # before it was handled, the offset is re-learned (this happens if
+        # the X server's ms counter wraps around, for example).
+        self.max_input_lag_ns = int(max_input_lag * 1e9)
+        self.event_time_offset = None # perf_counter_ns() - (event.time in ns)
+
+    def start(self):
+        self.start_ns = self.time_ns()
+
+    def now(self):
+        # For things the program does itself (e.g., the start of a trial)
+        return self.time_ns()
+
+    def stamp(self, event = None):
+        # Returns the time (in ns) an event came in. Events that
+        # aren't pecks (e.g., event is None) are simply stamped "now".
+        if event is None:
+            return self.time_ns()
+        try:
+            return event.perf_counter_ns # Already stamped
+        except AttributeError:
+            pass
+        handled_ns = self.time_ns()
+        event_time = getattr(event, "time", None)
+        if isinstance(event_time, int) and event_time > 0:
+            event_ns = event_time * 1000000
+            offset = handled_ns - event_ns
+            if (self.event_time_offset is None
+                or offset < self.event_time_offset
+                or offset - self.event_time_offset > self.max_input_lag_ns):
+                self.event_time_offset = offset
+            # Never stamp an event later than when it was handled
+            stamp_ns = min(event_ns + self.event_time_offset, handled_ns)
+        else: # e.g., keyboard shortcuts or generated events
+            stamp_ns = handled_ns
+        try:
+            event.perf_counter_ns = stamp_ns
+        except AttributeError:
+            pass
+        return stamp_ns
+
+    def session_time(self, stamp_ns):
+        # Time into the session as a timedelta, so that str() gives the same
+        # "H:MM:SS.ffffff" format as (datetime.now() - start_time) did
+        return timedelta(microseconds = (stamp_ns - self.start_ns) // 1000)
+
+    @staticmethod
+    def seconds_between(start_ns, end_ns):
+        return (end_ns - start_ns) / 1e9